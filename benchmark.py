@@ -0,0 +1,176 @@
+# benchmark.py
+# Reproducible performance benchmark of the simulator. Seeded synthetic
+# traces are generated for every (context length, sparsity) case, and the
+# wall time of trace loading, initialization and simulate() of every
+# placement and migration class is written to a JSON file together with the
+# peak RSS, so two commits can be compared with --compare.
+import copy
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from generate_trace import generate_trace, write_trace
+from placement import BaseStrategy
+from migration import BaseDataMigration
+from skip_trace import load_skip_trace
+from simulator import CLASS_MAPPING, build_config, load_skip_lists, simulate_combination
+
+try:
+    import resource
+except ImportError:     # not available on Windows
+    resource = None
+
+CONTEXTS = [2 * 1024, 8 * 1024, 32 * 1024]
+SPARSITIES = [0.0, 0.2, 0.4]
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, None where unsupported."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def strategy_classes():
+    """Every placement and migration class of CLASS_MAPPING, by name."""
+    plc = [name for name, cls in CLASS_MAPPING.items() if issubclass(cls, BaseStrategy)]
+    mig = [name for name, cls in CLASS_MAPPING.items() if issubclass(cls, BaseDataMigration)]
+    return plc, mig
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def benchmark_case(N_pre: int, sparsity: float, args, plc_names, mig_names, trace_dir: str) -> list:
+    """
+    Benchmark one (context, sparsity) case. Every placement runs with
+    NoMigration and every migration with PreferHBM, so each class is timed
+    once against the same baseline partner.
+    """
+    case = {'N_pre': N_pre, 'N': args.N, 'sparsity': sparsity, 'seed': args.seed}
+    filename = os.path.join(trace_dir, f"bench_{N_pre}_{args.N}_{sparsity}_{args.seed}.txt")
+    trace, gen_time = timed(generate_trace, args.N, N_pre, sparsity, seed=args.seed)
+    write_trace(trace, filename)
+    del trace
+
+    results = []
+    def record(phase, seconds, **extra):
+        results.append(dict(case, phase=phase, seconds=seconds, peak_rss_mb=peak_rss_mb(), **extra))
+        print(f"N_pre={N_pre} sparsity={sparsity} {phase}"
+              + "".join(f" {k}={v}" for k, v in extra.items()) + f": {seconds:.3f} s")
+
+    record('generate', gen_time)
+    _, load_time = timed(load_skip_trace, filename)
+    record('load_skip_trace', load_time)
+    trace, load_time = timed(load_skip_lists, filename)
+    record('load_skip_lists', load_time)
+
+    config = build_config({'N': args.N, 'N_pre': N_pre, 'para_num': args.para_num,
+                           'C_HBM_max': args.C_HBM_max})
+    init_class = CLASS_MAPPING[args.init_class]
+    initial_state, init_time = timed(init_class, copy.deepcopy(config), trace, False)
+    record('init', init_time, init=args.init_class)
+
+    combinations = [(name, 'NoMigration') for name in plc_names]
+    combinations += [('PreferHBM', name) for name in mig_names]
+    for p_name, m_name in dict.fromkeys(combinations):
+        best = []
+        for _ in range(args.repeat):
+            simulator, seconds = timed(simulate_combination, initial_state, trace,
+                                       CLASS_MAPPING[p_name], CLASS_MAPPING[m_name])
+            best.append(seconds)
+        steps = len(simulator.step_details)
+        record('simulate', min(best), placement=p_name, migration=m_name,
+               us_per_step=round(min(best) / max(steps, 1) * 1e6, 3))
+    os.remove(filename)
+    return results
+
+def result_key(row) -> tuple:
+    return (row['N_pre'], row['N'], row['sparsity'], row['phase'],
+            row.get('placement'), row.get('migration'))
+
+def compare(old_file: str, new_file: str, threshold: float) -> int:
+    """Print the slowdown of every benchmark of new_file over old_file, return the regressions."""
+    with open(old_file, "r") as f:
+        old = {result_key(row): row for row in json.load(f)['results']}
+    with open(new_file, "r") as f:
+        new = json.load(f)['results']
+
+    regressions = 0
+    for row in new:
+        before = old.get(result_key(row))
+        if before is None or before['seconds'] <= 0:
+            continue
+        ratio = row['seconds'] / before['seconds']
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        name = row['phase'] + (f" {row['placement']} + {row['migration']}" if row['phase'] == 'simulate' else "")
+        print(f"N_pre={row['N_pre']} sparsity={row['sparsity']} {name}: "
+              f"{before['seconds']:.3f} s -> {row['seconds']:.3f} s ({ratio:.2f}x){flag}")
+    print("-" * 50)
+    print(f"{regressions} regressions over {threshold*100:.0f}%")
+    return regressions
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--contexts', type=int, nargs='+', default=CONTEXTS, help='Prefill lengths N_pre')
+    parser.add_argument('--sparsities', type=float, nargs='+', default=SPARSITIES)
+    parser.add_argument('--N', type=int, default=32, help='Decode steps per case')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--para_num', type=float, default=0.5)
+    parser.add_argument('--C_HBM_max', type=int, default=3)
+    parser.add_argument('--init_class', type=str, default='TokenLevelBestRatioInit')
+    parser.add_argument('--plc_classes', type=str, nargs='*', default=None,
+                        help='Placement classes to time (all by default)')
+    parser.add_argument('--mig_classes', type=str, nargs='*', default=None,
+                        help='Migration classes to time (all by default)')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per simulation, the fastest is kept')
+    parser.add_argument('--output', type=str, default="benchmark_results.json")
+    parser.add_argument('--compare', type=str, nargs=2, metavar=('OLD', 'NEW'), default=None,
+                        help='Compare two result files instead of running')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Slowdown reported as a regression')
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(args.compare[0], args.compare[1], args.threshold) else 0)
+
+    plc_names, mig_names = strategy_classes()
+    if args.plc_classes is not None:
+        plc_names = args.plc_classes
+    if args.mig_classes is not None:
+        mig_names = args.mig_classes
+    for name in [args.init_class] + plc_names + mig_names:
+        if name not in CLASS_MAPPING:
+            print(f"Error: Unknown class name {name}")
+            sys.exit(1)
+
+    results = []
+    with tempfile.TemporaryDirectory() as trace_dir:
+        for N_pre in args.contexts:
+            for sparsity in args.sparsities:
+                results += benchmark_case(N_pre, sparsity, args, plc_names, mig_names, trace_dir)
+
+    with open(args.output, "w") as f:
+        json.dump({'commit': git_commit(),
+                   'date': datetime.now().isoformat(timespec='seconds'),
+                   'python': platform.python_version(),
+                   'platform': platform.platform(),
+                   'args': {k: v for k, v in vars(args).items() if k not in ('compare', 'output')},
+                   'results': results}, f, indent=1)
+    print(f"Wrote {len(results)} results to {args.output}")
@@ -0,0 +1,212 @@
+# compute_methods.py
+# Per-step choice of the attention computation method. Full attention reads
+# every KV cache the trace does not skip; sparser methods drop more tokens,
+# which shortens the step when the dropped KV caches sit on the slow tier,
+# at a quality cost (the fraction of the needed KV caches not read, times a
+# method weight). At every MHA step the simulator takes the fastest method
+# whose quality cost fits the remaining quality budget.
+import numpy as np
+from abc import ABC, abstractmethod
+from memory_status import ModelConfig, MemStatus
+from simulator import MemorySimulator
+
+class ComputeMethod(ABC):
+    def __init__(self, config: ModelConfig, quality_weight: float = 1.0):
+        self.cfg = config
+        self.quality_weight = quality_weight
+
+    @abstractmethod
+    def dropped_tokens(self, status: MemStatus, n: int, l: int, needed):
+        """Tokens of the needed set (index array) the method does not read at step n, layer l."""
+        pass
+
+    def quality_cost(self, dropped: int, needed: int) -> float:
+        return self.quality_weight * dropped / needed if needed > 0 else 0.0
+
+# Reads every KV cache the trace does not skip
+class FullAttention(ComputeMethod):
+    def dropped_tokens(self, status, n, l, needed):
+        return needed[:0]
+
+# Attention-sink tokens and a recent window only
+class WindowAttention(ComputeMethod):
+    def __init__(self, config, quality_weight=1.0):
+        super().__init__(config, quality_weight)
+        self.n_sink = config.n_sink
+        self.window = config.window
+
+    def dropped_tokens(self, status, n, l, needed):
+        return needed[(needed >= self.n_sink) & (needed < n - self.window)]
+
+# Skips the oldest part of the KV caches on the external memory
+class ExternalDropAttention(ComputeMethod):
+    def __init__(self, config, quality_weight=1.0):
+        super().__init__(config, quality_weight)
+        self.drop_ratio = 0.5      # fraction of the external KV caches not read
+
+    def dropped_tokens(self, status, n, l, needed):
+        external = needed[status.locations[needed, l] == 1]
+        return external[:int(len(external) * self.drop_ratio)]
+
+METHOD_MAPPING = {
+    'full': FullAttention,
+    'window': WindowAttention,
+    'external_drop': ExternalDropAttention,
+}
+
+# MemorySimulator choosing the compute method of every MHA step
+class MethodSelectingSimulator(MemorySimulator):
+    def __init__(self, config, status, placement, migration, best: bool = False,
+                 profile: bool = False, attribution: bool = False,
+                 methods: list = None, quality_budget: float = 0.0):
+        """
+        methods: ComputeMethod instances, full attention is always available.
+        quality_budget: largest mean quality cost per MHA step.
+        """
+        super().__init__(config, status, placement, migration, best, profile, attribution)
+        self.methods = [FullAttention(config)] + [m for m in (methods or []) if not isinstance(m, FullAttention)]
+        self.quality_budget = quality_budget
+        self.min_gain = 1e-9       # relative step time a sparser method must save
+        self.reset_methods()
+
+    def reset_methods(self):
+        self.quality_spent = 0.0
+        self.attention_steps = 0
+        self.full_time = 0.0       # time of the same steps with full attention
+        self.method_steps = {type(m).__name__: 0 for m in self.methods}
+
+    def needed_tokens(self, n: int, l: int, s: int):
+        """Tokens whose KV cache full attention reads at step (n, l, s)."""
+        needed = np.ones(n, dtype=bool)
+        skips = self.status.get_skip_token_array(n, l, s)
+        needed[skips[skips < n]] = False
+        return np.flatnonzero(needed)
+
+    def choose_method(self, n, l, s, alpha, beta, migration_data):
+        """
+        Return (alpha, method name, (D_R, D_W)) of the fastest method within
+        the budget; a sparser method must be faster by min_gain.
+        """
+        status = self.status
+        D_R, D_W = status.calculate_data_sizes(n, l, s)
+        full = self.step_time(n, l, s, alpha, beta, *migration_data, sizes=(D_R, D_W))
+        self.full_time += full
+        self.attention_steps += 1
+        best = (full, alpha, type(self.methods[0]).__name__, 0.0, (D_R, D_W))
+        if len(self.methods) == 1 or D_R <= 0:
+            return best[1], best[2], best[4]
+
+        kv_size = status.get_single_KV_cache_size()
+        needed = self.needed_tokens(n, l, s)
+        allowance = self.quality_budget * self.attention_steps - self.quality_spent
+        for method in self.methods[1:]:
+            dropped = method.dropped_tokens(status, n, l, needed)
+            if len(dropped) == 0:
+                continue
+            cost = method.quality_cost(len(dropped), len(needed))
+            if cost > allowance:
+                continue
+            # HBM reads shrink by the dropped KV caches that were read from HBM
+            dropped_hbm = int(np.count_nonzero(status.locations[dropped, l] == 0))
+            D_R_m = D_R - len(dropped) * kv_size
+            alpha_m = max(alpha * D_R - dropped_hbm * kv_size, 0.0) / D_R_m if D_R_m > 0 else 0.0
+            time_m = self.step_time(n, l, s, alpha_m, beta, *migration_data,
+                                    sizes=(D_R_m, D_W))
+            if time_m < best[0] * (1 - self.min_gain):
+                best = (time_m, alpha_m, type(method).__name__, cost, (D_R_m, D_W))
+        self.quality_spent += best[3]
+        return best[1], best[2], best[4]
+
+    def run_step(self, n: int, l: int, s: int):
+        if s != 0:
+            return super().run_step(n, l, s)
+        step_info = self.status.get_step_info(n, l, s)
+        if step_info["skip_layer"]:
+            return None
+        alpha = self.alpha_hook(n, l, s)
+        beta = self.beta_hook(n, l, s)
+        self.status.record_access(n, l, s)
+        migration_data = self.migration_hook(n, l, s)
+
+        alpha, method, sizes = self.choose_method(n, l, s, alpha, beta, migration_data)
+        # The chosen method is charged through the cost hook, profiled and attributed
+        step_time = self.cost_hook(n, l, s, alpha, beta, *migration_data, sizes)
+        self.method_steps[method] += 1
+        self.total_time += step_time
+        self.step_details.append({
+            'n': n,
+            'l': l,
+            's': s,
+            'time': step_time,
+            'alpha': alpha,
+            'beta': beta,
+            'method': method
+        })
+        return step_time
+
+    def simulate(self):
+        self.reset_methods()
+        return super().simulate()
+
+    def mean_quality_cost(self) -> float:
+        return self.quality_spent / self.attention_steps if self.attention_steps else 0.0
+
+def report_methods(simulator: MethodSelectingSimulator, full_total: float):
+    print(f"Quality budget: {simulator.quality_budget:.4f}, "
+          f"mean quality cost: {simulator.mean_quality_cost():.4f}")
+    saved = full_total - simulator.total_time
+    print(f"Total time: {simulator.total_time/1e9:.4f} seconds, "
+          f"{saved/1e9:.4f} seconds ({saved / full_total * 100 if full_total > 0 else 0.0:.2f}%) "
+          f"saved over full attention")
+    print("Method steps: " + ", ".join(f"{name} {count}" for name, count in simulator.method_steps.items()))
+    print("-" * 50)
+
+if __name__ == "__main__":
+    import argparse
+    import copy
+    import sys
+    from simulator import CLASS_MAPPING, build_config, load_skip_lists, simulate_combination
+    from skip_trace import load_skip_trace
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--N', type=int, default=1024*10)
+    parser.add_argument('--N_pre', type=int, default=1024*2)
+    parser.add_argument('--para_num', type=float, default=0.5)
+    parser.add_argument('--C_HBM_max', type=int, default=3)
+    parser.add_argument('--inclusive', action='store_true')
+    parser.add_argument('--filename', type=str, default="trace.txt")
+    parser.add_argument('--per_layer_trace', action='store_true')
+    parser.add_argument('--n_sink', type=int, default=4)
+    parser.add_argument('--window', type=int, default=1024)
+    parser.add_argument('--methods', type=str, nargs='+', choices=list(METHOD_MAPPING),
+                        default=['window', 'external_drop'])
+    parser.add_argument('--quality_budgets', type=float, nargs='+', default=[0.0, 0.01, 0.05, 0.1],
+                        help='Mean quality cost per MHA step allowed, one run per budget')
+    parser.add_argument('--init_class', type=str, required=True)
+    parser.add_argument('--mig_classes', type=str, nargs='+', required=True)
+    parser.add_argument('--plc_classes', type=str, nargs='+', required=True)
+    args = parser.parse_args()
+
+    try:
+        init_class = CLASS_MAPPING[args.init_class]
+        mig_classes = [CLASS_MAPPING[name] for name in args.mig_classes]
+        plc_classes = [CLASS_MAPPING[name] for name in args.plc_classes]
+    except KeyError as e:
+        print(f"Error: Unknown class name {e.args[0]}")
+        sys.exit(1)
+
+    config = build_config(vars(args))
+    trace = load_skip_trace(args.filename) if args.per_layer_trace else load_skip_lists(args.filename)
+    initial_state = init_class(copy.deepcopy(config), trace, args.inclusive)
+
+    for p_cls in plc_classes:
+        for m_cls in mig_classes:
+            full = simulate_combination(initial_state, trace, p_cls, m_cls)
+            print(f"Combination: {p_cls.__name__} + {m_cls.__name__}")
+            print(f"Full attention: {full.total_time/1e9:.4f} seconds")
+            for budget in args.quality_budgets:
+                methods = [METHOD_MAPPING[name](initial_state.cfg) for name in args.methods]
+                simulator = simulate_combination(initial_state, trace, p_cls, m_cls,
+                                                 simulator_cls=MethodSelectingSimulator,
+                                                 methods=methods, quality_budget=budget)
+                report_methods(simulator, full.total_time)
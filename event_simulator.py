@@ -0,0 +1,233 @@
+# event_simulator.py
+# Discrete-event alternative to MemorySimulator. HBM, the external memory
+# interface (read and write) and the external memory internal bandwidth are
+# separate channels; reads, writes and migrations are timed transfers that
+# queue on them. Compute is a roofline term per step, and the reads of the
+# next steps can be prefetched while the current step computes, so transfers
+# overlap across layer boundaries instead of being strictly serialized.
+import copy
+import heapq
+from memory_status import ModelConfig, MemStatus
+from placement import BaseStrategy
+from migration import BaseDataMigration
+from simulator import MemorySimulator, CLASS_MAPPING, build_config, load_skip_lists, simulate_combination
+
+class Channel():
+    def __init__(self, name: str, bandwidth: float):
+        self.name = name
+        self.bandwidth = bandwidth    # B/ns
+        self.free_at = 0.0
+        self.busy_time = 0.0
+        self.bytes = 0.0
+
+    def transfer(self, size: float, now: float) -> float:
+        """Queue a transfer arriving at now (FIFO), return its finish time."""
+        if size <= 0 or self.bandwidth <= 0:
+            return now
+        start = max(now, self.free_at)
+        duration = size / self.bandwidth
+        self.free_at = start + duration
+        self.busy_time += duration
+        self.bytes += size
+        return self.free_at
+
+class EventDrivenSimulator(MemorySimulator):
+    def __init__(self, config: ModelConfig, status: MemStatus,
+                placement: BaseStrategy, migration: BaseDataMigration, best: bool = False,
+                prefetch_depth: int = 1):
+        super().__init__(config, status, placement, migration, best)
+        # Number of steps whose reads may be in flight ahead of compute,
+        # 0 serializes every step.
+        self.prefetch_depth = prefetch_depth
+        self.channels = {}
+        self.compute_busy = 0.0
+
+    def reset_channels(self):
+        self.channels = {
+            'hbm': Channel('hbm', self.cfg.B_HBM),
+            'ext_read': Channel('ext_read', self.cfg.B_ext_interface_R),
+            'ext_write': Channel('ext_write', self.cfg.B_ext_interface_W),
+            'ext_internal': Channel('ext_internal', self.cfg.B_ext_internal),
+        }
+        self.compute_busy = 0.0
+
+    def compute_time(self, D_R: float) -> float:
+        """
+        Roofline compute term. Decode reads every weight and KV element once
+        and performs one multiply-add on it, i.e. 2 FLOPs per element read.
+        """
+        if self.cfg.F_peak <= 0:
+            return 0.0
+        return 2 * D_R / self.cfg.dtype_size / self.cfg.F_peak
+
+    def step_list(self):
+        steps = []
+        for n in range(self.cfg.N_pre, self.cfg.N_pre + self.cfg.N):
+            for l in range(self.cfg.L):
+                for s in [0, 1]:  # MHA and MLP
+                    step_info = self.status.get_step_info(n, l, s)
+                    if step_info["skip_layer"]:
+                        continue
+                    steps.append((n, l, s))
+        return steps
+
+    def issue_step(self, i: int, now: float):
+        """Run the strategies of step i and queue its reads and migrations."""
+        n, l, s = self.steps[i]
+        alpha = self.plc.alpha_strategy(n, l, s)
+        beta = self.plc.beta_strategy(n, l, s)
+        self.status.record_access(n, l, s)
+        hbm_MR, hbm_MW, ext_MR, ext_MW = self.mig.migration_strategy(n, l, s)
+        D_R, D_W = self.status.calculate_data_sizes(n, l, s)
+        if self.best:
+            alpha = min(self.cfg.C_HBM_max / D_R, self.cfg.best_alpha)
+        beta_ext = 1.0 if self.status.inclusive else 1 - beta
+        ch = self.channels
+        compute = self.compute_time(D_R)
+
+        # KV caches on the external memory may be stored at a smaller dtype
+        kv_scale = self.status.get_ext_KV_scale()
+        ext_weights, ext_kv = self.status.split_external_read(n, l, s, alpha, D_R)
+        ext_bytes = ext_weights + ext_kv * kv_scale
+        if kv_scale != 1.0 and self.cfg.B_dequant > 0:
+            compute += (ext_kv + beta_ext * D_W) / self.cfg.B_dequant
+        ext_MR, ext_MW = ext_MR * kv_scale, ext_MW * kv_scale
+
+        # Migrations run in the background and only compete for bandwidth
+        ch['hbm'].transfer(hbm_MR + hbm_MW, now)
+        ch['ext_read'].transfer(ext_MR, now)
+        ch['ext_write'].transfer(ext_MW, now)
+        ch['ext_internal'].transfer(ext_MR + ext_MW, now)
+
+        # Reads gate the compute of this step
+        hbm_done = ch['hbm'].transfer(alpha * D_R, now)
+        ext_done = max(ch['ext_read'].transfer(ext_bytes, now),
+                       ch['ext_internal'].transfer(ext_bytes, now))
+        self.pending[i] = {
+            'alpha': alpha,
+            'beta': beta,
+            'hbm_write': beta * D_W,
+            'ext_write': beta_ext * D_W * kv_scale,
+            'compute': compute,
+        }
+        return max(hbm_done, ext_done)
+
+    def simulate(self):
+        """Run the discrete-event simulation, returns end-to-end latency in ns."""
+        self.total_time = 0.0
+        self.step_details = []
+        self.reset_channels()
+        self.steps = self.step_list()
+        self.pending = {}
+        if not self.steps:
+            return self.total_time
+
+        events = []     # (time, seq, kind, step)
+        seq = 0
+        reads_done = set()
+        compute_end = -1.0      # finish time of the last computed step
+        next_compute = 0        # next step to compute (in order)
+        next_issue = 0
+        last_end = 0.0
+
+        def push(time, kind, i):
+            nonlocal seq
+            heapq.heappush(events, (time, seq, kind, i))
+            seq += 1
+
+        for _ in range(min(self.prefetch_depth + 1, len(self.steps))):
+            push(0.0, 'issue', next_issue)
+            next_issue += 1
+
+        while events:
+            now, _, kind, i = heapq.heappop(events)
+            if kind == 'issue':
+                push(self.issue_step(i, now), 'reads_done', i)
+            elif kind == 'reads_done':
+                reads_done.add(i)
+            elif kind == 'compute_done':
+                info = self.pending.pop(i)
+                n, l, s = self.steps[i]
+                # Writes of the new KV cache drain asynchronously
+                self.channels['hbm'].transfer(info['hbm_write'], now)
+                self.channels['ext_write'].transfer(info['ext_write'], now)
+                self.channels['ext_internal'].transfer(info['ext_write'], now)
+                self.step_details.append({
+                    'n': n,
+                    'l': l,
+                    's': s,
+                    'time': now - last_end,
+                    'alpha': info['alpha'],
+                    'beta': info['beta']
+                })
+                last_end = now
+                if next_issue < len(self.steps):
+                    push(now, 'issue', next_issue)
+                    next_issue += 1
+
+            # Start the next compute once its reads and the previous compute are done
+            if next_compute in reads_done and compute_end <= now:
+                info = self.pending[next_compute]
+                compute_end = now + info['compute']
+                self.compute_busy += info['compute']
+                reads_done.discard(next_compute)
+                push(compute_end, 'compute_done', next_compute)
+                next_compute += 1
+
+        self.total_time = max([last_end] + [c.free_at for c in self.channels.values()])
+        return self.total_time
+
+    def utilization(self) -> dict:
+        """Busy fraction of every channel and of compute over the run."""
+        if self.total_time <= 0:
+            return {}
+        util = {name: c.busy_time / self.total_time for name, c in self.channels.items()}
+        util['compute'] = self.compute_busy / self.total_time
+        return util
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--N', type=int, default=1024*10)
+    parser.add_argument('--N_pre', type=int, default=1024*2)
+    parser.add_argument('--para_num', type=float, default=0.5)
+    parser.add_argument('--C_HBM_max', type=int, default=3)
+    parser.add_argument('--inclusive', action='store_true')
+    parser.add_argument('--filename', type=str, default="trace.txt")
+    parser.add_argument('--prefetch_depth', type=int, default=1)
+    parser.add_argument('--init_class', type=str, required=True)
+    parser.add_argument('--mig_classes', type=str, nargs='+', required=True)
+    parser.add_argument('--plc_classes', type=str, nargs='+', required=True)
+    args = parser.parse_args()
+
+    try:
+        init_class = CLASS_MAPPING[args.init_class]
+        mig_classes = [CLASS_MAPPING[name] for name in args.mig_classes]
+        plc_classes = [CLASS_MAPPING[name] for name in args.plc_classes]
+    except KeyError as e:
+        print(f"Error: Unknown class name {e.args[0]}")
+        sys.exit(1)
+
+    config = build_config(vars(args))
+    trace = load_skip_lists(args.filename)
+    initial_state = init_class(copy.deepcopy(config), trace, args.inclusive)
+
+    # Run both engines so the strategy rankings can be compared
+    results = []
+    for p_cls in plc_classes:
+        for m_cls in mig_classes:
+            serial = simulate_combination(initial_state, trace, p_cls, m_cls)
+            event = simulate_combination(initial_state, trace, p_cls, m_cls,
+                                         simulator_cls=EventDrivenSimulator,
+                                         prefetch_depth=args.prefetch_depth)
+            results.append((f"{p_cls.__name__} + {m_cls.__name__}", serial.total_time, event))
+
+    serial_rank = {name: r for r, (name, _, _) in enumerate(sorted(results, key=lambda x: x[1]), 1)}
+    for rank, (name, serial_time, event) in enumerate(sorted(results, key=lambda x: x[2].total_time), 1):
+        print(f"Combination: {name}")
+        print(f"Serialized time: {serial_time/1e9:.4f} seconds (rank {serial_rank[name]})")
+        print(f"Event-driven latency: {event.total_time/1e9:.4f} seconds (rank {rank})")
+        print("Utilization: " + ", ".join(f"{k} {v*100:.1f}%" for k, v in event.utilization().items()))
+        print("-" * 50)
@@ -9,7 +9,7 @@ sparsity = 0.2    # Target sparsity ratio
 diff_ratio = 0.03 # Maximum difference ratio between consecutive skip sets
 threshold_factor = 0.1  # Additional factor for threshold (e.g., threshold = sparsity + threshold_factor)
 
-def generate_initial_skipped_tokens(n, sparsity, threshold_factor):
+def generate_initial_skipped_tokens(n, sparsity, threshold_factor, rng=random):
     """Generate initial skipped tokens for token n, biased towards older tokens."""
     if n <= 1:
         return []
@@ -22,9 +22,9 @@ def generate_initial_skipped_tokens(n, sparsity, threshold_factor):
     available = list(range(max_skip_index + 1))
     if len(available) < k:
         return sorted(available)  # Return all available if k exceeds range
-    return sorted(random.sample(available, k))
+    return sorted(rng.sample(available, k))
 
-def generate_similar_skipped_tokens(S_prev, n, sparsity, diff_ratio, threshold_factor):
+def generate_similar_skipped_tokens(S_prev, n, sparsity, diff_ratio, threshold_factor, rng=random):
     """Generate skipped tokens for token n based on S_prev, favoring older tokens."""
     if n <= 1:
         return []
@@ -44,7 +44,7 @@ def generate_similar_skipped_tokens(S_prev, n, sparsity, diff_ratio, threshold_f
         # Add delta tokens from the threshold-limited range
         add_count = min(delta, len(available_to_add))
         if add_count > 0:
-            to_add = random.sample(available_to_add, add_count)
+            to_add = rng.sample(available_to_add, add_count)
             S_n.extend(to_add)
     elif delta < 0:
         # Remove -delta tokens, preferring more recent ones in S_n
@@ -52,7 +52,7 @@ def generate_similar_skipped_tokens(S_prev, n, sparsity, diff_ratio, threshold_f
         if remove_count > 0:
             # Sort S_n descending to prioritize removing recent tokens
             S_n_sorted = sorted(S_n, reverse=True)
-            to_remove = S_n_sorted[:remove_count]
+            to_remove = set(S_n_sorted[:remove_count])
             S_n = [t for t in S_n if t not in to_remove]
     
     # Introduce controlled variation by swapping tokens
@@ -61,31 +61,55 @@ def generate_similar_skipped_tokens(S_prev, n, sparsity, diff_ratio, threshold_f
     available_to_add = list(set(range(max_skip_index + 1)) - set(S_n))
     swap_count = min(swap_count, len(available_to_remove), len(available_to_add))
     if swap_count > 0:
-        to_remove = available_to_remove[:swap_count]
-        to_add = random.sample(available_to_add, swap_count)
+        to_remove = set(available_to_remove[:swap_count])
+        to_add = rng.sample(available_to_add, swap_count)
         S_n = [t for t in S_n if t not in to_remove]
         S_n.extend(to_add)
     
     return sorted(S_n)
 
-# Generate trace file
-with open("trace.txt", "w") as f:
+def generate_trace(N=N, N_pre=N_pre, sparsity=sparsity, diff_ratio=diff_ratio,
+                   threshold_factor=threshold_factor, seed=None):
+    """
+    Generate skip lists for tokens N_pre .. N_pre + N - 1.
+    Returns {n: skip_token_kv}, the same format load_skip_lists produces.
+    A seed makes the trace reproducible without touching the global random state.
+    """
+    rng = random.Random(seed)
+    trace = {}
     # Initialize S_prev for n = N_pre
-    S_prev = generate_initial_skipped_tokens(N_pre, sparsity, threshold_factor)
-    skipped_str = f"[{','.join(map(str, S_prev))}]" if S_prev else "[]"
-    for l in range(L):
-        for s in [0, 1]:
-            skip_kv = skipped_str if s == 0 else "[]"
-            f.write(f"{N_pre},{l},{s},{skip_kv},False\n")
+    S_prev = generate_initial_skipped_tokens(N_pre, sparsity, threshold_factor, rng)
+    trace[N_pre] = S_prev
     
     # Generate subsequent tokens
     for n in range(N_pre + 1, N_pre + N):
-        S_n = generate_similar_skipped_tokens(S_prev, n, sparsity, diff_ratio, threshold_factor)
-        skipped_str = f"[{','.join(map(str, S_n))}]" if S_n else "[]"
-        for l in range(L):
-            for s in [0, 1]:
-                skip_kv = skipped_str if s == 0 else "[]"
-                f.write(f"{n},{l},{s},{skip_kv},False\n")
+        S_n = generate_similar_skipped_tokens(S_prev, n, sparsity, diff_ratio, threshold_factor, rng)
+        trace[n] = S_n
         S_prev = S_n  # Update S_prev for the next iteration
+    return trace
 
-print("Trace file 'trace.txt' generated successfully.")
\ No newline at end of file
+def write_trace(trace, filename="trace.txt", L=L):
+    """Write skip lists in the simulator's trace format (n,l,s,[skip_token_kv],skip_layer)."""
+    with open(filename, "w") as f:
+        for n in sorted(trace):
+            S_n = trace[n]
+            skipped_str = f"[{','.join(map(str, S_n))}]" if S_n else "[]"
+            for l in range(L):
+                for s in [0, 1]:
+                    skip_kv = skipped_str if s == 0 else "[]"
+                    f.write(f"{n},{l},{s},{skip_kv},False\n")
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--N', type=int, default=N)
+    parser.add_argument('--N_pre', type=int, default=N_pre)
+    parser.add_argument('--sparsity', type=float, default=sparsity)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--filename', type=str, default="trace.txt")
+    args = parser.parse_args()
+
+    # Generate trace file
+    trace = generate_trace(args.N, args.N_pre, args.sparsity, seed=args.seed)
+    write_trace(trace, args.filename)
+    print(f"Trace file '{args.filename}' generated successfully.")
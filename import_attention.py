@@ -0,0 +1,192 @@
+# import_attention.py
+# Convert recorded attention scores into a skip trace. A dump holds, for
+# every decode step n, the scores of the query token n over its keys
+# 0..n-1 at every layer, either as one .npy per layer and step
+# (step_{n}_layer_{l}.npy) or one .npz per step with a layer_{l} array.
+# Arrays are (n,) or (heads, n). A sparsification policy decides which keys
+# every head skips, and the trace is written step by step, so the dump is
+# never loaded as a whole.
+import math
+import os
+import re
+from abc import ABC, abstractmethod
+import numpy as np
+
+DUMP_PATTERN = re.compile(r"^step_(\d+)(?:_layer_(\d+))?\.(npy|npz)$")
+
+class SparsifyPolicy(ABC):
+    def __init__(self, logits: bool = False):
+        # Scores are softmax probabilities, or raw logits when logits is True
+        self.logits = logits
+
+    def probabilities(self, scores):
+        scores = np.asarray(scores, dtype=np.float64)
+        if not self.logits:
+            return scores
+        scores = np.exp(scores - scores.max(axis=-1, keepdims=True))
+        return scores / scores.sum(axis=-1, keepdims=True)
+
+    def skip_tokens(self, n: int, l: int, scores):
+        """Skipped keys of every head, scores is (heads, n). Returns a list of arrays."""
+        probs = self.probabilities(scores)
+        return [np.flatnonzero(~self.keep_mask(n, l, h, probs[h])) for h in range(len(probs))]
+
+    @abstractmethod
+    def keep_mask(self, n: int, l: int, h: int, probs):
+        """Bool mask of the keys head h of layer l reads at step n."""
+        pass
+
+# Keep the k highest-scoring keys (or a ratio of the keys)
+class TopKPolicy(SparsifyPolicy):
+    def __init__(self, k: int = None, ratio: float = None, logits: bool = False):
+        super().__init__(logits)
+        if (k is None) == (ratio is None):
+            raise ValueError("Set exactly one of k and ratio!")
+        self.k = k
+        self.ratio = ratio
+
+    def keep_mask(self, n, l, h, probs):
+        k = self.k if self.k is not None else math.ceil(self.ratio * len(probs))
+        keep = np.zeros(len(probs), dtype=bool)
+        if k >= len(probs):
+            keep[:] = True
+        elif k > 0:
+            keep[np.argpartition(probs, len(probs) - k)[-k:]] = True
+        return keep
+
+# Keep the smallest set of keys holding at least `mass` of the attention
+class CumulativeMassPolicy(SparsifyPolicy):
+    def __init__(self, mass: float = 0.95, logits: bool = False):
+        super().__init__(logits)
+        self.mass = mass
+
+    def keep_mask(self, n, l, h, probs):
+        order = np.argsort(probs)[::-1]
+        cumulative = np.cumsum(probs[order])
+        count = int(np.searchsorted(cumulative, self.mass * cumulative[-1])) + 1 if len(probs) else 0
+        keep = np.zeros(len(probs), dtype=bool)
+        keep[order[:count]] = True
+        return keep
+
+# H2O-style cache: attention-sink tokens, a recent window and heavy hitters
+# by accumulated attention. Evicted keys never come back.
+class H2OPolicy(SparsifyPolicy):
+    def __init__(self, sink: int = 4, window: int = 64, heavy: int = 128, logits: bool = False):
+        super().__init__(logits)
+        self.sink = sink
+        self.window = window
+        self.heavy = heavy
+        self.accumulated = {}     # (l, h) -> accumulated attention of every key
+        self.evicted = {}         # (l, h) -> bool mask of evicted keys
+
+    def keep_mask(self, n, l, h, probs):
+        size = len(probs)
+        acc = self.accumulated.get((l, h), np.zeros(0))
+        evicted = self.evicted.get((l, h), np.zeros(0, dtype=bool))
+        if len(acc) < size:
+            acc = np.concatenate([acc, np.zeros(size - len(acc))])
+            evicted = np.concatenate([evicted, np.zeros(size - len(evicted), dtype=bool)])
+        acc[:size] += probs
+
+        keep = np.zeros(size, dtype=bool)
+        keep[:self.sink] = True
+        keep[max(0, size - self.window):] = True
+        candidates = np.flatnonzero(~keep & ~evicted[:size])
+        if len(candidates) <= self.heavy:
+            keep[candidates] = True
+        elif self.heavy > 0:
+            top = np.argpartition(acc[candidates], len(candidates) - self.heavy)[-self.heavy:]
+            keep[candidates[top]] = True
+        evicted[:size] |= ~keep
+        self.accumulated[(l, h)] = acc
+        self.evicted[(l, h)] = evicted
+        return keep
+
+POLICY_MAPPING = {
+    'topk': TopKPolicy,
+    'mass': CumulativeMassPolicy,
+    'h2o': H2OPolicy,
+}
+
+def scan_dump(dump_dir: str) -> dict:
+    """Map every step n to its dump files {layer or None: path}, without loading them."""
+    steps = {}
+    for name in os.listdir(dump_dir):
+        m = DUMP_PATTERN.match(name)
+        if not m:
+            continue
+        n, l, ext = m.groups()
+        if (ext == "npz") != (l is None):
+            raise ValueError(f"Unexpected dump file name: {name}")
+        steps.setdefault(int(n), {})[None if l is None else int(l)] = os.path.join(dump_dir, name)
+    return steps
+
+def iter_layer_scores(files: dict):
+    """Yield (l, scores) of one step, scores as (heads, n), one layer at a time."""
+    if None in files:
+        with np.load(files[None]) as npz:
+            layers = sorted(int(k.split("_")[1]) for k in npz.files if k.startswith("layer_"))
+            for l in layers:
+                yield l, np.atleast_2d(npz[f"layer_{l}"])
+    else:
+        for l in sorted(files):
+            yield l, np.atleast_2d(np.load(files[l], mmap_mode="r"))
+
+def import_attention(dump_dir: str, policy: SparsifyPolicy, filename="trace.txt",
+                     per_head: bool = False, step_offset: int = 0) -> int:
+    """
+    Write the skip trace of a dump. Without per_head a key is skipped only if
+    every head skips it, the format load_skip_lists reads; per_head writes
+    n,l,s,h,[skip_token_kv],skip_layer lines for load_skip_trace.
+    step_offset shifts step and key ids alike, for dumps that start after
+    step_offset tokens the trace does not skip.
+    Returns the number of steps written.
+    """
+    steps = scan_dump(dump_dir)
+    with open(filename, "w") as f:
+        for n in sorted(steps):
+            step = n + step_offset
+            lines = []
+            for l, scores in iter_layer_scores(steps[n]):
+                # The query of step n attends to keys 0..n-1 at most
+                scores = scores[:, :n]
+                head_skips = [skips + step_offset for skips in policy.skip_tokens(n, l, scores)]
+                if per_head:
+                    for h, skips in enumerate(head_skips):
+                        lines.append(f"{step},{l},0,{h},[{','.join(map(str, skips))}],False\n")
+                else:
+                    skips = head_skips[0]
+                    for other in head_skips[1:]:
+                        skips = np.intersect1d(skips, other, assume_unique=True)
+                    lines.append(f"{step},{l},0,[{','.join(map(str, skips))}],False\n")
+                lines.append(f"{step},{l},1,[],False\n")
+            f.writelines(lines)
+    return len(steps)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dump_dir', type=str, required=True)
+    parser.add_argument('--policy', type=str, choices=list(POLICY_MAPPING), default='topk')
+    parser.add_argument('--k', type=int, default=None, help='topk: keys kept per head')
+    parser.add_argument('--ratio', type=float, default=0.5,
+                        help='topk: fraction of keys kept per head, unless --k is set')
+    parser.add_argument('--mass', type=float, default=0.95, help='mass: attention mass kept per head')
+    parser.add_argument('--sink', type=int, default=4, help='h2o: attention-sink tokens')
+    parser.add_argument('--window', type=int, default=64, help='h2o: recent tokens')
+    parser.add_argument('--heavy', type=int, default=128, help='h2o: heavy-hitter tokens')
+    parser.add_argument('--logits', action='store_true', help='Scores are logits, not probabilities')
+    parser.add_argument('--per_head', action='store_true')
+    parser.add_argument('--step_offset', type=int, default=0)
+    parser.add_argument('--filename', type=str, default="trace.txt")
+    args = parser.parse_args()
+
+    if args.policy == 'topk':
+        policy = TopKPolicy(args.k, args.ratio if args.k is None else None, args.logits)
+    elif args.policy == 'mass':
+        policy = CumulativeMassPolicy(args.mass, args.logits)
+    else:
+        policy = H2OPolicy(args.sink, args.window, args.heavy, args.logits)
+    count = import_attention(args.dump_dir, policy, args.filename, args.per_head, args.step_offset)
+    print(f"Wrote {count} steps to {args.filename}")
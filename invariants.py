@@ -0,0 +1,150 @@
+# invariants.py
+# Sampled consistency checks of the HBM accounting. Strategies keep
+# cfg.C_HBM, hbm_token_counts and the location matrix in sync by hand; the
+# checker recomputes the HBM bytes from the locations and the model weights
+# every K decoded tokens and compares. On a mismatch the tokens since the
+# last passing check are replayed from a snapshot, checking after every
+# strategy call, to find the first call that broke the accounting.
+import copy
+import numpy as np
+from memory_status import MemStatus
+
+def capacity_errors(status: MemStatus, rtol: float = 1e-9) -> list:
+    """Messages of every broken HBM invariant of status, empty if consistent."""
+    errors = []
+    cfg = status.cfg
+    tolerance = rtol * max(cfg.C_HBM_max, 1.0)
+    on_hbm = status.locations == 0
+    counts = np.count_nonzero(on_hbm, axis=0)
+    expected = status.hbm_weight_bytes + int(counts.sum()) * status.get_single_KV_cache_size()
+    if abs(cfg.C_HBM - expected) > tolerance:
+        errors.append(f"C_HBM is {cfg.C_HBM:.1f} B, weights and HBM locations hold {expected:.1f} B")
+    if cfg.C_HBM > cfg.C_HBM_max + tolerance:
+        errors.append(f"C_HBM {cfg.C_HBM:.1f} B exceeds C_HBM_max {cfg.C_HBM_max:.1f} B")
+    wrong = [l for l in range(cfg.L) if status.hbm_token_counts[l] != counts[l]]
+    if wrong:
+        l = wrong[0]
+        errors.append(f"hbm_token_counts differs from the locations at {len(wrong)} layers, "
+                      f"first layer {l}: {status.hbm_token_counts[l]} vs {counts[l]}")
+    return errors
+
+class CapacityChecker():
+    def __init__(self, every: int = 64, rtol: float = 1e-9, strict: bool = False):
+        """
+        every: decoded tokens between two checks.
+        strict: raise ValueError on a violation instead of recording it.
+        """
+        self.every = every
+        self.rtol = rtol
+        self.strict = strict
+        self.checks = 0
+        self.violation = None
+        self._snapshot = None
+
+    def attach(self, simulator):
+        """Check the initial state and observe simulator from now on."""
+        self._take_snapshot(simulator, simulator.cfg.N_pre)
+        errors = capacity_errors(simulator.status, self.rtol)
+        if errors:
+            self._report({'n': None, 'l': None, 's': None, 'hook': 'init',
+                          'cls': type(simulator.status).__name__, 'errors': errors})
+        else:
+            simulator.observers.append(self)
+        return self
+
+    def _take_snapshot(self, simulator, next_n: int):
+        # Strategies and status are copied together so they keep sharing state
+        trace = simulator.status.trace
+        state = (simulator.status, simulator.plc, simulator.mig)
+        self._snapshot = (next_n, copy.deepcopy(state, {id(trace): trace}))
+
+    def after_token(self, simulator, n: int):
+        last = n == simulator.cfg.N_pre + simulator.cfg.N - 1
+        if (n - simulator.cfg.N_pre + 1) % self.every != 0 and not last:
+            return
+        self.checks += 1
+        if not capacity_errors(simulator.status, self.rtol):
+            self._take_snapshot(simulator, n + 1)
+            return
+        simulator.observers.remove(self)
+        self._report(self.locate(simulator, n))
+
+    def locate(self, simulator, end_n: int) -> dict:
+        """Replay the snapshot up to token end_n and return the first offending strategy call."""
+        start_n, state = self._snapshot
+        trace = state[0].trace
+        status, plc, mig = copy.deepcopy(state, {id(trace): trace})
+        hooks = [('alpha', plc, plc.alpha_strategy),
+                 ('beta', plc, plc.beta_strategy),
+                 ('migration', mig, mig.migration_strategy)]
+        for n in range(start_n, end_n + 1):
+            for l in range(status.cfg.L):
+                for s in [0, 1]:
+                    if status.get_step_info(n, l, s)["skip_layer"]:
+                        continue
+                    for hook, owner, call in hooks:
+                        if hook == 'migration':
+                            status.record_access(n, l, s)
+                        call(n, l, s)
+                        errors = capacity_errors(status, self.rtol)
+                        if errors:
+                            return {'n': n, 'l': l, 's': s, 'hook': hook,
+                                    'cls': type(owner).__name__, 'errors': errors}
+        return {'n': end_n, 'l': None, 's': None, 'hook': 'unknown', 'cls': None,
+                'errors': capacity_errors(simulator.status, self.rtol)}
+
+    def _report(self, violation: dict):
+        self.violation = violation
+        message = (f"HBM accounting broken by {violation['cls']}.{violation['hook']} at "
+                   f"(n, l, s) = ({violation['n']}, {violation['l']}, {violation['s']}): "
+                   + "; ".join(violation['errors']))
+        if self.strict:
+            raise ValueError(message)
+        print(message)
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    from simulator import CLASS_MAPPING, MemorySimulator, build_config, load_skip_lists
+    from skip_trace import load_skip_trace
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--N', type=int, default=1024*10)
+    parser.add_argument('--N_pre', type=int, default=1024*2)
+    parser.add_argument('--para_num', type=float, default=0.5)
+    parser.add_argument('--C_HBM_max', type=int, default=3)
+    parser.add_argument('--inclusive', action='store_true')
+    parser.add_argument('--filename', type=str, default="trace.txt")
+    parser.add_argument('--per_layer_trace', action='store_true')
+    parser.add_argument('--every', type=int, default=64, help='Decoded tokens between two checks')
+    parser.add_argument('--init_class', type=str, required=True)
+    parser.add_argument('--mig_classes', type=str, nargs='+', required=True)
+    parser.add_argument('--plc_classes', type=str, nargs='+', required=True)
+    args = parser.parse_args()
+
+    try:
+        init_class = CLASS_MAPPING[args.init_class]
+        mig_classes = [CLASS_MAPPING[name] for name in args.mig_classes]
+        plc_classes = [CLASS_MAPPING[name] for name in args.plc_classes]
+    except KeyError as e:
+        print(f"Error: Unknown class name {e.args[0]}")
+        sys.exit(1)
+
+    config = build_config(vars(args))
+    trace = load_skip_trace(args.filename) if args.per_layer_trace else load_skip_lists(args.filename)
+    initial_state = init_class(copy.deepcopy(config), trace, args.inclusive)
+
+    failures = 0
+    for p_cls in plc_classes:
+        for m_cls in mig_classes:
+            status = copy.deepcopy(initial_state, {id(trace): trace})
+            simulator = MemorySimulator(status.cfg, status, p_cls(status.cfg, status), m_cls(status.cfg, status))
+            checker = CapacityChecker(args.every).attach(simulator)
+            simulator.simulate()
+            name = f"{p_cls.__name__} + {m_cls.__name__}"
+            if checker.violation is None:
+                print(f"OK: {name} ({checker.checks} checks)")
+            else:
+                failures += 1
+                print(f"FAIL: {name}")
+    sys.exit(1 if failures else 0)
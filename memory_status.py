@@ -6,6 +6,26 @@ from abc import ABC, abstractmethod
 from dataclasses import dataclass
 BYTES_TO_GB = 1024**3
 
+# One level of the memory hierarchy, bandwidths in GB/s (B/ns), capacity in B.
+@dataclass
+class MemoryTier():
+    name: str
+    capacity: float
+    B_read: float
+    B_write: float
+    B_internal: float = math.inf
+    kv_dtype_size: float = None     # Bytes per KV element, ModelConfig's when None
+
+# Location codes: 0 HBM, 1 first external tier, 2 skipped, 3 undecided.
+# Tiers below the first external device are encoded from 4 on.
+def tier_location(tier: int) -> int:
+    return tier if tier < 2 else tier + 2
+
+def location_tier(location):
+    """Inverse of tier_location, works on scalars and arrays (2/3 map to -1)."""
+    location = np.asarray(location)
+    return np.where(location < 2, location, np.where(location >= 4, location - 2, -1))
+
 @dataclass
 class ModelConfig():
     # Model architecture parameters
@@ -17,7 +37,15 @@ class ModelConfig():
         self.h: int = 32          # Number of attention heads
         self.d_ff: int = 16384    # Feed-forward dimension e.e. 16384
         self.dtype_size: int = 2  # Bytes per parameter (e.g., 2 for FP16)
+        self.n_kv_heads: int = self.h   # KV heads, fewer than h for grouped-query attention
+        self.kv_dtype_size: float = self.dtype_size      # Bytes per KV element on HBM
+        self.kv_dtype_size_ext: float = self.dtype_size  # Bytes per KV element on the external memory (e.g. 1 for 8-bit, 0.5 for 4-bit)
         self.para_num: int = para_num * 1000000000 # how many parameters in the model 2B 4GB
+        # Parallelism: each device holds 1/tp of the heads (KV and weights)
+        # of L/pp layers, starting at global layer layer_offset.
+        self.tp: int = 1
+        self.pp: int = 1
+        self.layer_offset: int = 0
         
         # Memory parameters
         self.B_HBM: float = 4915  # HBM bandwidth in GB/s  e.g 4.8TB/s  B/ns
@@ -26,18 +54,65 @@ class ModelConfig():
         self.B_ext_internal: float = 1900    # External memory internal bandwidth (GB/s) B/ns
         self.C_HBM_max: float = C_HBM_max * BYTES_TO_GB          # HBM capacity in B, 10GB
         self.C_HBM: float = 0.0
+        # Compute parameters
+        self.F_peak: float = 989000  # Peak compute in FLOP/ns e.g. 989 TFLOPS
+        self.B_dequant: float = 0.0  # (De)quantization throughput of external KV in GB/s of HBM-dtype data, 0: free
         # Inference parameters
         self.N: int = N       # Total tokens 2GB
         self.N_pre: int = N_pre   # Previous tokens from prefilling 1.71GB
+        # Long-context attention: first n_sink tokens and the last window tokens stay hot
+        self.n_sink: int = 4
+        self.window: int = 1024
+        self.best_alpha = self.B_HBM / (self.B_HBM + min(self.B_ext_interface_R, self.B_ext_internal))
+        # Optional memory hierarchy, HBM + one external device when None
+        self.tiers = None
+
+    def get_single_KV_cache_size(self) -> float:
+        """KV cache size of one token at one layer on one device, at the HBM dtype."""
+        kv_dim = self.d * self.n_kv_heads / self.h
+        return 2 * kv_dim * self.kv_dtype_size / self.tp
+
+    def set_tiers(self, tiers: list):
+        """
+        Use an N-tier hierarchy. Tier 0 is HBM and tier 1 the first external
+        device, the two-tier fields are taken from them.
+        """
+        self.tiers = tiers
+        self.C_HBM_max = tiers[0].capacity
+        self.B_HBM = tiers[0].B_read
+        if len(tiers) > 1:
+            self.B_ext_interface_R = tiers[1].B_read
+            self.B_ext_interface_W = tiers[1].B_write
+            self.B_ext_internal = tiers[1].B_internal
         self.best_alpha = self.B_HBM / (self.B_HBM + min(self.B_ext_interface_R, self.B_ext_internal))
 
+    def get_tiers(self) -> list:
+        if self.tiers is not None:
+            return self.tiers
+        return [MemoryTier('HBM', self.C_HBM_max, self.B_HBM, self.B_HBM, self.B_HBM),
+                MemoryTier('External', math.inf, self.B_ext_interface_R,
+                           self.B_ext_interface_W, self.B_ext_internal)]
+
+EMPTY_STEP = {"skip_token_kv": [], "skip_layer": False}
+
 # Records each token's KV caches store at where
 class MemStatus(ABC):
     def __init__(self, config: ModelConfig, trace, is_inclusive: bool):
         self.trace = trace
         self.cfg = config
+        # Location matrix (token x layer), token_layer_status maps each
+        # initialized token to its row view.
+        self.locations = np.full((self.cfg.N_pre + self.cfg.N + 1, self.cfg.L), 3, dtype=np.int8)
         self.token_layer_status = {}
-        self.total_model_weights: float =  self.cfg.para_num * self.cfg.dtype_size 
+        self._skip_cache = (None, None)
+        # Per (token, layer) last access step and access count, see enable_access_tracking
+        self.access_stamp = None
+        self.access_count = None
+        # Online skip predictors shared by the strategies, see predictor.get_predictor
+        self.predictors = {}
+        # Number of update_token_layer calls, read by the simulator profiler
+        self.location_updates = 0
+        self.total_model_weights: float =  self.cfg.para_num * self.cfg.dtype_size / self.cfg.tp
         self.start_token_id = self.cfg.N_pre
         # memory threshold rate
         self.threshold = 0.99
@@ -47,29 +122,99 @@ class MemStatus(ABC):
         self.initialize_memory()
     
     def initialize_memory(self):
-        """Initialize HBM with model parameters and KV cache."""
+        """Initialize HBM with model parameters and KV cache, from empty counters."""
         self.cfg.C_HBM = 0.0
+        self.hbm_token_counts = [0] * self.cfg.L
         HBM_model_size = self.total_model_weights * self.model_weight_ratio
-        self.store_data(HBM_model_size)
+        # Weight bytes accounted in C_HBM, the rest of C_HBM is KV cache
+        self.hbm_weight_bytes = HBM_model_size if self.store_data(HBM_model_size) else 0.0
 
         self.initial_tokens_placement()
         print(f"Initialization complete, HBM utilizaiton rate: {self.get_HBM_util_rate() * 100}%.")
 
     
+    def __getstate__(self):
+        # Row views do not survive copying, keep only the token order.
+        state = self.__dict__.copy()
+        state['token_layer_status'] = list(self.token_layer_status.keys())
+        state['_skip_cache'] = (None, None)
+        return state
+
+    def __setstate__(self, state):
+        token_ids = state.pop('token_layer_status')
+        self.__dict__.update(state)
+        self.token_layer_status = {t: self.locations[t] for t in token_ids}
+
+    def _grow(self, rows: int):
+        """Enlarge the location matrix and rebind the row views."""
+        grown = np.full((max(rows, 2 * len(self.locations)), self.cfg.L), 3, dtype=np.int8)
+        grown[:len(self.locations)] = self.locations
+        self.locations = grown
+        for token_id in self.token_layer_status:
+            self.token_layer_status[token_id] = self.locations[token_id]
+        if self.access_stamp is not None:
+            self.access_stamp = self._grow_matrix(self.access_stamp, -1)
+            self.access_count = self._grow_matrix(self.access_count, 0)
+
+    def _grow_matrix(self, matrix, fill):
+        grown = np.full(self.locations.shape, fill, dtype=matrix.dtype)
+        grown[:len(matrix)] = matrix
+        return grown
+
+    def enable_access_tracking(self):
+        """Start recording per (token, layer) access stamps and counts (opt-in)."""
+        if self.access_stamp is None:
+            self.access_stamp = np.full(self.locations.shape, -1, dtype=np.int32)
+            self.access_count = np.zeros(self.locations.shape, dtype=np.int32)
+
+    def record_access(self, n: int, l: int, s: int):
+        """Mark the KV caches read by step (n, l, s): every earlier token not skipped."""
+        if self.access_stamp is None or s != 0:
+            return
+        rows = min(n, len(self.locations))
+        skips = self.get_skip_token_array(n, l, s)
+        skips = skips[skips < rows]
+        skipped_stamps = self.access_stamp[skips, l]
+        self.access_stamp[:rows, l] = n
+        self.access_stamp[skips, l] = skipped_stamps
+        self.access_count[:rows, l] += 1
+        self.access_count[skips, l] -= 1
+
     def initialize_token(self, token_id):
         """Ensure that a token has been initialized in token_layer_status."""
         if token_id not in self.token_layer_status:
             # 0: on HBM, 1: on the external memory, 2: The layer's KV cache
             # was not calculated (skip), 3: initial state, unarranged.
             # Default: all layers set to 3 (undecided)
-            self.token_layer_status[token_id] = [3] * self.cfg.L
+            if token_id >= len(self.locations):
+                self._grow(token_id + 1)
+            self.locations[token_id] = 3
+            self.token_layer_status[token_id] = self.locations[token_id]
     
     def get_skip_token_kv(self, n, l, s):
         """Return skip_token_kv for step (n, l, s)."""
+        if hasattr(self.trace, 'skip_tokens'):    # SkipTrace or a view of one
+            return self.trace.skip_tokens(n, l + self.cfg.layer_offset, s)
+        # Legacy trace from load_skip_lists: one list per token for every layer
         if s == 0:
             return self.trace.get(n, [])
         return []
+
+    def get_step_info(self, n, l, s, default=EMPTY_STEP):
+        """Return the trace entry {"skip_token_kv", "skip_layer"} of step (n, l, s)."""
+        return self.trace.get((n, l + self.cfg.layer_offset, s), default)
     
+    def get_skip_token_array(self, n, l, s):
+        """
+        Unique skipped tokens of step (n, l, s) as an index array. The array
+        is cached per skip list object, so layers sharing a list convert it once.
+        """
+        skip_list = self.get_skip_token_kv(n, l, s)
+        if self._skip_cache[0] is not skip_list:
+            skips = np.unique(np.asarray(skip_list, dtype=np.int64))
+            self._skip_cache = (skip_list, skips[skips < len(self.locations)])
+        return self._skip_cache[1]
+
     def get_layer_location(self, token_id, layer: int) -> int:
         """Return the location of a token's KV cache at a specific layer.
            0: HBM, 1: External, 2: Skipped.
@@ -92,22 +237,40 @@ class MemStatus(ABC):
         if location == 0:
             self.hbm_token_counts[layer] += 1
         self.token_layer_status[token_id][layer] = location
+        self.location_updates += 1
     
     def get_effective_token_size(self, token_id) -> int:
         """
         Returns the effective KV cache size for a given token.
-        For each layer not marked as skipped (i.e. location != 2), add 2*d*dtype_size.
+        For each layer not marked as skipped (i.e. location != 2), add the single KV cache size.
         """
         self.initialize_token(token_id)
         effective_layers = sum(1 for loc in self.token_layer_status[token_id] if loc != 2)
-        return effective_layers * 2 * self.cfg.d * self.cfg.dtype_size
+        return effective_layers * self.get_single_KV_cache_size()
 
     def get_single_KV_cache_size(self) -> int:
-        return 2 * self.cfg.d * self.cfg.dtype_size
+        """KV cache size of one token at one layer, at the HBM dtype."""
+        return self.cfg.get_single_KV_cache_size()
+
+    def get_ext_KV_scale(self) -> float:
+        """Size of a KV cache on the external memory relative to HBM."""
+        return self.cfg.kv_dtype_size_ext / self.cfg.kv_dtype_size
+
+    def split_external_read(self, n: int, l: int, s: int, alpha: float, D_R: float):
+        """
+        Split the (1 - alpha) * D_R bytes read from the external memory into
+        model weights and KV cache, both at HBM dtype. Weights not on HBM are
+        read first.
+        """
+        ext = (1 - alpha) * D_R
+        if s == 1:
+            return ext, 0.0
+        ext_weights = min(max(ext, 0.0), (1 - self.model_weight_ratio) * self.get_layer_md_weight_size())
+        return ext_weights, ext - ext_weights
     
     # Attention model weight soze
     def get_layer_md_weight_size(self) -> float:
-        return 4 * self.cfg.d**2 * self.cfg.dtype_size
+        return 4 * self.cfg.d**2 * self.cfg.dtype_size / self.cfg.tp
     
     def get_HBM_util_rate(self) -> float:
         return self.cfg.C_HBM / self.cfg.C_HBM_max
@@ -133,7 +296,7 @@ class MemStatus(ABC):
 
         if s == 0:  # MHA
             D_R = self.get_layer_md_weight_size() + n * self.get_single_KV_cache_size()
-            D_W = 2 * self.cfg.d * self.cfg.dtype_size
+            D_W = self.get_single_KV_cache_size()
 
             # Reduce D_R by size of skipped KV caches           
             # skipped_kv_size = (len(step_info["skip_token_kv"])) * self.get_single_KV_cache_size()
@@ -141,7 +304,7 @@ class MemStatus(ABC):
             D_R -= skipped_kv_size
             
         else:  # MLP
-            D_R = 2 * self.cfg.d * self.cfg.d_ff * self.cfg.dtype_size
+            D_R = 2 * self.cfg.d * self.cfg.d_ff * self.cfg.dtype_size / self.cfg.tp
             D_W = 0
         return D_R, D_W
 
@@ -160,9 +323,9 @@ class MemStatus(ABC):
         # Retrieve current step's trace to get skip_token_kv list.
         # step_info = self.trace.get((n, l, s), {"skip_token_kv": [], "skip_layer": False})
         # skip_tokens = set(step_info["skip_token_kv"])
-        skip_tokens = set(self.get_skip_token_kv(n, l, s))
+        skip_tokens = self.get_skip_token_array(n, l, s)
 
-        skipped_in_hbm = sum(1 for token in skip_tokens if self.get_layer_location(token, l) == 0)
+        skipped_in_hbm = int(np.count_nonzero(self.locations[skip_tokens, l] == 0))
         count_hbm = self.hbm_token_counts[l] - skipped_in_hbm
 
         # count_hbm should also include prefill tokens
@@ -174,6 +337,76 @@ class MemStatus(ABC):
         return max(0.0, min(max_alpha, 1.0))
     
     
+    def max_batch_alpha(self, l: int, s: int, skips, D_R: float) -> float:
+        """
+        max_alpha of a step reading the weights and, for MHA, every written
+        KV cache not in skips once, D_R bytes in total.
+        """
+        if D_R <= 0:
+            return 0.0
+        if s == 1:
+            return self.model_weight_ratio
+        skipped_in_hbm = int(np.count_nonzero(self.locations[skips, l] == 0))
+        hbm_bytes = (self.model_weight_ratio * self.get_layer_md_weight_size()
+                     + (self.hbm_token_counts[l] - skipped_in_hbm) * self.get_single_KV_cache_size())
+        return max(0.0, min(hbm_bytes / D_R, 1.0))
+
+    def rollback_tokens(self, token_ids):
+        """
+        Discard the KV caches of tokens (rejected speculative drafts) at every
+        layer. Returns the number of entries freed on HBM and elsewhere.
+        """
+        hbm_entries = other_entries = 0
+        for token_id in token_ids:
+            if token_id not in self.token_layer_status:
+                continue
+            row = self.locations[token_id]
+            on_hbm = np.flatnonzero(row == 0)
+            for l in on_hbm:
+                self.hbm_token_counts[l] -= 1
+            hbm_entries += len(on_hbm)
+            other_entries += int(np.count_nonzero(row == 1))
+            row[:] = 3
+            if self.access_stamp is not None:
+                self.access_stamp[token_id] = -1
+                self.access_count[token_id] = 0
+        self.cfg.C_HBM -= hbm_entries * self.get_single_KV_cache_size()
+        return hbm_entries, other_entries
+
+    def place_initial_tokens(self, hbm_mask, order=None):
+        """
+        Place the prefill KV cache with one capacity computation and bulk
+        assignments over the location matrix.
+        hbm_mask: (N_pre, L) bool, KV entries that should be stored on HBM.
+        order: optional flat indices into hbm_mask giving the storing priority,
+               token-major order by default. Entries that do not fit go to
+               the external memory.
+        """
+        kv_cache_size = self.get_single_KV_cache_size()
+        N_pre, L = self.cfg.N_pre, self.cfg.L
+        remaining = self.cfg.C_HBM_max - self.cfg.C_HBM
+        capacity = int(remaining // kv_cache_size) if remaining > 0 else 0
+
+        wanted = np.asarray(hbm_mask, dtype=bool).ravel()
+        if order is None:
+            candidates = np.flatnonzero(wanted)
+        else:
+            order = np.asarray(order, dtype=np.int64)
+            candidates = order[wanted[order]]
+        on_hbm = candidates[:capacity]
+
+        placement = np.ones(N_pre * L, dtype=np.int8)
+        placement[on_hbm] = 0
+        if N_pre > len(self.locations):
+            self._grow(N_pre)
+        self.locations[:N_pre] = placement.reshape(N_pre, L)
+        for n in range(N_pre):
+            self.token_layer_status[n] = self.locations[n]
+
+        counts = np.count_nonzero(self.locations[:N_pre] == 0, axis=0)
+        self.hbm_token_counts = [c + int(k) for c, k in zip(self.hbm_token_counts, counts)]
+        self.cfg.C_HBM += len(on_hbm) * kv_cache_size
+
     @abstractmethod
     def initial_tokens_placement(self):
         pass
@@ -188,14 +421,8 @@ class HBMInit(MemStatus):
 
     def initial_tokens_placement(self):
         print(f"Start HBMInit initialization")
-        kv_cache_size = self.get_single_KV_cache_size()
         # store prefill tokens on HBM until full
-        for n in range (self.cfg.N_pre):
-            for l in range(self.cfg.L):
-                if self.store_data(kv_cache_size):
-                    self.update_token_layer(n, l, 0)
-                else:
-                    self.update_token_layer(n, l, 1)
+        self.place_initial_tokens(np.ones((self.cfg.N_pre, self.cfg.L), dtype=bool))
         print(f"End HBMInit initialization")
 
 
@@ -208,17 +435,66 @@ class TokenLevelBestRatioInit(MemStatus):
 
     def initial_tokens_placement(self):
         print(f"Start TokenLevelInit initialization")
-        kv_cache_size = self.get_single_KV_cache_size()
         batch = 32
         on_HBM_tokens = math.floor(batch * self.cfg.best_alpha)
-        for n in range (self.cfg.N_pre):
-            for l in range(self.cfg.L):
-                if (n % batch <= on_HBM_tokens):
-                    if self.store_data(kv_cache_size):
-                        self.update_token_layer(n, l, 0)
-                    else:
-                        self.update_token_layer(n, l, 1)
-                else:
-                    self.update_token_layer(n, l, 1)
+        tokens = np.arange(self.cfg.N_pre)
+        hbm_mask = np.zeros((self.cfg.N_pre, self.cfg.L), dtype=bool)
+        hbm_mask[tokens % batch <= on_HBM_tokens] = True
+        self.place_initial_tokens(hbm_mask)
         print(f"End TokenLevelInit initialization")
 
+
+# Store the first layers of every prefill token on HBM (layer level), the
+# same split as the SplitToken placement.
+class LayerSplitInit(MemStatus):
+    def __init__(self, config, trace, is_inclusive):
+        self.model_weight_ratio = 1.0
+        super().__init__(config, trace, is_inclusive)
+
+    def initial_tokens_placement(self):
+        print(f"Start LayerSplitInit initialization")
+        layer = math.floor(self.cfg.L * self.cfg.best_alpha)
+        hbm_mask = np.zeros((self.cfg.N_pre, self.cfg.L), dtype=bool)
+        hbm_mask[:, :layer + 1] = True
+        self.place_initial_tokens(hbm_mask)
+        print(f"End LayerSplitInit initialization")
+
+
+# Rank prefill tokens by importance: tokens the first decode step attends to
+# are stored on HBM first, most recent tokens first.
+class ImportanceRankedInit(MemStatus):
+    def __init__(self, config, trace, is_inclusive):
+        self.model_weight_ratio = 1.0
+        super().__init__(config, trace, is_inclusive)
+
+    def initial_tokens_placement(self):
+        print(f"Start ImportanceRankedInit initialization")
+        N_pre, L = self.cfg.N_pre, self.cfg.L
+        skipped = self.get_skip_token_array(N_pre, 0, 0)
+        important = np.ones(N_pre, dtype=bool)
+        important[skipped[skipped < N_pre]] = False
+        hbm_mask = np.repeat(important[:, None], L, axis=1)
+        # newest tokens first, all layers of a token together
+        order = np.arange(N_pre * L).reshape(N_pre, L)[::-1].ravel()
+        self.place_initial_tokens(hbm_mask, order)
+        print(f"End ImportanceRankedInit initialization")
+
+# Pin the attention-sink tokens and the recent window of the prefill on HBM,
+# sinks first, then the window newest first. The older middle of the context
+# starts on the external memory.
+class SinkWindowInit(MemStatus):
+    def __init__(self, config, trace, is_inclusive):
+        self.model_weight_ratio = 1.0
+        super().__init__(config, trace, is_inclusive)
+
+    def initial_tokens_placement(self):
+        print(f"Start SinkWindowInit initialization")
+        N_pre, L = self.cfg.N_pre, self.cfg.L
+        sinks = np.arange(min(self.cfg.n_sink, N_pre))
+        window = np.arange(N_pre - 1, max(N_pre - self.cfg.window, len(sinks)) - 1, -1)
+        tokens = np.concatenate([sinks, window])
+        hbm_mask = np.zeros((N_pre, L), dtype=bool)
+        hbm_mask[tokens] = True
+        order = (tokens[:, None] * L + np.arange(L)).ravel()
+        self.place_initial_tokens(hbm_mask, order)
+        print(f"End SinkWindowInit initialization")
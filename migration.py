@@ -1,5 +1,7 @@
+import numpy as np
 from abc import ABC, abstractmethod
 from memory_status import ModelConfig, MemStatus
+from predictor import get_predictor
 
 # Add this to your migration.py or a utility file
 def binary_search(sorted_list, target):
@@ -164,8 +166,7 @@ class PastWindowMigration(BaseDataMigration):
         # Gather the union of all tokens marked as skipped in this window for the current (l, s).
         tokens_to_migrate = set()
         for idx in range(start, n + 1):
-            key = (idx, l, s)
-            info = self.status.trace.get(key)
+            info = self.status.get_step_info(idx, l, s, None)
             if info is not None:
                 tokens_to_migrate.update(info.get("skip_token_kv", []))
         
@@ -202,18 +203,17 @@ class LookAheadMigration(BaseDataMigration):
         # skipped_tokens = sorted(step_info["skip_token_kv"])
         skipped_tokens = sorted(self.status.get_skip_token_kv(n, l, s))
         
-        next_key = (n + 1, l, s)
-        if next_key not in self.status.trace:
+        next_info = self.status.get_step_info(n + 1, l, s, None)
+        if next_info is None:
             return [0.0, 0.0, 0.0, 0.0]   
         
-        next_info = self.status.trace[next_key]
         next_skipped_tokens = sorted(next_info["skip_token_kv"])
 
         full = False
         
         # PART 1: Migrate out layers for tokens that token n+1 wants to skip.
         for token in next_skipped_tokens:
-            self.initialize_token(token)
+            self.status.initialize_token(token)
             # For each layer in this token:
             for layer in range(self.cfg.L):
                 if self.status.get_layer_location(token, layer) == 0:
@@ -230,7 +230,7 @@ class LookAheadMigration(BaseDataMigration):
         for token, layer_status in self.status.token_layer_status.items():
             if binary_search(next_skipped_tokens, token):
                 continue  # skip tokens already processed for migration out.
-            self.initialize_token(token)
+            self.status.initialize_token(token)
             # For each layer in this token:
             for layer in range(self.cfg.L):
                 if self.status.get_layer_location(token, layer) == 1:
@@ -344,8 +344,7 @@ class AlphaMigration(BaseDataMigration):
         deviation = 0.01
         next_n = n + 1
 
-        next_key = (next_n, l, s)
-        if next_key not in self.status.trace:
+        if self.status.get_step_info(next_n, l, s, None) is None:
             return [0.0, 0.0, 0.0, 0.0] 
         
         if s != 0:
@@ -418,3 +417,267 @@ class AlphaMigration(BaseDataMigration):
         return [hbm_MR, hbm_MW, ext_MR, ext_MW]
     
         
+
+
+# Cache replacement over the (token, layer) KV caches on HBM, driven by the
+# access stamps and counts of MemStatus. Eviction and promotion are separated
+# by two watermarks: once HBM reaches the high watermark (status.threshold)
+# the coldest entries of the current layer are evicted, batch by batch, until
+# it is back at the low watermark; promotions of the hottest external
+# entries only fill HBM up to the low watermark. Entries evicted in the last
+# cooldown steps are not promoted back.
+# Cost: record_access updates a layer column per step, O(1) per KV cache the
+# step reads, but victims and promotions are picked by an O(n) argpartition
+# over the layer, not an O(log n) priority queue.
+class AccessAwareMigration(BaseDataMigration):
+    def __init__(self, config, status):
+        super().__init__(config, status)
+        self.status.enable_access_tracking()
+        self.batch_size = 32      # max entries evicted per step
+        self.promote_size = 8     # max entries promoted per step
+        self.low_watermark = 0.95     # HBM utilization evictions drain to
+        self.cooldown = 256       # steps an evicted entry is not promoted
+        self.draining = False
+        self.evict_stamp = np.full(self.status.locations.shape, -1, dtype=np.int32)
+
+    @abstractmethod
+    def hotness(self, tokens, l: int):
+        """Score of every (token, l) entry, the lowest are evicted first."""
+        pass
+
+    def select_victims(self, n: int, l: int, hbm_tokens, k: int):
+        # argpartition picks the k coldest in O(len) without a full sort
+        if k >= len(hbm_tokens):
+            return hbm_tokens
+        scores = self.hotness(hbm_tokens, l)
+        return hbm_tokens[np.argpartition(scores, k - 1)[:k]]
+
+    def select_promotions(self, n: int, l: int, ext_tokens, k: int):
+        """Hottest external entries first, only entries that were ever read."""
+        ext_tokens = ext_tokens[self.status.access_count[ext_tokens, l] > 0]
+        if len(ext_tokens) == 0 or k <= 0:
+            return ext_tokens[:0]
+        scores = self.hotness(ext_tokens, l)
+        if k < len(ext_tokens):
+            top = np.argpartition(scores, len(ext_tokens) - k)[-k:]
+            ext_tokens, scores = ext_tokens[top], scores[top]
+        return ext_tokens[np.argsort(scores)[::-1]]
+
+    def on_evict(self, n: int, l: int, victims):
+        pass
+
+    def on_promote(self, n: int, l: int, tokens):
+        pass
+
+    def _evict_stamp_column(self, n: int, l: int):
+        if len(self.evict_stamp) < len(self.status.locations):
+            self.evict_stamp = self.status._grow_matrix(self.evict_stamp, -1)
+        return self.evict_stamp[:n, l]
+
+    def migration_strategy(self, n: int, l: int, s: int) -> tuple[float, float, float, float]:
+        hbm_MR = 0.0
+        hbm_MW = 0.0
+        ext_MR = 0.0
+        ext_MW = 0.0
+        if s != 0:
+            return [0.0, 0.0, 0.0, 0.0]
+
+        layer_size = self.status.get_single_KV_cache_size()
+        column = self.status.locations[:n, l]
+        evicted_at = self._evict_stamp_column(n, l)
+        # Entries read by this step do not need an extra migration read
+        read_now = self.status.access_stamp[:n, l] == n
+
+        util = self.status.get_HBM_util_rate()
+        if self.status.exceed_threshold():
+            self.draining = True
+        elif util <= self.low_watermark:
+            self.draining = False
+
+        if self.draining:
+            hbm_tokens = np.flatnonzero(column == 0)
+            excess = int(np.ceil((util - self.low_watermark) * self.cfg.C_HBM_max / layer_size))
+            victims = self.select_victims(n, l, hbm_tokens, min(self.batch_size, excess, len(hbm_tokens)))
+            for token in victims:
+                self.status.update_token_layer(int(token), l, 1)
+                self.cfg.C_HBM -= layer_size
+            evicted_at[victims] = n
+            self.draining = self.status.get_HBM_util_rate() > self.low_watermark
+            hbm_MR += np.count_nonzero(~read_now[victims]) * layer_size
+            ext_MW += len(victims) * layer_size
+            self.on_evict(n, l, victims)
+        elif util < self.low_watermark:
+            ext_tokens = np.flatnonzero((column == 1) & ((evicted_at < 0) | (n - evicted_at >= self.cooldown)))
+            promoted = []
+            for token in self.select_promotions(n, l, ext_tokens, self.promote_size):
+                if self.status.get_HBM_util_rate() + layer_size / self.cfg.C_HBM_max > self.low_watermark:
+                    break
+                if not self.status.store_data(layer_size):
+                    break
+                self.status.update_token_layer(int(token), l, 0)
+                hbm_MW += layer_size
+                if not read_now[token]:
+                    ext_MR += layer_size
+                promoted.append(token)
+            self.on_promote(n, l, np.asarray(promoted, dtype=np.int64))
+
+        if self.status.inclusive:
+            return [0.0, hbm_MW, ext_MR, 0.0]
+
+        return [hbm_MR, hbm_MW, ext_MR, ext_MW]
+
+# Least recently read entries are evicted first
+class LRUMigration(AccessAwareMigration):
+    def hotness(self, tokens, l):
+        return self.status.access_stamp[tokens, l]
+
+# Least frequently read entries are evicted first, ties by recency
+class LFUMigration(AccessAwareMigration):
+    def hotness(self, tokens, l):
+        stamps = self.status.access_stamp[tokens, l]
+        return self.status.access_count[tokens, l] + (stamps + 1) / (stamps.max() + 2)
+
+# ARC-style replacement per layer. Entries read fewer than freq_threshold
+# times form the recency list T1, the others the frequency list T2.
+# Evicted entries are remembered as ghosts (B1 / B2); reads of ghosts adapt
+# the target size p of T1 and make the ghosts preferred for promotion.
+class ARCMigration(AccessAwareMigration):
+    def __init__(self, config, status):
+        super().__init__(config, status)
+        self.freq_threshold = 2
+        self.p = [0.0] * self.cfg.L
+        # 0: no ghost, 1: evicted from T1, 2: evicted from T2
+        self.ghost = np.zeros(self.status.locations.shape, dtype=np.int8)
+
+    def hotness(self, tokens, l):
+        return self.status.access_stamp[tokens, l]
+
+    def _ghost_column(self, n: int, l: int):
+        if len(self.ghost) < len(self.status.locations):
+            grown = np.zeros(self.status.locations.shape, dtype=np.int8)
+            grown[:len(self.ghost)] = self.ghost
+            self.ghost = grown
+        return self.ghost[:n, l]
+
+    def adapt(self, n: int, l: int):
+        """Move p towards T1 on B1 hits and towards T2 on B2 hits."""
+        ghost = self._ghost_column(n, l)
+        read_now = self.status.access_stamp[:n, l] == n
+        b1, b2 = np.count_nonzero(ghost == 1), np.count_nonzero(ghost == 2)
+        b1_hits = np.count_nonzero(read_now & (ghost == 1))
+        b2_hits = np.count_nonzero(read_now & (ghost == 2))
+        if b1_hits:
+            self.p[l] += b1_hits * max(1.0, b2 / b1)
+        if b2_hits:
+            self.p[l] -= b2_hits * max(1.0, b1 / b2)
+        self.p[l] = min(max(self.p[l], 0.0), float(self.status.hbm_token_counts[l]))
+
+    def select_victims(self, n, l, hbm_tokens, k):
+        self.adapt(n, l)
+        frequent = self.status.access_count[hbm_tokens, l] >= self.freq_threshold
+        t1, t2 = hbm_tokens[~frequent], hbm_tokens[frequent]
+        # Evict from T1 while it is larger than its target, then from T2
+        first, second = (t1, t2) if len(t1) > self.p[l] else (t2, t1)
+        victims = super().select_victims(n, l, first, min(k, len(first)))
+        if len(victims) < k:
+            victims = np.concatenate([victims, super().select_victims(n, l, second, min(k - len(victims), len(second)))])
+        return victims
+
+    def select_promotions(self, n, l, ext_tokens, k):
+        self.adapt(n, l)
+        ghost = self._ghost_column(n, l)
+        hits = ext_tokens[(ghost[ext_tokens] > 0) & (self.status.access_stamp[ext_tokens, l] == n)]
+        if len(hits) >= k:
+            return super().select_promotions(n, l, hits, k)
+        others = np.setdiff1d(ext_tokens, hits, assume_unique=True)
+        return np.concatenate([super().select_promotions(n, l, hits, len(hits)),
+                               super().select_promotions(n, l, others, k - len(hits))])
+
+    def on_evict(self, n, l, victims):
+        frequent = self.status.access_count[victims, l] >= self.freq_threshold
+        self._ghost_column(n, l)[victims] = np.where(frequent, 2, 1)
+
+    def on_promote(self, n, l, tokens):
+        self._ghost_column(n, l)[tokens] = 0
+
+# Evict the entries the online predictor most expects to be skipped and
+# promote the ones it least expects to be. Causal counterpart of
+# LookAheadMigration.
+class PredictedMigration(AccessAwareMigration):
+    def __init__(self, config, status):
+        super().__init__(config, status)
+        self.predictor_name = 'decayed'
+
+    def hotness(self, tokens, l):
+        return -get_predictor(self.status, self.predictor_name).predict_skip_probability(tokens, l)
+
+    def migration_strategy(self, n: int, l: int, s: int) -> tuple[float, float, float, float]:
+        get_predictor(self.status, self.predictor_name).observe(n, l, s)
+        return super().migration_strategy(n, l, s)
+
+# Keep the attention sinks and the recent window on HBM. Tokens leaving the
+# window are drained to the external memory in bulk: every drain_batch
+# steps a layer moves its window-exited HBM entries, at most max_drain per
+# step, and the freed space takes back the sink and window entries that
+# were written to the external memory while HBM was full.
+class WindowDrainMigration(BaseDataMigration):
+    def __init__(self, config, status):
+        super().__init__(config, status)
+        self.drain_batch = 64
+        self.max_drain = 256     # entries moved per step and direction
+        self.drained = [self.cfg.n_sink] * self.cfg.L    # next token to drain per layer
+
+    def promote_window(self, n: int, l: int, skipped) -> tuple[float, float]:
+        """Move sink and window entries on the external memory to HBM, returns (hbm_MW, ext_MR)."""
+        layer_size = self.status.get_single_KV_cache_size()
+        window_start = max(n - self.cfg.window, 0)
+        sinks = np.arange(min(self.cfg.n_sink, window_start))
+        window = np.arange(n - 1, window_start - 1, -1)      # newest first
+        tokens = np.concatenate([sinks, window])
+        tokens = tokens[self.status.locations[tokens, l] == 1][:self.max_drain]
+        promoted = 0
+        for token in tokens:
+            if not self.status.store_data(layer_size):
+                break
+            self.status.update_token_layer(int(token), l, 0)
+            promoted += 1
+        # Entries the step skipped are read from the external memory for the move
+        not_read = np.count_nonzero(np.isin(tokens[:promoted], skipped))
+        return promoted * layer_size, not_read * layer_size
+
+    def migration_strategy(self, n: int, l: int, s: int) -> tuple[float, float, float, float]:
+        hbm_MR = 0.0
+        hbm_MW = 0.0
+        ext_MR = 0.0
+        ext_MW = 0.0
+        if s != 0:
+            return [0.0, 0.0, 0.0, 0.0]
+
+        # Tokens [drained, window_start) have left the window
+        window_start = n - self.cfg.window
+        if window_start - self.drained[l] < self.drain_batch:
+            return [0.0, 0.0, 0.0, 0.0]
+
+        start = self.drained[l]
+        tokens = start + np.flatnonzero(self.status.locations[start:window_start, l] == 0)
+        if len(tokens) > self.max_drain:
+            tokens = tokens[:self.max_drain]
+            self.drained[l] = int(tokens[-1]) + 1
+        else:
+            self.drained[l] = window_start
+
+        layer_size = self.status.get_single_KV_cache_size()
+        for token in tokens:
+            self.status.update_token_layer(int(token), l, 1)
+        self.cfg.C_HBM -= len(tokens) * layer_size
+
+        skipped = self.status.get_skip_token_array(n, l, s)
+        hbm_MW, ext_MR = self.promote_window(n, l, skipped)
+        if self.status.inclusive:
+            return [0.0, hbm_MW, ext_MR, 0.0]
+
+        # Skipped entries are not read by this step, the drain reads them from HBM
+        not_read = np.count_nonzero(np.isin(tokens, skipped))
+        hbm_MR += not_read * layer_size
+        ext_MW += len(tokens) * layer_size
+        return [hbm_MR, hbm_MW, ext_MR, ext_MW]
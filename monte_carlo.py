@@ -0,0 +1,140 @@
+# monte_carlo.py
+# Run every strategy combination on K seeded traces per (sparsity, N) setting
+# and report the mean and 95% confidence interval of total time and alpha.
+import copy
+import csv
+import math
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+from generate_trace import generate_trace
+from simulator import CLASS_MAPPING, build_config, simulate_combination, average_alpha
+
+# Two-sided 95% Student t critical values for 1..30 degrees of freedom.
+T_CRITICAL_95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+                 2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+                 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+def confidence_interval(values):
+    """Return (mean, half_width) of the 95% confidence interval of the mean."""
+    mean = statistics.fmean(values)
+    if len(values) < 2:
+        return mean, 0.0
+    df = len(values) - 1
+    t = T_CRITICAL_95[df - 1] if df <= len(T_CRITICAL_95) else 1.960
+    return mean, t * statistics.stdev(values) / math.sqrt(len(values))
+
+def run_seed(setting: dict, seed: int, init_classes: list, plc_classes: list, mig_classes: list):
+    """
+    Generate one seeded trace and simulate every requested combination on it.
+    The trace and each initialized state are built once and shared by all strategies.
+    """
+    trace = generate_trace(N=setting['N'], N_pre=setting['N_pre'],
+                           sparsity=setting['sparsity'], seed=seed)
+    config = build_config(setting)
+    results = []
+    for init_cls in init_classes:
+        initial_state = init_cls(copy.deepcopy(config), trace, setting.get('inclusive', False))
+        for p_cls in plc_classes:
+            for m_cls in mig_classes:
+                simulator = simulate_combination(initial_state, trace, p_cls, m_cls)
+                results.append({
+                    'sparsity': setting['sparsity'],
+                    'N': setting['N'],
+                    'seed': seed,
+                    'init': init_cls.__name__,
+                    'placement': p_cls.__name__,
+                    'migration': m_cls.__name__,
+                    'total_time': simulator.total_time,
+                    'avg_alpha': average_alpha(simulator.step_details),
+                })
+    return results
+
+def run_monte_carlo(settings: list, seeds: int, init_classes: list, plc_classes: list,
+                    mig_classes: list, base_seed: int = 0, workers: int = None):
+    """Run K = seeds traces per setting in parallel, returns the per-run records."""
+    records = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_seed, setting, base_seed + k, init_classes, plc_classes, mig_classes)
+                   for setting in settings for k in range(seeds)]
+        for future in futures:
+            records.extend(future.result())
+    return records
+
+def summarize(records):
+    """Group runs by setting and combination and compute confidence intervals."""
+    groups = {}
+    for r in records:
+        key = (r['sparsity'], r['N'], r['init'], r['placement'], r['migration'])
+        groups.setdefault(key, []).append(r)
+
+    summary = []
+    for key, runs in sorted(groups.items()):
+        time_mean, time_ci = confidence_interval([r['total_time'] for r in runs])
+        alpha_mean, alpha_ci = confidence_interval([r['avg_alpha'] for r in runs])
+        summary.append({
+            'sparsity': key[0],
+            'N': key[1],
+            'init': key[2],
+            'placement': key[3],
+            'migration': key[4],
+            'runs': len(runs),
+            'time_mean': time_mean,
+            'time_ci95': time_ci,
+            'alpha_mean': alpha_mean,
+            'alpha_ci95': alpha_ci,
+        })
+    return summary
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sparsity', type=float, nargs='+', default=[0.2])
+    parser.add_argument('--N', type=int, nargs='+', default=[1024*2])
+    parser.add_argument('--N_pre', type=int, default=1024)
+    parser.add_argument('--para_num', type=float, default=0.5)
+    parser.add_argument('--C_HBM_max', type=int, default=4)
+    parser.add_argument('--inclusive', action='store_true')
+    parser.add_argument('--seeds', type=int, default=8, help='Number of traces (K) per setting')
+    parser.add_argument('--base_seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--init_classes', type=str, nargs='+', required=True)
+    parser.add_argument('--mig_classes', type=str, nargs='+', required=True)
+    parser.add_argument('--plc_classes', type=str, nargs='+', required=True)
+    parser.add_argument('--out', type=str, default=None, help='Optional CSV file for the summary')
+    args = parser.parse_args()
+
+    try:
+        init_classes = [CLASS_MAPPING[name] for name in args.init_classes]
+        mig_classes = [CLASS_MAPPING[name] for name in args.mig_classes]
+        plc_classes = [CLASS_MAPPING[name] for name in args.plc_classes]
+    except KeyError as e:
+        print(f"Error: Unknown class name {e.args[0]}")
+        sys.exit(1)
+
+    settings = [{
+        'N': N,
+        'N_pre': args.N_pre,
+        'para_num': args.para_num,
+        'C_HBM_max': args.C_HBM_max,
+        'inclusive': args.inclusive,
+        'sparsity': sparsity,
+    } for sparsity in args.sparsity for N in args.N]
+
+    records = run_monte_carlo(settings, args.seeds, init_classes, plc_classes, mig_classes,
+                              base_seed=args.base_seed, workers=args.workers)
+    summary = summarize(records)
+
+    for row in summary:
+        print(f"sparsity={row['sparsity']} N={row['N']} {row['init']}: "
+              f"{row['placement']} + {row['migration']} ({row['runs']} runs)")
+        print(f"Total time: {row['time_mean']/1e9:.4f} ± {row['time_ci95']/1e9:.4f} seconds")
+        print(f"Avg alpha: {row['alpha_mean']:.6f} ± {row['alpha_ci95']:.6f}")
+        print("-" * 50)
+
+    if args.out:
+        with open(args.out, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(summary[0].keys()))
+            writer.writeheader()
+            writer.writerows(summary)
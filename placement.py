@@ -2,6 +2,7 @@ import numpy as np
 import math
 from abc import ABC, abstractmethod
 from memory_status import ModelConfig, MemStatus
+from predictor import get_predictor
 BYTES_TO_GB = 1024**3
 
 
@@ -22,6 +23,18 @@ class BaseStrategy(ABC):
     def beta_strategy(self, n: int, l: int, s: int) -> float:
         """Define fraction of writes to HBM."""
         pass
+
+    def batch_alpha_strategy(self, n: int, l: int, s: int, skips, D_R: float) -> float:
+        """alpha of a speculative verify step reading D_R bytes, skips as in max_batch_alpha."""
+        alpha = self.status.max_batch_alpha(l, s, skips, D_R)
+        if self.status.inclusive:
+            return min(self.cfg.best_alpha, alpha)
+        return alpha
+
+    def batch_beta_strategy(self, n: int, l: int, s: int, tokens) -> float:
+        """Fraction of the KV writes of a verify batch to HBM, every token placed by beta_strategy."""
+        betas = [self.beta_strategy(t, l, s) for t in tokens]
+        return sum(betas) / len(betas) if betas else 0.0
         
 
 class PreferHBM(BaseStrategy):
@@ -32,7 +45,7 @@ class PreferHBM(BaseStrategy):
         if s == 1:
             return 0.0
         
-        step_info = self.status.trace.get((n, l, s), {"skip_token_kv": [], "skip_layer": False})
+        step_info = self.status.get_step_info(n, l, s)
         if step_info['skip_layer']:
             self.status.update_token_layer(n, l, 2)
             return 0.0
@@ -54,7 +67,7 @@ class SplitToken(BaseStrategy):
         if s == 1:
             return 0.0
         
-        step_info = self.status.trace.get((n, l, s), {"skip_token_kv": [], "skip_layer": False})
+        step_info = self.status.get_step_info(n, l, s)
         if step_info['skip_layer']:
             self.status.update_token_layer(n, l, 2)
             return 0.0
@@ -83,7 +96,7 @@ class BatchRatio(BaseStrategy):
             return 0.0
         
         batch_num = 16
-        step_info = self.status.trace.get((n, l, s), {"skip_token_kv": [], "skip_layer": False})
+        step_info = self.status.get_step_info(n, l, s)
         if step_info['skip_layer']:
             self.status.update_token_layer(n, l, 2)
             return 0.0
@@ -111,7 +124,7 @@ class LookAheadBatch(BaseStrategy):
         if s == 1:
             return 0.0
         
-        step_info = self.status.trace.get((n, l, s), {"skip_token_kv": [], "skip_layer": False})
+        step_info = self.status.get_step_info(n, l, s)
         if step_info['skip_layer']:
             self.status.update_token_layer(n, l, 2)
             return 0.0
@@ -122,8 +135,7 @@ class LookAheadBatch(BaseStrategy):
         for j in range(1, batch_size + 1):
             if (n + j) >= self.cfg.N_pre + self.cfg.N:
                 break
-            key = (n + j, l, s)
-            info = self.status.trace.get(key, {"skip_token_kv": [], "skip_layer": False})
+            info = self.status.get_step_info(n + j, l, s)
             batch_skip_lists.append(set(info["skip_token_kv"]))
 
         _, D_W = self.status.calculate_data_sizes(n, l, s)
@@ -189,4 +201,35 @@ class AlphaLayersDistribution(BaseStrategy):
                 return 0.0
         else:
             self.status.update_token_layer(n, l, 1)
-            return 0.0
\ No newline at end of file
+            return 0.0
+
+
+# Write the new KV cache to HBM unless the online predictor expects it to be
+# skipped. The new token has no observations yet, so its prediction comes
+# from its closest observed neighbours. Causal counterpart of LookAheadBatch.
+class PredictedPlacement(BaseStrategy):
+    def __init__(self, config: ModelConfig, status: MemStatus):
+        super().__init__(config, status)
+        self.predictor_name = 'decayed'
+        self.skip_threshold = 0.5
+        self.neighbours = 8
+
+    def beta_strategy(self, n, l, s):
+        if s == 1:
+            return 0.0
+
+        step_info = self.status.get_step_info(n, l, s)
+        if step_info['skip_layer']:
+            self.status.update_token_layer(n, l, 2)
+            return 0.0
+
+        predictor = get_predictor(self.status, self.predictor_name)
+        predictor.observe(n, l, s)
+        _, D_W = self.status.calculate_data_sizes(n, l, s)
+
+        skip_probability = predictor.neighbour_skip_probability(n, l, self.neighbours)
+        if skip_probability < self.skip_threshold and self.status.store_data(D_W):
+            self.status.update_token_layer(n, l, 0)
+            return 1.0
+        self.status.update_token_layer(n, l, 1)
+        return 0.0
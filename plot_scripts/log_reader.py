@@ -0,0 +1,119 @@
+# log_reader.py
+# Indexed reader of simulator.py logs. One pass over the file records the
+# byte range of every combination section, its total time and average
+# alpha; alpha series are read lazily from their byte range as NumPy
+# arrays and can be downsampled to a min/max envelope for plotting. The
+# index is saved next to the log (<log>.idx.json) and reused while the log
+# is unchanged.
+import json
+import os
+import numpy as np
+
+SEPARATOR = b"-" * 50
+
+class LogReader():
+    def __init__(self, log_file: str, cache_index: bool = True):
+        self.log_file = log_file
+        self.index_file = log_file + ".idx.json"
+        self.index = None
+        if cache_index:
+            self.index = self._load_index()
+        if self.index is None:
+            self.index = self.build_index()
+            if cache_index:
+                self._save_index()
+
+    def _signature(self) -> list:
+        stat = os.stat(self.log_file)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def _load_index(self):
+        try:
+            with open(self.index_file, "r") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return index if index.get('signature') == self._signature() else None
+
+    def _save_index(self):
+        try:
+            with open(self.index_file, "w") as f:
+                json.dump(self.index, f)
+        except OSError:
+            pass        # read-only location, the index is rebuilt next time
+
+    def build_index(self) -> dict:
+        """Scan the log once and record every combination section."""
+        index = {'signature': self._signature(), 'best': None, 'combinations': {}}
+        section = None
+        offset = 0
+        with open(self.log_file, "rb") as f:
+            for line in f:
+                start = offset
+                offset += len(line)
+                line = line.strip()
+                if not line or line[0:1].isdigit() or line[0:1] == b"-" and line != SEPARATOR:
+                    continue        # alpha values, the hot path of the scan
+                if line.startswith(b"Total simulation time:"):
+                    index['best'] = float(line.split(b":", 1)[1].split(b"ns")[0])
+                elif line.startswith(b"Combination:"):
+                    name = line.split(b":", 1)[1].strip().decode()
+                    section = {'time': None, 'avg_alpha': None, 'alphas': None}
+                    index['combinations'][name] = section
+                elif section is None:
+                    continue
+                elif line.startswith(b"Total time:"):
+                    section['time'] = float(line.split(b":", 1)[1].split(b"ns")[0])
+                elif line.startswith(b"Avg alpha:"):
+                    section['avg_alpha'] = float(line.split(b":", 1)[1])
+                elif line == b"Alphas:":
+                    section['alphas'] = [offset, offset]
+                elif line == SEPARATOR:
+                    if section['alphas'] is not None:
+                        section['alphas'][1] = start
+                    section = None
+        return index
+
+    def combinations(self) -> list:
+        return list(self.index['combinations'])
+
+    def best_time(self) -> float:
+        return self.index['best']
+
+    def results(self) -> list:
+        """[{'placement', 'migration', 'time' (s), 'alpha'}] of every combination, as plot.py takes."""
+        rows = []
+        for name, section in self.index['combinations'].items():
+            placement, migration = [part.strip() for part in name.split("+")]
+            rows.append({'placement': placement, 'migration': migration,
+                         'time': section['time'] / 1e9, 'alpha': section['avg_alpha']})
+        return rows
+
+    def alphas(self, combination: str):
+        """Alpha series of a combination as a float array, read from its byte range only."""
+        section = self.index['combinations'].get(combination)
+        if section is None:
+            raise KeyError(f"No combination '{combination}' in {self.log_file}")
+        if section['alphas'] is None:
+            return np.zeros(0)
+        start, end = section['alphas']
+        with open(self.log_file, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start)
+        return np.fromstring(data.decode(), dtype=np.float64, sep="\n") if data.strip() else np.zeros(0)
+
+def downsample_minmax(values, buckets: int = 2000):
+    """
+    Bucket a series into at most `buckets` buckets. Returns the first index,
+    minimum, maximum and mean of every bucket, so spikes survive.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) <= buckets:
+        x = np.arange(len(values))
+        return x, values, values, values
+    size = int(np.ceil(len(values) / buckets))
+    padded = np.full(size * int(np.ceil(len(values) / size)), np.nan)
+    padded[:len(values)] = values
+    blocks = padded.reshape(-1, size)
+    x = np.arange(len(blocks)) * size
+    return x, np.nanmin(blocks, axis=1), np.nanmax(blocks, axis=1), np.nanmean(blocks, axis=1)
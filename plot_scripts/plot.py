@@ -61,6 +61,16 @@ def plot_simulation_data(data):
 
 # Example usage with your sample data
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--log', type=str, default=None,
+                        help='simulator.py log to plot instead of the sample data below')
+    args = parser.parse_args()
+    if args.log:
+        from log_reader import LogReader
+        plot_simulation_data(LogReader(args.log).results())
+        raise SystemExit
+
     # prefer_hbm_data = [
     #     {'placement': 'PreferHBM', 'migration': 'NoMigration', 'time': 23.2145, 'alpha': 0.992730},
     #     {'placement': 'PreferHBM', 'migration': 'PriorMigration', 'time': 23.2174, 'alpha': 0.992803},
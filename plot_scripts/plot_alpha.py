@@ -1,48 +1,30 @@
 import matplotlib.pyplot as plt
+from log_reader import LogReader, downsample_minmax
 
-def plot_alphas(log_file, target_combination):
+def plot_alphas(log_file, target_combination, buckets=2000):
     """
     Read the log file and plot the alpha values for the specified combination.
     
     Args:
         log_file (str): Path to the simulation log file
         target_combination (str): The combination to plot (e.g., "PreferHBM + NoMigration")
+        buckets (int): Long series are drawn as the min/max envelope of this many buckets
     """
-    with open(log_file, 'r') as f:
-        lines = f.readlines()
-    
-    alphas = []
-    in_target_combination = False
-    in_alphas_section = False
-    
-    for line in lines:
-        line = line.strip()
-        # Check for the target combination
-        if line.startswith("Combination:"):
-            current_combination = line.split("Combination:")[1].strip()
-            in_target_combination = (current_combination == target_combination)
-            in_alphas_section = False  # Reset alpha section flag
-        # Start collecting alphas after "Alphas:"
-        elif in_target_combination and line == "Alphas:":
-            in_alphas_section = True
-        # Stop at the separator
-        elif in_alphas_section and line == "-" * 50:
-            break
-        # Collect alpha values
-        elif in_alphas_section:
-            try:
-                alpha = float(line)
-                alphas.append(alpha)
-            except ValueError:
-                continue  # Skip lines that can't be converted to float
-    
-    if not alphas:
+    reader = LogReader(log_file)
+    if target_combination not in reader.combinations():
+        print(f"No alpha values found for combination: {target_combination}")
+        return
+    alphas = reader.alphas(target_combination)
+    if len(alphas) == 0:
         print(f"No alpha values found for combination: {target_combination}")
         return
+    x, low, high, mean = downsample_minmax(alphas, buckets)
     
     # Plot the alpha values
     plt.figure(figsize=(10, 6))
-    plt.plot(alphas, label=f"Alpha ({target_combination})")
+    if len(x) < len(alphas):
+        plt.fill_between(x, low, high, alpha=0.3, label="Min/max per bucket")
+    plt.plot(x, mean, label=f"Alpha ({target_combination})")
     plt.xlabel("Step")
     plt.ylabel("Alpha")
     plt.title(f"Alpha Variation Over Simulation Steps\nCombination: {target_combination}")
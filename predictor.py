@@ -0,0 +1,128 @@
+# predictor.py
+# Causal skip predictors. They learn online from the skip lists of the steps
+# already decoded and predict, for a batch of tokens at one layer, the
+# probability that their KV caches will be skipped. Strategies built on them
+# never read future trace entries.
+import numpy as np
+from abc import ABC, abstractmethod
+from memory_status import ModelConfig, MemStatus
+
+class SkipPredictor(ABC):
+    def __init__(self, config: ModelConfig, status: MemStatus):
+        self.cfg = config
+        self.status = status
+        self.decay = 0.9           # weight of the history in the decayed skip frequency
+        self.young = 64            # newest tokens used for the prior of unseen tokens
+        self.freq = np.zeros(status.locations.shape, dtype=np.float32)
+        self.observations = np.zeros(status.locations.shape, dtype=np.int32)
+        self.prior = np.zeros(config.L)
+        self._last_observed = None
+
+    def _ensure_rows(self, rows: int):
+        if rows > len(self.freq):
+            for name in ['freq', 'observations']:
+                old = getattr(self, name)
+                grown = np.zeros((max(rows, 2 * len(old)), self.cfg.L), dtype=old.dtype)
+                grown[:len(old)] = old
+                setattr(self, name, grown)
+
+    def observe(self, n: int, l: int, s: int):
+        """Learn from the skip list of step (n, l, s). Repeated calls are ignored."""
+        if s != 0 or self._last_observed == (n, l):
+            return
+        self._last_observed = (n, l)
+        self._ensure_rows(n)
+        skipped = np.zeros(n, dtype=bool)
+        skips = self.status.get_skip_token_array(n, l, s)
+        skipped[skips[skips < n]] = True
+        self.learn(n, l, skipped)
+
+        self.freq[:n, l] = self.decay * self.freq[:n, l] + (1 - self.decay) * skipped
+        self.observations[:n, l] += 1
+        young = skipped[max(0, n - self.young):]
+        if len(young):
+            self.prior[l] = self.decay * self.prior[l] + (1 - self.decay) * young.mean()
+
+    def learn(self, n: int, l: int, skipped):
+        """Update model parameters before the features see step n."""
+        pass
+
+    def skip_frequency(self, tokens, l: int):
+        """Bias-corrected decayed skip frequency, the layer prior for unseen tokens."""
+        self._ensure_rows(int(tokens.max()) + 1 if len(tokens) else 0)
+        obs = self.observations[tokens, l]
+        freq = self.freq[tokens, l] / np.maximum(1 - self.decay ** obs, 1e-12)
+        return np.where(obs > 0, freq, self.prior[l])
+
+    def neighbour_skip_probability(self, n: int, l: int, neighbours: int = 8) -> float:
+        """
+        Skip probability of token n before any step has read it, the mean
+        prediction of the closest observed tokens before it.
+        """
+        self._ensure_rows(n)
+        tokens = np.arange(max(0, n - neighbours), n)
+        tokens = tokens[self.observations[tokens, l] > 0]
+        if len(tokens) == 0:
+            return float(self.prior[l])
+        return float(self.predict_skip_probability(tokens, l).mean())
+
+    @abstractmethod
+    def predict_skip_probability(self, tokens, layer: int):
+        """Probability that each token's KV cache at layer is skipped next."""
+        pass
+
+# Exponentially decayed skip frequency of every (token, layer)
+class DecayedFrequencyPredictor(SkipPredictor):
+    def predict_skip_probability(self, tokens, layer):
+        tokens = np.atleast_1d(np.asarray(tokens, dtype=np.int64))
+        return self.skip_frequency(tokens, layer)
+
+# Logistic model over the decayed skip frequency, whether the token was
+# skipped at its last observation and its age, trained by online SGD on a
+# sample of the tokens of every step.
+class LogisticPredictor(SkipPredictor):
+    def __init__(self, config, status):
+        super().__init__(config, status)
+        self.lr = 0.1
+        self.sample_size = 256
+        self.weights = np.zeros(4)
+        self.last_skipped = np.zeros(status.locations.shape, dtype=np.float32)
+        self.rng = np.random.default_rng(0)
+
+    def _ensure_rows(self, rows):
+        super()._ensure_rows(rows)
+        if rows > len(self.last_skipped):
+            grown = np.zeros((len(self.freq), self.cfg.L), dtype=np.float32)
+            grown[:len(self.last_skipped)] = self.last_skipped
+            self.last_skipped = grown
+
+    def features(self, tokens, l: int, n: int):
+        freq = self.skip_frequency(tokens, l)
+        last = np.where(self.observations[tokens, l] > 0, self.last_skipped[tokens, l], self.prior[l])
+        age = (n - tokens) / max(n, 1)
+        return np.column_stack([np.ones(len(tokens)), freq, last, age])
+
+    def learn(self, n, l, skipped):
+        tokens = np.arange(n)
+        if n > self.sample_size:
+            tokens = self.rng.choice(n, self.sample_size, replace=False)
+        x = self.features(tokens, l, n)
+        p = 1 / (1 + np.exp(-x @ self.weights))
+        self.weights -= self.lr * x.T @ (p - skipped[tokens]) / len(tokens)
+        self.last_skipped[:n, l] = skipped
+
+    def predict_skip_probability(self, tokens, layer):
+        tokens = np.atleast_1d(np.asarray(tokens, dtype=np.int64))
+        n = self._last_observed[0] if self._last_observed else self.cfg.N_pre
+        return 1 / (1 + np.exp(-self.features(tokens, layer, n) @ self.weights))
+
+PREDICTOR_MAPPING = {
+    'decayed': DecayedFrequencyPredictor,
+    'logistic': LogisticPredictor,
+}
+
+def get_predictor(status: MemStatus, name: str = 'decayed') -> SkipPredictor:
+    """Predictor shared by the placement and migration of one MemStatus."""
+    if name not in status.predictors:
+        status.predictors[name] = PREDICTOR_MAPPING[name](status.cfg, status)
+    return status.predictors[name]
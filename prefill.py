@@ -0,0 +1,213 @@
+# prefill.py
+# Chunked prefill. Instead of an init class placing the prefill KV caches,
+# the prompt runs through the model in chunks of tokens before decoding:
+# every chunk reads the weights once and the KV caches of the earlier
+# chunks, writes its KV caches where the placement strategy puts them and
+# is mostly compute-bound. Optionally every chunk shares its iteration with
+# one decode step of a batch of other sequences (Sarathi-style piggybacking),
+# whose reads and writes compete for the same bandwidth. The time to first
+# token is the prefill time and decoding starts from the KV distribution
+# the prefill produced.
+import math
+import numpy as np
+from memory_status import MemStatus
+from simulator import MemorySimulator
+
+EMPTY_SKIPS = np.zeros(0, dtype=np.int64)
+
+# Model weights on HBM as far as they fit, no prefill KV cache:
+# ChunkedPrefillSimulator writes it
+class PrefillInit(MemStatus):
+    def __init__(self, config, trace, is_inclusive):
+        # The weights that do not fit are read from the external memory
+        weights = config.para_num * config.dtype_size / config.tp
+        ratio = min(1.0, config.C_HBM_max / weights) if weights > 0 else 1.0
+        if ratio * weights > config.C_HBM_max:
+            ratio = math.nextafter(ratio, 0.0)     # rounding must not overflow HBM
+        self.model_weight_ratio = ratio
+        super().__init__(config, trace, is_inclusive)
+
+    def initial_tokens_placement(self):
+        pass
+
+class ChunkedPrefillSimulator(MemorySimulator):
+    def __init__(self, config, status, placement, migration, best: bool = False,
+                 chunk_size: int = 512, decode_sequences: int = 0,
+                 decode_context: int = None, decode_alpha: float = None):
+        """
+        chunk_size: prompt tokens per prefill iteration.
+        decode_sequences: other sequences decoding one token per iteration
+                          next to the chunk, 0 for an idle server.
+        decode_context: context length of those sequences (N_pre by default).
+        decode_alpha: fraction of their KV cache on HBM (best_alpha by default).
+        """
+        super().__init__(config, status, placement, migration, best)
+        self.chunk_size = chunk_size
+        self.decode_sequences = decode_sequences
+        self.decode_context = config.N_pre if decode_context is None else decode_context
+        self.decode_alpha = config.best_alpha if decode_alpha is None else decode_alpha
+        self.ttft = 0.0
+        self.decode_time = 0.0
+        self.prefill_details = []
+
+    def layer_weight_size(self, s: int) -> float:
+        if s == 0:
+            return self.status.get_layer_md_weight_size()
+        return 2 * self.cfg.d * self.cfg.d_ff * self.cfg.dtype_size / self.cfg.tp
+
+    def compute_time(self, s: int, queries: int, context: float) -> float:
+        """
+        Roofline compute of queries tokens at one sublayer: 2 FLOPs per
+        weight element and token, plus 4 * d / tp FLOPs per (query, key)
+        pair of attention (scores and values); context is the mean number
+        of keys a query attends to.
+        """
+        if self.cfg.F_peak <= 0:
+            return 0.0
+        flops = 2 * queries * self.layer_weight_size(s) / self.cfg.dtype_size
+        if s == 0:
+            flops += 4 * queries * context * self.cfg.d / self.cfg.tp
+        return flops / self.cfg.F_peak
+
+    def chunk_step(self, start: int, tokens, l: int, s: int) -> dict:
+        """Place the KV writes of one chunk at layer l and return its step costs."""
+        kv_size = self.status.get_single_KV_cache_size()
+        B = self.decode_sequences
+        weights = self.layer_weight_size(s)
+        D_R = weights
+        hbm_read = self.status.model_weight_ratio * weights
+        D_W = hbm_write = 0.0
+        if s == 0:
+            # Earlier chunks' KV caches are read once for the whole chunk
+            D_R_chunk = weights + start * kv_size
+            alpha = self.plc.batch_alpha_strategy(start, l, s, EMPTY_SKIPS, D_R_chunk)
+            beta = self.plc.batch_beta_strategy(start, l, s, tokens)
+            D_R, hbm_read = D_R_chunk, alpha * D_R_chunk
+            D_W = len(tokens) * kv_size
+            hbm_write = beta * D_W
+            if B:
+                decode_kv = B * self.decode_context * kv_size
+                D_R += decode_kv
+                hbm_read += self.decode_alpha * decode_kv
+                D_W += B * kv_size
+                hbm_write += self.decode_alpha * B * kv_size
+        alpha = hbm_read / D_R if D_R > 0 else 0.0
+        beta = hbm_write / D_W if D_W > 0 else 0.0
+        memory = self.step_time(start, l, s, alpha, beta, 0, 0, 0, 0, sizes=(D_R, D_W))
+        chunk_context = start + (len(tokens) + 1) / 2      # causal attention inside the chunk
+        compute = self.compute_time(s, len(tokens), chunk_context)
+        if B:
+            compute += self.compute_time(s, B, self.decode_context)
+        return {'memory': memory, 'compute': compute,
+                'time': max(memory, compute), 'alpha': alpha, 'beta': beta}
+
+    def prefill(self) -> float:
+        """Run the prompt through the model chunk by chunk, returns the time to first token."""
+        self.ttft = 0.0
+        self.prefill_details = []
+        N_pre = self.cfg.N_pre
+        for start in range(0, N_pre, self.chunk_size):
+            tokens = list(range(start, min(start + self.chunk_size, N_pre)))
+            chunk_time = compute = memory = 0.0
+            for l in range(self.cfg.L):
+                for s in [0, 1]:  # MHA and MLP
+                    step = self.chunk_step(start, tokens, l, s)
+                    chunk_time += step['time']
+                    compute += step['compute']
+                    memory += step['memory']
+            self.ttft += chunk_time
+            self.prefill_details.append({'start': start, 'tokens': len(tokens), 'time': chunk_time,
+                                         'compute': compute, 'memory': memory})
+        return self.ttft
+
+    def decode_only_iteration(self) -> float:
+        """Iteration time of the background decode batch without a prefill chunk."""
+        if not self.decode_sequences:
+            return 0.0
+        kv_size = self.status.get_single_KV_cache_size()
+        B = self.decode_sequences
+        total = 0.0
+        for s in [0, 1]:
+            weights = self.layer_weight_size(s)
+            D_R = weights + (B * self.decode_context * kv_size if s == 0 else 0)
+            D_W = B * kv_size if s == 0 else 0
+            hbm_read = self.status.model_weight_ratio * weights + self.decode_alpha * (D_R - weights)
+            memory = self.step_time(self.cfg.N_pre, 0, s, hbm_read / D_R, self.decode_alpha,
+                                    0, 0, 0, 0, sizes=(D_R, D_W))
+            total += max(memory, self.compute_time(s, B, self.decode_context))
+        return total * self.cfg.L
+
+    def simulate(self):
+        """Prefill, then decode from the resulting KV distribution."""
+        self.prefill()
+        self.decode_time = super().simulate()
+        self.total_time = self.ttft + self.decode_time
+        return self.total_time
+
+def report_prefill(simulator: ChunkedPrefillSimulator):
+    status = simulator.status
+    details = simulator.prefill_details
+    compute_bound = sum(d['compute'] >= d['memory'] for d in details)
+    print(f"Chunk size: {simulator.chunk_size}, chunks: {len(details)} ({compute_bound} compute-bound)")
+    print(f"Time to first token: {simulator.ttft/1e6:.4f} ms")
+    print(f"Decode time: {simulator.decode_time/1e9:.4f} seconds, total {simulator.total_time/1e9:.4f} seconds")
+    prefill_rows = status.locations[:simulator.cfg.N_pre]
+    print(f"Prefill KV on HBM after prefill and decode: {np.count_nonzero(prefill_rows == 0) / max(prefill_rows.size, 1) * 100:.2f}%")
+    if simulator.decode_sequences and details:
+        alone = simulator.decode_only_iteration()
+        mean_iteration = simulator.ttft / len(details)
+        print(f"Background decode ({simulator.decode_sequences} sequences): "
+              f"{mean_iteration/1e6:.4f} ms per iteration with prefill, {alone/1e6:.4f} ms alone")
+    print("-" * 50)
+
+if __name__ == "__main__":
+    import argparse
+    import copy
+    import sys
+    from simulator import CLASS_MAPPING, build_config, load_skip_lists, simulate_combination
+    from skip_trace import load_skip_trace
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--N', type=int, default=1024*10)
+    parser.add_argument('--N_pre', type=int, default=1024*2)
+    parser.add_argument('--para_num', type=float, default=0.5)
+    parser.add_argument('--C_HBM_max', type=float, default=3)
+    parser.add_argument('--inclusive', action='store_true')
+    parser.add_argument('--filename', type=str, default="trace.txt")
+    parser.add_argument('--per_layer_trace', action='store_true')
+    parser.add_argument('--chunk_size', type=int, nargs='+', default=[512])
+    parser.add_argument('--decode_sequences', type=int, default=0,
+                        help='Sequences decoding next to every prefill chunk')
+    parser.add_argument('--decode_context', type=int, default=None)
+    parser.add_argument('--compare_init', type=str, default=None,
+                        help='Also run the decode from this init class, e.g. TokenLevelBestRatioInit')
+    parser.add_argument('--mig_classes', type=str, nargs='+', required=True)
+    parser.add_argument('--plc_classes', type=str, nargs='+', required=True)
+    args = parser.parse_args()
+
+    try:
+        mig_classes = [CLASS_MAPPING[name] for name in args.mig_classes]
+        plc_classes = [CLASS_MAPPING[name] for name in args.plc_classes]
+        compare_init = CLASS_MAPPING[args.compare_init] if args.compare_init else None
+    except KeyError as e:
+        print(f"Error: Unknown class name {e.args[0]}")
+        sys.exit(1)
+
+    config = build_config(vars(args))
+    trace = load_skip_trace(args.filename) if args.per_layer_trace else load_skip_lists(args.filename)
+    initial_state = PrefillInit(copy.deepcopy(config), trace, args.inclusive)
+    compare_state = compare_init(copy.deepcopy(config), trace, args.inclusive) if compare_init else None
+
+    for p_cls in plc_classes:
+        for m_cls in mig_classes:
+            print(f"Combination: {p_cls.__name__} + {m_cls.__name__}")
+            if compare_state is not None:
+                baseline = simulate_combination(compare_state, trace, p_cls, m_cls)
+                print(f"Decode time from {compare_init.__name__}: {baseline.total_time/1e9:.4f} seconds")
+            for chunk_size in args.chunk_size:
+                simulator = simulate_combination(initial_state, trace, p_cls, m_cls,
+                                                 simulator_cls=ChunkedPrefillSimulator,
+                                                 chunk_size=chunk_size,
+                                                 decode_sequences=args.decode_sequences,
+                                                 decode_context=args.decode_context)
+                report_prefill(simulator)
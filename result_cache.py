@@ -0,0 +1,119 @@
+# result_cache.py
+# On-disk, content-addressed cache of simulation results. A cell is one
+# (config, init class, placement, migration, parameters, trace) combination
+# and is stored under the hash of exactly those inputs, including the
+# source of the code that simulates it.
+import hashlib
+import inspect
+import json
+import os
+import sys
+import numpy as np
+from memory_status import ModelConfig
+
+# Fields of ModelConfig that are simulation state rather than configuration.
+RUNTIME_FIELDS = ('C_HBM',)
+# Modules every cell runs through besides those of its classes.
+CORE_MODULES = ('memory_status', 'simulator', 'skip_trace')
+
+def config_fields(config: ModelConfig) -> dict:
+    return {k: v for k, v in sorted(vars(config).items()) if k not in RUNTIME_FIELDS}
+
+class ResultCache():
+    def __init__(self, cache_dir: str = ".result_cache"):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.digest_file = os.path.join(cache_dir, "trace_digests.json")
+        self.digests = {}
+        if os.path.exists(self.digest_file):
+            with open(self.digest_file, "r") as f:
+                self.digests = json.load(f)
+
+    def trace_digest(self, filename: str) -> str:
+        """
+        SHA-256 of the trace file content. Digests are remembered per
+        (path, size, mtime) so unchanged traces are not hashed again.
+        """
+        st = os.stat(filename)
+        stamp = f"{os.path.abspath(filename)}:{st.st_size}:{st.st_mtime_ns}"
+        if stamp in self.digests:
+            return self.digests[stamp]
+
+        h = hashlib.sha256()
+        with open(filename, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        self.digests[stamp] = h.hexdigest()
+        with open(self.digest_file, "w") as f:
+            json.dump(self.digests, f, indent=1)
+        return self.digests[stamp]
+
+    def code_digest(self, *classes) -> str:
+        """
+        SHA-256 of the source files of the classes, their base classes and
+        the core simulator modules, so results go stale when that code changes.
+        """
+        files = set()
+        for cls in classes:
+            for base in cls.__mro__:
+                try:
+                    files.add(os.path.abspath(inspect.getsourcefile(base)))
+                except TypeError:
+                    pass        # builtins such as object
+        for name in CORE_MODULES:
+            module = sys.modules.get(name)
+            if module is not None and getattr(module, '__file__', None):
+                files.add(os.path.abspath(module.__file__))
+        h = hashlib.sha256()
+        for filename in sorted(files):
+            with open(filename, "rb") as f:
+                h.update(f.read())
+        return h.hexdigest()
+
+    def key(self, config: ModelConfig, init_class, p_cls, m_cls, trace_digest: str,
+            inclusive: bool = False, best: bool = False,
+            plc_params: dict = None, mig_params: dict = None) -> str:
+        """Hash of everything that determines the result of one cell."""
+        cell = {
+            'config': config_fields(config),
+            'init_class': init_class.__name__,
+            'inclusive': inclusive,
+            'placement': p_cls.__name__,
+            'migration': m_cls.__name__,
+            'plc_params': plc_params or {},
+            'mig_params': mig_params or {},
+            'best': best,
+            'trace': trace_digest,
+            'code': self.code_digest(init_class, p_cls, m_cls),
+        }
+        blob = json.dumps(cell, sort_keys=True, default=str).encode()
+        return hashlib.sha256(blob).hexdigest()
+
+    def _paths(self, key: str):
+        base = os.path.join(self.cache_dir, key[:2], key)
+        return base + ".json", base + ".alphas.npy"
+
+    def has(self, key: str) -> bool:
+        return os.path.exists(self._paths(key)[0])
+
+    def get(self, key: str):
+        """Return the cached result dict (with 'alphas' as an array) or None."""
+        meta_path, alpha_path = self._paths(key)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r") as f:
+            result = json.load(f)
+        if os.path.exists(alpha_path):
+            result['alphas'] = np.load(alpha_path)
+        return result
+
+    def put(self, key: str, result: dict, alphas=None):
+        meta_path, alpha_path = self._paths(key)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        if alphas is not None:
+            np.save(alpha_path, np.asarray(alphas, dtype=np.float64))
+        # Write the metadata last so a cell only counts as cached once complete.
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(result, f, indent=1)
+        os.replace(tmp_path, meta_path)
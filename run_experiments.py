@@ -1,186 +1,40 @@
-# run_experiments.py (new file)
+# run_experiments.py
+# Run the experiments of a declarative spec (experiments.json / .toml).
+# Results are cached per (config, init, placement, migration, parameters, trace,
+# code) cell, so rerunning a spec only simulates the cells that are missing.
+import copy
+import hashlib
+import io
+import json
+import os
 import subprocess
 import time
+from contextlib import redirect_stdout
 from datetime import datetime
+from result_cache import ResultCache
 
-experiments = [
-    # sparsity = 50%
-    # {
-    #     'N': 1024*2,
-    #     'N_pre': 1024,
-    #     'para_num': 0.5,
-    #     'C_HBM_max': 4,
-    #     'filename': '04_1_2.txt',
-    #     'init_class': 'HBMInit',
-    #     'mig_classes': ['NoMigration'],
-    #     'plc_classes': ['PreferHBM']
-    # },
-    # {
-    #     'N': 1024*2,
-    #     'N_pre': 1024,
-    #     'para_num': 0.5,
-    #     'C_HBM_max': 4,
-    #     'filename': '04_1_2.txt',
-    #     'init_class': 'TokenLevelBestRatioInit',
-    #     'mig_classes': ['AlphaMigration'],
-    #     'plc_classes': ['AlphaLayersDistribution']
-    # },
-    # {
-    #     'N': 1024*4,
-    #     'N_pre': 1024,
-    #     'para_num': 0.5,
-    #     'C_HBM_max': 4,
-    #     'filename': '04_1_4.txt',
-    #     'init_class': 'HBMInit',
-    #     'mig_classes': ['NoMigration'],
-    #     'plc_classes': ['PreferHBM']
-    # },
-    # {
-    #     'N': 1024*4,
-    #     'N_pre': 1024,
-    #     'para_num': 0.5,
-    #     'C_HBM_max': 4,
-    #     'filename': '04_1_4.txt',
-    #     'init_class': 'TokenLevelBestRatioInit',
-    #     'mig_classes': ['AlphaMigration'],
-    #     'plc_classes': ['AlphaLayersDistribution']
-    # },
-    # {
-    #     'N': 1024*8,
-    #     'N_pre': 1024,
-    #     'para_num': 0.5,
-    #     'C_HBM_max': 4,
-    #     'filename': '04_1_8.txt',
-    #     'init_class': 'HBMInit',
-    #     'mig_classes': ['NoMigration'],
-    #     'plc_classes': ['PreferHBM']
-    # },
-    # {
-    #     'N': 1024*8,
-    #     'N_pre': 1024,
-    #     'para_num': 0.5,
-    #     'C_HBM_max': 4,
-    #     'filename': '04_1_8.txt',
-    #     'init_class': 'TokenLevelBestRatioInit',
-    #     'mig_classes': ['AlphaMigration'],
-    #     'plc_classes': ['AlphaLayersDistribution']
-    # },
-    # skip placement, no mig
-    # {
-    #     'N': 1024*2,
-    #     'N_pre': 1024,
-    #     'para_num': 0.5,
-    #     'C_HBM_max': 4,
-    #     'filename': '04_1_2.txt',
-    #     'init_class': 'TokenLevelBestRatioInit',
-    #     'mig_classes': ['NoMigration'],
-    #     'plc_classes': ['AlphaLayersDistribution']
-    # },
-    # {
-    #     'N': 1024*4,
-    #     'N_pre': 1024,
-    #     'para_num': 0.5,
-    #     'C_HBM_max': 4,
-    #     'filename': '04_1_4.txt',
-    #     'init_class': 'TokenLevelBestRatioInit',
-    #     'mig_classes': ['NoMigration'],
-    #     'plc_classes': ['AlphaLayersDistribution']
-    # },
-    # {
-    #     'N': 1024*8,
-    #     'N_pre': 1024,
-    #     'para_num': 0.5,
-    #     'C_HBM_max': 4,
-    #     'filename': '04_1_8.txt',
-    #     'init_class': 'TokenLevelBestRatioInit',
-    #     'mig_classes': ['NoMigration'],
-    #     'plc_classes': ['AlphaLayersDistribution']
-    # },
+def load_spec(filename="experiments.json"):
+    """Load an experiment spec from JSON or TOML."""
+    if filename.endswith(".toml"):
+        import tomllib
+        with open(filename, "rb") as f:
+            return tomllib.load(f)
+    with open(filename, "r") as f:
+        return json.load(f)
 
-    # skip migration, no placement
-    # {
-    #     'N': 1024*2,
-    #     'N_pre': 1024,
-    #     'para_num': 0.5,
-    #     'C_HBM_max': 4,
-    #     'filename': '04_1_2.txt',
-    #     'init_class': 'HBMInit',
-    #     'mig_classes': ['AlphaMigration'],
-    #     'plc_classes': ['PreferHBM']
-    # },
-    # {
-    #     'N': 1024*4,
-    #     'N_pre': 1024,
-    #     'para_num': 0.5,
-    #     'C_HBM_max': 4,
-    #     'filename': '04_1_4.txt',
-    #     'init_class': 'HBMInit',
-    #     'mig_classes': ['AlphaMigration'],
-    #     'plc_classes': ['PreferHBM']
-    # },
-    # {
-    #     'N': 1024*8,
-    #     'N_pre': 1024,
-    #     'para_num': 0.5,
-    #     'C_HBM_max': 4,
-    #     'filename': '04_1_8.txt',
-    #     'init_class': 'HBMInit',
-    #     'mig_classes': ['AlphaMigration'],
-    #     'plc_classes': ['PreferHBM']
-    # },
-    # {
-    #     'N': 1024*16,
-    #     'N_pre': 1024,
-    #     'para_num': 0.5,
-    #     'C_HBM_max': 4,
-    #     'filename': '00_1_16.txt',
-    #     'init_class': 'HBMInit',
-    #     'mig_classes': ['NoMigration'],
-    #     'plc_classes': ['PreferHBM']
-    # },
-    # {
-    #     'N': 1024*16,
-    #     'N_pre': 1024,
-    #     'para_num': 0.5,
-    #     'C_HBM_max': 4,
-    #     'filename': '00_1_16.txt',
-    #     'init_class': 'TokenLevelBestRatioInit',
-    #     'mig_classes': ['AlphaMigration'],
-    #     'plc_classes': ['AlphaLayersDistribution']
-    # },
-    {
-        'N': 1024*16,
-        'N_pre': 1024,
-        'para_num': 0.5,
-        'C_HBM_max': 4,
-        'inclusive': True,
-        'filename': '03_1_16.txt',
-        'init_class': 'HBMInit',
-        'mig_classes': ['NoMigration'],
-        'plc_classes': ['PreferHBM']
-    },
-    {
-        'N': 1024*16,
-        'N_pre': 1024,
-        'para_num': 0.5,
-        'C_HBM_max': 4,
-        'filename': '03_1_16.txt',
-        'init_class': 'TokenLevelBestRatioInit',
-        'mig_classes': ['AlphaMigration'],
-        'plc_classes': ['AlphaLayersDistribution']
-    },
-
-]
+def log_name_for(config, tag):
+    return (f"{config['N_pre']}_{config['N']}_"
+            f"{config['para_num']}B_"
+            f"{config['C_HBM_max']}GB_"
+            f"{config['init_class']}_"
+            f"{tag}.txt")
 
 def run_experiment(config):
+    """Run one experiment uncached in a separate simulator.py process."""
     # Generate filename with timestamp
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    log_name = (f"{config['N_pre']}_{config['N']}_"
-                f"{config['para_num']}B_"
-                f"{config['C_HBM_max']}GB_"
-                f"{config['init_class']}_"
-                f"{timestamp}.txt")
-    
+    log_name = log_name_for(config, timestamp)
+
     # Build command
     cmd = [
         'python', 'simulator.py',
@@ -194,12 +48,12 @@ def run_experiment(config):
         '--plc_classes', *config['plc_classes'],
         '--log_file', log_name
     ]
-    
+
     # Run in separate process
     print(f"Starting experiment: {log_name}")
     process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     stdout, stderr = process.communicate()
-    
+
     # Handle results
     if process.returncode == 0:
         print(f"Completed successfully: {log_name}")
@@ -207,11 +61,85 @@ def run_experiment(config):
         print(f"Failed: {log_name}")
         with open(f"ERROR_{log_name}", 'w') as f:
             f.write(stderr.decode())
-    
+
     # Add cooling period between experiments
     time.sleep(10)
 
+def run_cached_experiment(config, cache: ResultCache, log_dir="."):
+    """
+    Simulate the missing cells of one experiment and assemble the full log
+    from the cache. Returns the path of the written log.
+    """
+    from simulator import (CLASS_MAPPING, NoMigration, PreferHBM, build_config, load_skip_lists,
+                           simulate_combination, report_best, report_combination)
+
+    fn = config['filename']
+    inclusive = config.get('inclusive', False)
+    plc_params = config.get('plc_params', {})
+    mig_params = config.get('mig_params', {})
+    init_class = CLASS_MAPPING[config['init_class']]
+    model_config = build_config(config)
+    digest = cache.trace_digest(fn)
+
+    # (placement, migration, best) for the upper bound and every combination
+    cells = [(PreferHBM, NoMigration, True)]
+    cells += [(CLASS_MAPPING[p], CLASS_MAPPING[m], False)
+              for p in config['plc_classes'] for m in config['mig_classes']]
+    keys = [cache.key(model_config, init_class, p_cls, m_cls, digest, inclusive, best,
+                      None if best else plc_params, None if best else mig_params)
+            for p_cls, m_cls, best in cells]
+
+    missing = [(cell, key) for cell, key in zip(cells, keys) if not cache.has(key)]
+    print(f"{len(cells) - len(missing)}/{len(cells)} cells cached for {fn} ({config['init_class']})")
+    if missing:
+        trace = load_skip_lists(fn)
+        initial_state = init_class(copy.deepcopy(model_config), trace, inclusive)
+        for (p_cls, m_cls, best), key in missing:
+            print(f"Simulating {p_cls.__name__} + {m_cls.__name__}{' (best)' if best else ''}")
+            simulator = simulate_combination(initial_state, trace, p_cls, m_cls, best,
+                                             None if best else plc_params,
+                                             None if best else mig_params)
+            alphas = [step['alpha'] for step in simulator.step_details]
+            cache.put(key, {
+                'placement': p_cls.__name__,
+                'migration': m_cls.__name__,
+                'best': best,
+                'total_time': simulator.total_time,
+                'avg_alpha': sum(alphas) / len(alphas),
+            }, alphas)
+
+    # Assemble the log from the cache, named by the hash of all its cell keys
+    # instead of time: the keys cover the trace, classes, parameters and code
+    experiment_digest = hashlib.sha256("".join(keys).encode()).hexdigest()
+    log_path = os.path.join(log_dir, log_name_for(config, experiment_digest[:12]))
+    buffer = io.StringIO()
+    with redirect_stdout(buffer):
+        print(f"Read trace file: {fn}")
+        for (p_cls, m_cls, best), key in zip(cells, keys):
+            result = cache.get(key)
+            if best:
+                report_best(result['total_time'], model_config.N)
+            else:
+                report_combination(f"{p_cls.__name__} + {m_cls.__name__}",
+                                   result['total_time'], result['alphas'].tolist())
+    with open(log_path, "w") as f:
+        f.write(buffer.getvalue())
+    print(f"Wrote {log_path}")
+    return log_path
+
 if __name__ == "__main__":
-    for config in experiments:
-        run_experiment(config)
-        print("="*80)
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--spec', type=str, default="experiments.json")
+    parser.add_argument('--no_cache', action='store_true',
+                        help='Run every experiment uncached in a subprocess')
+    args = parser.parse_args()
+
+    spec = load_spec(args.spec)
+    cache = ResultCache(spec.get('cache_dir', ".result_cache"))
+    for config in spec['experiments']:
+        if args.no_cache:
+            run_experiment(config)
+        else:
+            run_cached_experiment(config, cache, spec.get('log_dir', "."))
+        print("="*80)
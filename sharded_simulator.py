@@ -0,0 +1,132 @@
+# sharded_simulator.py
+# Tensor- and pipeline-parallel serving. Each device holds 1/tp of the heads'
+# KV cache and weights of L/pp layers, with its own HBM, external link,
+# MemStatus and placement/migration instances. A step runs on the devices of
+# the pipeline stage that owns the layer and takes as long as the slowest one.
+import copy
+from memory_status import ModelConfig, BYTES_TO_GB
+from simulator import MemorySimulator, CLASS_MAPPING, build_config, load_skip_lists
+
+class ShardedSimulator():
+    def __init__(self, config: ModelConfig, trace, init_class, p_cls, m_cls,
+                 inclusive: bool = False, device_C_HBM_max: list = None):
+        """
+        device_C_HBM_max: optional HBM capacity in B of every device
+        (tp * pp entries, stage-major), config.C_HBM_max for all by default.
+        """
+        if config.L % config.pp != 0:
+            raise ValueError(f"L={config.L} is not divisible by pp={config.pp}!")
+        self.cfg = config
+        self.L_local = config.L // config.pp
+        num_devices = config.tp * config.pp
+        if device_C_HBM_max is None:
+            device_C_HBM_max = [config.C_HBM_max] * num_devices
+        if len(device_C_HBM_max) != num_devices:
+            raise ValueError(f"Expected {num_devices} device capacities, got {len(device_C_HBM_max)}!")
+
+        # Devices of a stage with the same capacity see the same trace and
+        # strategies, so they evolve identically and are simulated once.
+        self.stages = []
+        for p in range(config.pp):
+            groups = {}
+            for r in range(config.tp):
+                device = p * config.tp + r
+                groups.setdefault(device_C_HBM_max[device], []).append(device)
+            simulators = []
+            for capacity, devices in groups.items():
+                device_cfg = self.device_config(p, capacity)
+                status = init_class(device_cfg, trace, inclusive)
+                simulators.append((devices, MemorySimulator(device_cfg, status,
+                                                            p_cls(device_cfg, status),
+                                                            m_cls(device_cfg, status))))
+            self.stages.append(simulators)
+        self.total_time = 0.0
+        self.step_details = []
+
+    def device_config(self, stage: int, C_HBM_max: float) -> ModelConfig:
+        device_cfg = copy.deepcopy(self.cfg)
+        device_cfg.L = self.L_local
+        device_cfg.para_num = self.cfg.para_num / self.cfg.pp
+        device_cfg.layer_offset = stage * self.L_local
+        device_cfg.C_HBM_max = C_HBM_max
+        device_cfg.C_HBM = 0.0
+        return device_cfg
+
+    def devices(self):
+        """(device ids, simulator) for every simulated device group."""
+        for simulators in self.stages:
+            yield from simulators
+
+    def simulate(self):
+        self.total_time = 0.0
+        self.step_details = []
+
+        for n in range(self.cfg.N_pre, self.cfg.N_pre + self.cfg.N):
+            for l in range(self.cfg.L):
+                stage = self.stages[l // self.L_local]
+                local_l = l % self.L_local
+                for s in [0, 1]:  # MHA and MLP
+                    times = [sim.run_step(n, local_l, s) for _, sim in stage]
+                    if all(t is None for t in times):
+                        continue
+                    slowest = max(range(len(times)), key=lambda i: times[i] or 0.0)
+                    step_time = times[slowest]
+                    self.total_time += step_time
+                    self.step_details.append({
+                        'n': n,
+                        'l': l,
+                        's': s,
+                        'time': step_time,
+                        'alpha': stage[slowest][1].step_details[-1]['alpha'],
+                        'device': stage[slowest][0][0]
+                    })
+        return self.total_time
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--N', type=int, default=1024*10)
+    parser.add_argument('--N_pre', type=int, default=1024*2)
+    parser.add_argument('--para_num', type=float, default=0.5)
+    parser.add_argument('--C_HBM_max', type=int, default=3)
+    parser.add_argument('--inclusive', action='store_true')
+    parser.add_argument('--filename', type=str, default="trace.txt")
+    parser.add_argument('--tp', type=int, default=1)
+    parser.add_argument('--pp', type=int, default=1)
+    parser.add_argument('--device_C_HBM_max', type=float, nargs='+', default=None,
+                        help='HBM capacity (GB) of every device, stage-major')
+    parser.add_argument('--init_class', type=str, required=True)
+    parser.add_argument('--mig_classes', type=str, nargs='+', required=True)
+    parser.add_argument('--plc_classes', type=str, nargs='+', required=True)
+    args = parser.parse_args()
+
+    try:
+        init_class = CLASS_MAPPING[args.init_class]
+        mig_classes = [CLASS_MAPPING[name] for name in args.mig_classes]
+        plc_classes = [CLASS_MAPPING[name] for name in args.plc_classes]
+    except KeyError as e:
+        print(f"Error: Unknown class name {e.args[0]}")
+        sys.exit(1)
+
+    config = build_config(vars(args))
+    capacities = None
+    if args.device_C_HBM_max:
+        capacities = [c * BYTES_TO_GB for c in args.device_C_HBM_max]
+    trace = load_skip_lists(args.filename)
+
+    for p_cls in plc_classes:
+        for m_cls in mig_classes:
+            simulator = ShardedSimulator(config, trace, init_class, p_cls, m_cls,
+                                         args.inclusive, capacities)
+            total_time = simulator.simulate()
+            bottleneck = {}
+            for step in simulator.step_details:
+                bottleneck[step['device']] = bottleneck.get(step['device'], 0) + 1
+            print(f"Combination: {p_cls.__name__} + {m_cls.__name__} (TP={args.tp}, PP={args.pp})")
+            print(f"Total time: {total_time:.4f} ns, {total_time/1e9:.4f} seconds")
+            for devices, sim in simulator.devices():
+                print(f"Devices {devices}: HBM utilization {sim.status.get_HBM_util_rate() * 100:.2f}%, "
+                      f"slowest at {sum(bottleneck.get(d, 0) for d in devices)} steps")
+            print("-" * 50)
@@ -0,0 +1,308 @@
+# shared_prefix.py
+# Concurrent sequences sharing a prompt prefix. The first prefix_len tokens
+# of every sequence are the same and their KV cache lives in reference-
+# counted blocks that are placed once, counted once against HBM capacity and
+# read once per batched decode step (by every sharer that does not skip a
+# token). Each sequence keeps its private tokens in its own MemStatus with
+# its own placement and migration, all sharing one HBM capacity. Weights
+# are read once per batched step.
+import copy
+import math
+import numpy as np
+from memory_status import ModelConfig, BYTES_TO_GB
+from simulator import CLASS_MAPPING, build_config, load_skip_lists, memory_times
+
+NO_SKIPS = []
+
+def trace_skip_tokens(trace, n: int, l: int, s: int):
+    """Skip list object of step (n, l, s), for a SkipTrace or a load_skip_lists trace."""
+    if hasattr(trace, 'skip_tokens'):
+        return trace.skip_tokens(n, l, s)
+    return trace.get(n, NO_SKIPS) if s == 0 else NO_SKIPS
+
+# Trace of the private part of one sequence: token ids and steps shifted by
+# the prefix length, prefix tokens dropped from the skip lists.
+class PrefixTraceView():
+    def __init__(self, trace, offset: int):
+        self.trace = trace
+        self.offset = offset
+        self._cache = (None, None)
+
+    def skip_tokens(self, n: int, l: int, s: int):
+        source = trace_skip_tokens(self.trace, n + self.offset, l, s)
+        # Same source list, same shifted array, so MemStatus can cache by identity
+        if self._cache[0] is not source:
+            skips = np.asarray(source, dtype=np.int64)
+            self._cache = (source, skips[skips >= self.offset] - self.offset)
+        return self._cache[1]
+
+    def get(self, key, default=None):
+        n, l, s = key
+        if not hasattr(self.trace, 'skip_tokens'):
+            return default      # load_skip_lists traces carry no per-step entries
+        info = self.trace.get((n + self.offset, l, s))
+        if info is None:
+            return default
+        return {"skip_token_kv": self.skip_tokens(n, l, s), "skip_layer": info["skip_layer"]}
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+class PrefixBlockTable():
+    def __init__(self, prefix_len: int, block_size: int, L: int, copies: int = 1):
+        """copies: 1 when the prefix is shared, one per sequence otherwise."""
+        self.prefix_len = prefix_len
+        self.block_size = block_size
+        self.num_blocks = math.ceil(prefix_len / block_size)
+        self.block_tokens = np.full(self.num_blocks, block_size)
+        if self.num_blocks:
+            self.block_tokens[-1] = prefix_len - block_size * (self.num_blocks - 1)
+        # 0: HBM, 1: external memory, per (copy, block, layer)
+        self.locations = np.ones((copies, self.num_blocks, L), dtype=np.int8)
+        self.refcount = np.zeros((copies, self.num_blocks), dtype=np.int32)
+
+    def acquire(self, copy_id: int):
+        self.refcount[copy_id] += 1
+
+    def release(self, copy_id: int):
+        """Drop one reference, returns the HBM bytes freed in KV cache entries."""
+        self.refcount[copy_id] -= 1
+        freed = self.refcount[copy_id] == 0
+        entries = int((self.locations[copy_id][freed] == 0).sum(axis=1) @ self.block_tokens[freed]) if freed.any() else 0
+        self.locations[copy_id][freed] = 1
+        return entries
+
+    def place(self, capacity_entries: int) -> int:
+        """
+        Place blocks on HBM, block by block (every copy, all layers) from the
+        start of the prefix. Returns the number of KV cache entries on HBM.
+        """
+        used = 0
+        copies, _, L = self.locations.shape
+        for b in range(self.num_blocks):
+            for c in range(copies):
+                if used + self.block_tokens[b] * L > capacity_entries:
+                    return used
+                self.locations[c, b] = 0
+                used += self.block_tokens[b] * L
+        return used
+
+    def hbm_entries(self) -> int:
+        live = self.refcount > 0
+        return int((((self.locations == 0).sum(axis=2) * live) @ self.block_tokens).sum()) if self.num_blocks else 0
+
+    def token_locations(self, copy_id: int, l: int):
+        return np.repeat(self.locations[copy_id, :, l], self.block_tokens)
+
+class SharedPrefixSimulator():
+    def __init__(self, config: ModelConfig, traces: list, init_class, p_cls, m_cls,
+                 prefix_len: int, inclusive: bool = False, block_size: int = 16,
+                 dedup: bool = True, decode_lengths: list = None):
+        """
+        traces: one trace per sequence, in full-sequence token ids.
+        dedup: share the prefix blocks; False gives every sequence its own copy.
+        decode_lengths: tokens decoded by each sequence (config.N by default).
+        """
+        if prefix_len > config.N_pre:
+            raise ValueError(f"prefix_len={prefix_len} exceeds N_pre={config.N_pre}!")
+        self.cfg = config
+        self.traces = traces
+        self.S = len(traces)
+        self.prefix_len = prefix_len
+        self.inclusive = inclusive
+        self.dedup = dedup
+        self.decode_lengths = decode_lengths or [config.N] * self.S
+        kv_size = config.get_single_KV_cache_size()
+        self.kv_size = kv_size
+
+        # Private part of every sequence, weights are accounted here once
+        self.statuses = []
+        for i, trace in enumerate(traces):
+            private_cfg = copy.deepcopy(config)
+            private_cfg.N_pre = config.N_pre - prefix_len
+            private_cfg.para_num = 0
+            private_cfg.C_HBM_max = 1.0       # placed below, once the shares are known
+            self.statuses.append(init_class(private_cfg, PrefixTraceView(trace, prefix_len), inclusive))
+
+        # Model weights, then the prefix, then the private prefill of every
+        # sequence in an equal share of the rest
+        self.model_weight_ratio = self.statuses[0].model_weight_ratio
+        self.weight_bytes = config.para_num * config.dtype_size / config.tp
+        hbm_weights = self.weight_bytes * self.model_weight_ratio
+        self.prefix = PrefixBlockTable(prefix_len, block_size, config.L, 1 if dedup else self.S)
+        for i in range(self.S):
+            self.prefix.acquire(self.copy_of(i))
+        free_entries = int(max(config.C_HBM_max - hbm_weights, 0) // kv_size)
+        prefix_entries = self.prefix.place(free_entries)
+        share = (config.C_HBM_max - hbm_weights - prefix_entries * kv_size) / self.S
+        for st in self.statuses:
+            # initialize_memory starts over from empty counters
+            st.cfg.C_HBM_max = share
+            st.initialize_memory()
+
+        # One HBM for everything from here on
+        self.shared_cfg = copy.deepcopy(self.statuses[0].cfg)
+        self.shared_cfg.C_HBM_max = config.C_HBM_max
+        self.shared_cfg.C_HBM = (self.weight_bytes * self.model_weight_ratio + prefix_entries * kv_size
+                                 + sum(st.cfg.C_HBM for st in self.statuses))
+        self.placements = []
+        self.migrations = []
+        for st in self.statuses:
+            st.cfg = self.shared_cfg
+            self.placements.append(p_cls(self.shared_cfg, st))
+            self.migrations.append(m_cls(self.shared_cfg, st))
+        self.total_time = 0.0
+        self.step_details = []
+
+    def copy_of(self, i: int) -> int:
+        return 0 if self.dedup else i
+
+    def retire(self, i: int):
+        """Sequence i finished: free its private HBM entries and prefix references."""
+        st = self.statuses[i]
+        self.shared_cfg.C_HBM -= np.count_nonzero(st.locations == 0) * self.kv_size
+        st.locations[st.locations == 0] = 1
+        st.hbm_token_counts = [0] * self.cfg.L
+        self.shared_cfg.C_HBM -= self.prefix.release(self.copy_of(i)) * self.kv_size
+
+    def batch_step_time(self, hbm_read, ext_weights, ext_kv, hbm_write, ext_write,
+                        hbm_MR, hbm_MW, ext_MR, ext_MW) -> float:
+        """Same cost model as MemorySimulator.step_time, over byte totals."""
+        cfg = self.shared_cfg
+        kv_scale = cfg.kv_dtype_size_ext / cfg.kv_dtype_size
+        dequant_bytes = ext_kv + ext_write if kv_scale != 1.0 else 0.0
+        T_HBM, T_ext = memory_times(cfg, hbm_read + hbm_write + hbm_MR + hbm_MW,
+                                    ext_weights + ext_kv * kv_scale, ext_write * kv_scale,
+                                    ext_MR * kv_scale, ext_MW * kv_scale, dequant_bytes)[:2]
+        return max(T_HBM, T_ext)
+
+    def prefix_reads(self, n: int, l: int, active: list):
+        """KV entries of the prefix read from HBM and external memory at (n, l)."""
+        P = self.prefix_len
+        reads = {}
+        for i in active:
+            skips = np.asarray(trace_skip_tokens(self.traces[i], n, l + self.cfg.layer_offset, 0), dtype=np.int64)
+            read = np.ones(P, dtype=bool)
+            read[skips[skips < P]] = False
+            c = self.copy_of(i)
+            reads[c] = reads[c] | read if c in reads else read
+        hbm = ext = 0
+        for c, read in reads.items():
+            locations = self.prefix.token_locations(c, l)
+            hbm += np.count_nonzero(read & (locations == 0))
+            ext += np.count_nonzero(read & (locations == 1))
+        return hbm, ext
+
+    def simulate(self):
+        self.total_time = 0.0
+        self.step_details = []
+        cfg = self.cfg
+        P = self.prefix_len
+        weight_attn = 4 * cfg.d**2 * cfg.dtype_size / cfg.tp
+        weight_mlp = 2 * cfg.d * cfg.d_ff * cfg.dtype_size / cfg.tp
+        retired = set()
+
+        for n in range(cfg.N_pre, cfg.N_pre + cfg.N):
+            for i in range(self.S):
+                if i not in retired and n - cfg.N_pre >= self.decode_lengths[i]:
+                    self.retire(i)
+                    retired.add(i)
+            active = [i for i in range(self.S) if i not in retired]
+            if not active:
+                break
+            n_private = n - P
+            for l in range(cfg.L):
+                for s in [0, 1]:  # MHA and MLP
+                    weights = weight_attn if s == 0 else weight_mlp
+                    hbm_read = self.model_weight_ratio * weights
+                    ext_weights = (1 - self.model_weight_ratio) * weights
+                    hbm_kv = ext_kv = 0
+                    if s == 0:
+                        hbm_kv, ext_kv = self.prefix_reads(n, l, active)
+                    hbm_write = ext_write = 0.0
+                    migration = np.zeros(4)
+                    for i in active:
+                        st = self.statuses[i]
+                        if st.get_step_info(n_private, l, s)["skip_layer"]:
+                            continue
+                        if s == 0:
+                            skips = st.get_skip_token_array(n_private, l, s)
+                            on_hbm = st.hbm_token_counts[l] - int(np.count_nonzero(st.locations[skips, l] == 0))
+                            hbm_kv += on_hbm
+                            ext_kv += n_private - len(skips) - on_hbm
+                        beta = self.placements[i].beta_strategy(n_private, l, s)
+                        _, D_W = st.calculate_data_sizes(n_private, l, s)
+                        hbm_write += beta * D_W
+                        ext_write += (1.0 if self.inclusive else 1 - beta) * D_W
+                        st.record_access(n_private, l, s)
+                        migration += self.migrations[i].migration_strategy(n_private, l, s)
+
+                    hbm_read += hbm_kv * self.kv_size
+                    step_time = self.batch_step_time(hbm_read, ext_weights, ext_kv * self.kv_size,
+                                                     hbm_write, ext_write, *migration)
+                    self.total_time += step_time
+                    read = hbm_read + ext_weights + ext_kv * self.kv_size
+                    self.step_details.append({
+                        'n': n,
+                        'l': l,
+                        's': s,
+                        'time': step_time,
+                        'alpha': hbm_read / read if read > 0 else 0.0,
+                        'sequences': len(active)
+                    })
+        return self.total_time
+
+    def hbm_breakdown(self) -> dict:
+        """HBM bytes of weights, shared prefix and private KV caches."""
+        return {
+            'weights': self.weight_bytes * self.model_weight_ratio,
+            'prefix': self.prefix.hbm_entries() * self.kv_size,
+            'private': float(sum(np.count_nonzero(st.locations == 0) for st in self.statuses) * self.kv_size),
+        }
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--N', type=int, default=1024*10)
+    parser.add_argument('--N_pre', type=int, default=1024*2)
+    parser.add_argument('--para_num', type=float, default=0.5)
+    parser.add_argument('--C_HBM_max', type=int, default=3)
+    parser.add_argument('--inclusive', action='store_true')
+    parser.add_argument('--filenames', type=str, nargs='+', default=["trace.txt"],
+                        help='One trace per sequence')
+    parser.add_argument('--sequences', type=int, default=None,
+                        help='Concurrent sequences, cycling through the traces (one per trace by default)')
+    parser.add_argument('--prefix_len', type=int, required=True)
+    parser.add_argument('--block_size', type=int, default=16)
+    parser.add_argument('--init_class', type=str, required=True)
+    parser.add_argument('--mig_classes', type=str, nargs='+', required=True)
+    parser.add_argument('--plc_classes', type=str, nargs='+', required=True)
+    args = parser.parse_args()
+
+    try:
+        init_class = CLASS_MAPPING[args.init_class]
+        mig_classes = [CLASS_MAPPING[name] for name in args.mig_classes]
+        plc_classes = [CLASS_MAPPING[name] for name in args.plc_classes]
+    except KeyError as e:
+        print(f"Error: Unknown class name {e.args[0]}")
+        sys.exit(1)
+
+    config = build_config(vars(args))
+    loaded = [load_skip_lists(fn) for fn in args.filenames]
+    sequences = args.sequences or len(loaded)
+    traces = [loaded[i % len(loaded)] for i in range(sequences)]
+
+    for p_cls in plc_classes:
+        for m_cls in mig_classes:
+            print(f"Combination: {p_cls.__name__} + {m_cls.__name__} ({sequences} sequences, prefix {args.prefix_len})")
+            for dedup in [True, False]:
+                simulator = SharedPrefixSimulator(copy.deepcopy(config), traces, init_class, p_cls, m_cls,
+                                                  args.prefix_len, args.inclusive, args.block_size, dedup)
+                breakdown = simulator.hbm_breakdown()
+                total_time = simulator.simulate()
+                print(f"{'Shared' if dedup else 'Per-sequence'} prefix: {total_time/1e9:.4f} seconds, "
+                      f"HBM at start: prefix {breakdown['prefix']/BYTES_TO_GB:.3f} GB, "
+                      f"private {breakdown['private']/BYTES_TO_GB:.3f} GB")
+            print("-" * 50)
@@ -0,0 +1,224 @@
+# sim_server.py
+# Long-lived local simulation server. Loaded traces and initialized MemStatus
+# snapshots stay in memory (LRU), so repeated what-if queries only pay for
+# the simulation itself. Jobs and results are JSON, one object per line,
+# over a Unix socket or localhost TCP.
+import copy
+import json
+import os
+import socket
+import socketserver
+import time
+from collections import OrderedDict
+from simulator import (CLASS_MAPPING, NoMigration, PreferHBM, build_config, load_skip_lists,
+                       simulate_combination, average_alpha)
+from result_cache import config_fields
+
+class LRUCache():
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {'size': len(self.entries), 'capacity': self.capacity,
+                'hits': self.hits, 'misses': self.misses}
+
+class SimulationService():
+    def __init__(self, max_traces: int = 4, max_states: int = 8):
+        self.traces = LRUCache(max_traces)
+        self.states = LRUCache(max_states)
+
+    def get_trace(self, filename: str):
+        """Return (trace_key, trace). The key changes when the file changes."""
+        st = os.stat(filename)
+        trace_key = f"{os.path.abspath(filename)}:{st.st_size}:{st.st_mtime_ns}"
+        trace = self.traces.get(trace_key)
+        if trace is None:
+            trace = load_skip_lists(filename)
+            self.traces.put(trace_key, trace)
+        return trace_key, trace
+
+    def get_initial_state(self, trace_key, trace, config, init_class, inclusive):
+        """Return the initialized MemStatus snapshot for (trace, config, init)."""
+        state_key = (trace_key, json.dumps(config_fields(config), sort_keys=True, default=str),
+                     init_class.__name__, inclusive)
+        state = self.states.get(state_key)
+        if state is None:
+            state = init_class(copy.deepcopy(config), trace, inclusive)
+            self.states.put(state_key, state)
+        return state
+
+    def simulate(self, job: dict) -> dict:
+        """
+        Run a job: the same keys as a run_experiments.py experiment, plus
+        optional 'best' (run the upper bound) and 'alphas' (return alpha series).
+        """
+        start = time.perf_counter()
+        init_class = CLASS_MAPPING[job['init_class']]
+        plc_classes = [CLASS_MAPPING[name] for name in job['plc_classes']]
+        mig_classes = [CLASS_MAPPING[name] for name in job['mig_classes']]
+        config = build_config(job)
+        inclusive = job.get('inclusive', False)
+
+        trace_key, trace = self.get_trace(job.get('filename', "trace.txt"))
+        initial_state = self.get_initial_state(trace_key, trace, config, init_class, inclusive)
+        setup_time = time.perf_counter() - start
+
+        response = {'setup_seconds': setup_time, 'results': []}
+        if job.get('best', False):
+            best_simulator = simulate_combination(initial_state, trace, PreferHBM, NoMigration, best=True)
+            response['best_time'] = best_simulator.total_time
+        for p_cls in plc_classes:
+            for m_cls in mig_classes:
+                simulator = simulate_combination(initial_state, trace, p_cls, m_cls,
+                                                 plc_params=job.get('plc_params'),
+                                                 mig_params=job.get('mig_params'))
+                result = {
+                    'placement': p_cls.__name__,
+                    'migration': m_cls.__name__,
+                    'total_time': simulator.total_time,
+                    'avg_alpha': average_alpha(simulator.step_details),
+                }
+                if job.get('alphas', False):
+                    result['alphas'] = [step['alpha'] for step in simulator.step_details]
+                response['results'].append(result)
+        response['total_seconds'] = time.perf_counter() - start
+        return response
+
+    def handle(self, request: dict) -> dict:
+        op = request.get('op', 'simulate')
+        if op == 'simulate':
+            return self.simulate(request['job'])
+        if op == 'stats':
+            return {'traces': self.traces.stats(), 'states': self.states.stats()}
+        if op == 'ping':
+            return {'pong': True}
+        raise ValueError(f"Unknown op '{op}'")
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                response = {'ok': True, **self.server.service.handle(json.loads(line))}
+            except Exception as e:
+                response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+            self.wfile.write((json.dumps(response) + "\n").encode())
+            self.wfile.flush()
+
+class UnixSimulationServer(socketserver.UnixStreamServer):
+    def __init__(self, path, service: SimulationService):
+        self.service = service
+        super().__init__(path, RequestHandler)
+
+class TCPSimulationServer(socketserver.TCPServer):
+    allow_reuse_address = True
+
+    def __init__(self, port, service: SimulationService):
+        self.service = service
+        super().__init__(("127.0.0.1", port), RequestHandler)
+
+def connect(socket_path: str = None, port: int = None) -> socket.socket:
+    if socket_path:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(socket_path)
+    else:
+        sock = socket.create_connection(("127.0.0.1", port))
+    return sock
+
+def request(payload: dict, socket_path: str = None, port: int = None) -> dict:
+    """Send one request to a running server and return its JSON response."""
+    with connect(socket_path, port) as sock:
+        sock.sendall((json.dumps(payload) + "\n").encode())
+        with sock.makefile("rb") as f:
+            return json.loads(f.readline())
+
+def submit(job: dict, socket_path: str = None, port: int = None) -> dict:
+    return request({'op': 'simulate', 'job': job}, socket_path, port)
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['serve', 'submit', 'stats'])
+    parser.add_argument('--socket', type=str, default=None, help='Unix socket path')
+    parser.add_argument('--port', type=int, default=8765, help='localhost TCP port if no socket')
+    parser.add_argument('--max_traces', type=int, default=4)
+    parser.add_argument('--max_states', type=int, default=8)
+    # Job parameters for submit
+    parser.add_argument('--N', type=int, default=1024*10)
+    parser.add_argument('--N_pre', type=int, default=1024*2)
+    parser.add_argument('--para_num', type=float, default=0.5)
+    parser.add_argument('--C_HBM_max', type=int, default=3)
+    parser.add_argument('--inclusive', action='store_true')
+    parser.add_argument('--filename', type=str, default="trace.txt")
+    parser.add_argument('--init_class', type=str, default='HBMInit')
+    parser.add_argument('--mig_classes', type=str, nargs='+', default=['NoMigration'])
+    parser.add_argument('--plc_classes', type=str, nargs='+', default=['PreferHBM'])
+    parser.add_argument('--best', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        service = SimulationService(args.max_traces, args.max_states)
+        if args.socket:
+            if os.path.exists(args.socket):
+                os.remove(args.socket)
+            server = UnixSimulationServer(args.socket, service)
+        else:
+            server = TCPSimulationServer(args.port, service)
+        print(f"Serving simulations on {args.socket or f'127.0.0.1:{args.port}'}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if args.socket and os.path.exists(args.socket):
+                os.remove(args.socket)
+        sys.exit(0)
+
+    if args.command == 'stats':
+        print(json.dumps(request({'op': 'stats'}, args.socket, args.port), indent=2))
+        sys.exit(0)
+
+    job = {
+        'N': args.N,
+        'N_pre': args.N_pre,
+        'para_num': args.para_num,
+        'C_HBM_max': args.C_HBM_max,
+        'inclusive': args.inclusive,
+        'filename': os.path.abspath(args.filename),
+        'init_class': args.init_class,
+        'mig_classes': args.mig_classes,
+        'plc_classes': args.plc_classes,
+        'best': args.best,
+    }
+    response = submit(job, args.socket, args.port)
+    if not response['ok']:
+        print(f"Simulation failed: {response['error']}")
+        sys.exit(1)
+    if 'best_time' in response:
+        print(f"Best: {response['best_time']/1e9:.4f} seconds")
+    for result in response['results']:
+        print(f"Combination: {result['placement']} + {result['migration']}")
+        print(f"Total time: {result['total_time']:.4f} ns, {result['total_time']/1e9:.4f} seconds")
+        print(f"Avg alpha: {result['avg_alpha']:.6f}")
+    print(f"Setup: {response['setup_seconds']:.3f} s, total: {response['total_seconds']:.3f} s")
@@ -1,17 +1,48 @@
 import numpy as np
 import math
-import matplotlib.pyplot as plt
 import random
 from abc import ABC, abstractmethod
-from memory_status import ModelConfig, MemStatus, HBMInit, TokenLevelBestRatioInit
-from placement import BaseStrategy, PreferHBM, SplitToken, BatchRatio, LookAheadBatch, LayerImportance, AlphaLayersDistribution
-from migration import BaseDataMigration, NoMigration, PriorMigration, SkippedTokensMigration, PastWindowMigration, LookAheadMigration, LookAheadBatchMigration, AlphaMigration
+from skip_trace import load_skip_trace
+from memory_status import ModelConfig, MemoryTier, MemStatus, HBMInit, TokenLevelBestRatioInit, LayerSplitInit, ImportanceRankedInit, SinkWindowInit
+from placement import BaseStrategy, PreferHBM, SplitToken, BatchRatio, LookAheadBatch, LayerImportance, AlphaLayersDistribution, PredictedPlacement
+from migration import BaseDataMigration, NoMigration, PriorMigration, SkippedTokensMigration, PastWindowMigration, LookAheadMigration, LookAheadBatchMigration, AlphaMigration, LRUMigration, LFUMigration, ARCMigration, PredictedMigration, WindowDrainMigration
 import copy
 import csv
 import re
+import time
 
 BYTES_TO_GB = 1024**3
 
+# Mapping from string names to actual classes
+CLASS_MAPPING = {
+    # Initialization classes
+    'HBMInit': HBMInit,
+    'TokenLevelBestRatioInit': TokenLevelBestRatioInit,
+    'LayerSplitInit': LayerSplitInit,
+    'ImportanceRankedInit': ImportanceRankedInit,
+    'SinkWindowInit': SinkWindowInit,
+    
+    # Migration classes
+    'NoMigration': NoMigration,
+    'AlphaMigration': AlphaMigration,
+    'LookAheadBatchMigration': LookAheadBatchMigration,
+    'LookAheadMigration': LookAheadMigration,
+    'PriorMigration': PriorMigration,
+    'PastWindowMigration': PastWindowMigration,
+    'LRUMigration': LRUMigration,
+    'LFUMigration': LFUMigration,
+    'ARCMigration': ARCMigration,
+    'PredictedMigration': PredictedMigration,
+    'WindowDrainMigration': WindowDrainMigration,
+    # Placement classes
+    'PreferHBM': PreferHBM,
+    'BatchRatio': BatchRatio,
+    'LookAheadBatch': LookAheadBatch,
+    'LayerImportance': LayerImportance,
+    'AlphaLayersDistribution': AlphaLayersDistribution,
+    'PredictedPlacement': PredictedPlacement,
+}
+
 # def load_trace(filename="trace.txt"):
 #     trace = {}
 #     pattern = re.compile(r"^([^,]+),([^,]+),([^,]+),(\[.*?\]),(.+)$")
@@ -30,6 +61,31 @@ BYTES_TO_GB = 1024**3
 #                 raise ValueError("Line doesn't match expected format: " + line)
 #     return trace
 
+def memory_times(cfg: ModelConfig, hbm_bytes: float, ext_read_bytes: float, ext_write_bytes: float,
+                 ext_MR: float, ext_MW: float, dequant_bytes: float = 0.0) -> tuple:
+    """
+    The cost model of one step over its byte totals, external bytes as
+    stored. Returns (T_HBM, T_ext, T_ext_read, T_ext_write,
+    T_ext_read_migration, T_ext_internal, T_dequant); the step takes
+    max(T_HBM, T_ext).
+    """
+    T_HBM = hbm_bytes / cfg.B_HBM  # in ns
+    T_dequant = dequant_bytes / cfg.B_dequant if cfg.B_dequant > 0 else 0.0
+    
+    # New external read calculation using interface vs internal minimum
+    ext_read = ext_read_bytes / min(cfg.B_ext_interface_R, 
+                                    cfg.B_ext_internal)
+    
+    # New write + migration calculation
+    write_migration = (ext_write_bytes + ext_MW) / cfg.B_ext_interface_W if cfg.B_ext_interface_R > 0 else 0
+    internal_migration = (ext_write_bytes + ext_MW + ext_MR) / cfg.B_ext_internal if cfg.B_ext_internal > 0 else 0
+    read_migration = ext_MR / cfg.B_ext_interface_R if cfg.B_ext_interface_R > 0 else 0
+    
+    ext_write_migration = max(write_migration, read_migration, internal_migration)
+    
+    T_ext = ext_read + ext_write_migration + T_dequant
+    return T_HBM, T_ext, ext_read, write_migration, read_migration, internal_migration, T_dequant
+
 def load_skip_lists(filename="trace.txt"):
     trace = {}
     pattern = re.compile(r"^([^,]+),([^,]+),([^,]+),(\[.*?\]),(.+)$")
@@ -48,9 +104,68 @@ def load_skip_lists(filename="trace.txt"):
                 raise ValueError("Line doesn't match expected format: " + line)
     return trace
 
+# Cumulative wall time, calls, migrated bytes and touched (token, layer)
+# entries of every simulator hook, keyed by (hook, class name)
+class HookProfile():
+    def __init__(self):
+        self.stats = {}
+
+    def record(self, hook: str, owner, elapsed: float, migrated: float = 0.0, touched: int = 0):
+        key = (hook, type(owner).__name__)
+        entry = self.stats.get(key)
+        if entry is None:
+            entry = self.stats[key] = {'calls': 0, 'time': 0.0, 'bytes': 0.0, 'touched': 0}
+        entry['calls'] += 1
+        entry['time'] += elapsed
+        entry['bytes'] += migrated
+        entry['touched'] += touched
+
+    def summary(self) -> list:
+        """One row per (hook, class), slowest first."""
+        rows = [dict(hook=hook, cls=cls, **entry) for (hook, cls), entry in self.stats.items()]
+        return sorted(rows, key=lambda row: row['time'], reverse=True)
+
+# Time of every step attributed to the resource that bounds it, and the
+# time lost against the best-alpha ideal per layer and per token range
+class BottleneckAttribution():
+    BOUNDS = ['HBM', 'ext_read', 'ext_write', 'ext_read_migration', 'ext_internal', 'dequant']
+
+    def __init__(self, config: ModelConfig, token_bucket: int = 1024):
+        self.N_pre = config.N_pre
+        self.token_bucket = token_bucket
+        self.bound_time = dict.fromkeys(self.BOUNDS, 0.0)
+        self.bound_steps = dict.fromkeys(self.BOUNDS, 0)
+        self.total_time = 0.0
+        self.ideal_time = 0.0
+        self.lost_by_layer = np.zeros(config.L)
+        self.lost_by_range = {}
+
+    def bound(self, breakdown: dict) -> str:
+        """Resource whose time is the step time."""
+        if breakdown['T_HBM'] >= breakdown['T_ext']:
+            return 'HBM'
+        terms = {'ext_read': breakdown['T_ext_read'], 'dequant': breakdown['T_dequant'],
+                 'ext_write': breakdown['T_ext_write'],
+                 'ext_read_migration': breakdown['T_ext_read_migration'],
+                 'ext_internal': breakdown['T_ext_internal']}
+        return max(terms, key=terms.get)
+
+    def add(self, n: int, l: int, breakdown: dict, ideal: float):
+        step_time = breakdown['time']
+        bound = self.bound(breakdown)
+        self.bound_time[bound] += step_time
+        self.bound_steps[bound] += 1
+        self.total_time += step_time
+        self.ideal_time += ideal
+        lost = step_time - ideal
+        self.lost_by_layer[l] += lost
+        start = self.N_pre + (n - self.N_pre) // self.token_bucket * self.token_bucket
+        self.lost_by_range[start] = self.lost_by_range.get(start, 0.0) + lost
+
 class MemorySimulator(ABC):
     def __init__(self, config: ModelConfig, status: MemStatus,
-                placement: BaseStrategy, migration: BaseDataMigration, best: bool = False):
+                placement: BaseStrategy, migration: BaseDataMigration, best: bool = False,
+                profile: bool = False, attribution: bool = False):
         self.cfg = config
         self.plc = placement
         self.mig = migration
@@ -58,14 +173,111 @@ class MemorySimulator(ABC):
         self.best = best
         self.total_time = 0.0
         self.step_details = []
+        # Per-hook timing, only collected when profile is set
+        self.profile = HookProfile() if profile else None
+        # Bound resource and lost time of every step, only when attribution is set
+        self.attribution = BottleneckAttribution(config) if attribution else None
+        # Called as observer.after_token(simulator, n) once every token is decoded
+        self.observers = []
+        # Hooks run_step calls, timed when profiling
+        self.alpha_hook = placement.alpha_strategy
+        self.beta_hook = placement.beta_strategy
+        self.migration_hook = migration.migration_strategy
+        self.cost_hook = self.calculate_step_time
+        if self.profile is not None:
+            self.alpha_hook = self.timed('alpha', placement, self.alpha_hook)
+            self.beta_hook = self.timed('beta', placement, self.beta_hook)
+            self.migration_hook = self.timed('migration', migration, self.migration_hook, moved=True)
+            self.cost_hook = self.timed('cost', self, self.cost_hook)
+
+    def timed(self, hook: str, owner, fn, moved: bool = False):
+        """
+        Wrap fn to record its time and location updates in the profile; for
+        migrations also the bytes moved (hbm_MW + ext_MW).
+        """
+        clock = time.perf_counter
+        status = self.status
+        profile = self.profile
+
+        def timed_hook(*args):
+            updates = status.location_updates
+            start = clock()
+            result = fn(*args)
+            elapsed = clock() - start
+            profile.record(hook, owner, elapsed, result[1] + result[3] if moved else 0.0,
+                           status.location_updates - updates)
+            return result
+        return timed_hook
 
     def calculate_step_time(self, n: int, l: int, s: int, 
                        alpha, beta: float, 
                        hbm_MR: float, hbm_MW: float,
-                       ext_MR: float, ext_MW: float):
-        """Calculate time consumption for one step"""
+                       ext_MR: float, ext_MW: float, sizes: tuple = None):
+        """Calculate time consumption for one step, sizes overrides the (D_R, D_W) of the trace"""
+        if self.attribution is None:
+            return self.step_time(n, l, s, alpha, beta, hbm_MR, hbm_MW, ext_MR, ext_MW, sizes)
+        breakdown = self.step_time_breakdown(n, l, s, alpha, beta, hbm_MR, hbm_MW, ext_MR, ext_MW, sizes)
+        self.attribution.add(n, l, breakdown, self.ideal_step_time(n, l, s, beta, sizes))
+        return breakdown['time']
+
+    def ideal_step_time(self, n: int, l: int, s: int, beta: float, sizes: tuple = None) -> float:
+        """Step time at the best alpha (capped by the HBM capacity) without migrations."""
+        D_R, D_W = sizes if sizes is not None else self.status.calculate_data_sizes(n, l, s)
+        if D_R <= 0:
+            return 0.0
+        alpha = min(self.cfg.C_HBM_max / D_R, self.cfg.best_alpha)
+        return self.step_time(n, l, s, alpha, beta, 0, 0, 0, 0, (D_R, D_W))
+
+    def step_time(self, n: int, l: int, s: int,
+                  alpha, beta: float,
+                  hbm_MR: float, hbm_MW: float,
+                  ext_MR: float, ext_MW: float, sizes: tuple = None) -> float:
+        """
+        Time of one step, max(T_HBM, T_ext). The lean path of every step;
+        sizes overrides the (D_R, D_W) of the trace.
+        """
+        T_HBM, T_ext = self._step_terms(n, l, s, alpha, beta, hbm_MR, hbm_MW, ext_MR, ext_MW, sizes)[:2]
+        return max(T_HBM, T_ext)
+
+    def step_time_breakdown(self, n: int, l: int, s: int,
+                            alpha, beta: float,
+                            hbm_MR: float, hbm_MW: float,
+                            ext_MR: float, ext_MW: float, sizes: tuple = None) -> dict:
+        """
+        Bytes and time of every component of one step, for the timeline and
+        attribution. External bytes are stored bytes.
+        """
+        (T_HBM, T_ext, ext_read, write_migration, read_migration, internal_migration, T_dequant,
+         HBM_read, HBM_write, HBM_migration, ext_read_bytes, ext_write, ext_migration) = \
+            self._step_terms(n, l, s, alpha, beta, hbm_MR, hbm_MW, ext_MR, ext_MW, sizes)
+        return {
+            'time': max(T_HBM, T_ext),
+            'T_HBM': T_HBM,
+            'T_ext': T_ext,
+            'T_ext_read': ext_read,
+            'T_ext_write_migration': max(write_migration, read_migration, internal_migration),
+            'T_ext_write': write_migration,
+            'T_ext_read_migration': read_migration,
+            'T_ext_internal': internal_migration,
+            'T_dequant': T_dequant,
+            'hbm_read': HBM_read,
+            'hbm_write': HBM_write,
+            'hbm_migration': HBM_migration,
+            'ext_read': ext_read_bytes,
+            'ext_write': ext_write,
+            'ext_migration': ext_migration,
+        }
+
+    def _step_terms(self, n: int, l: int, s: int,
+                    alpha, beta: float,
+                    hbm_MR: float, hbm_MW: float,
+                    ext_MR: float, ext_MW: float, sizes: tuple = None) -> tuple:
+        """
+        The times of memory_times followed by the bytes of one step: HBM read,
+        write and migration, external read, write and migration.
+        """
         # Calculate data sizes
-        D_R, D_W = self.status.calculate_data_sizes(n, l, s)
+        D_R, D_W = sizes if sizes is not None else self.status.calculate_data_sizes(n, l, s)
         # should modify the way to calculate time, inclusive / exclusive
         # represents the ratio of KV cache.
         # Calculate HBM time
@@ -81,27 +293,53 @@ class MemorySimulator(ABC):
         HBM_read = alpha * D_R
         HBM_write = beta * D_W
         HBM_migration = hbm_MR + hbm_MW
-        T_HBM = (HBM_read + HBM_write + HBM_migration) / self.cfg.B_HBM  # in ns
-        
-        
-        # New external read calculation using interface vs internal minimum
-        ext_read = (1 - alpha) * D_R / min(self.cfg.B_ext_interface_R, 
-                                        self.cfg.B_ext_internal)
         
-        # New write + migration calculation
-        write_migration = 0.0
-        internal_migration = 0.0
+        # KV caches on the external memory may be stored at a smaller dtype
+        kv_scale = self.status.get_ext_KV_scale()
+        dequant_bytes = 0.0
+        if kv_scale != 1.0:
+            ext_weights, ext_kv = self.status.split_external_read(n, l, s, alpha, D_R)
+            ext_read_bytes = ext_weights + ext_kv * kv_scale
+            dequant_bytes = ext_kv + beta_ext * D_W
+            D_W = D_W * kv_scale
+            ext_MR = ext_MR * kv_scale
+            ext_MW = ext_MW * kv_scale
+        else:
+            ext_read_bytes = (1 - alpha) * D_R
 
-        write_migration = (beta_ext * D_W + ext_MW) / self.cfg.B_ext_interface_W if self.cfg.B_ext_interface_R > 0 else 0
-        internal_migration = (beta_ext * D_W + ext_MW + ext_MR) / self.cfg.B_ext_internal if self.cfg.B_ext_internal > 0 else 0
-        read_migration = ext_MR / self.cfg.B_ext_interface_R if self.cfg.B_ext_interface_R > 0 else 0
-        
-        ext_write_migration = max(write_migration, read_migration, internal_migration)
+        times = memory_times(self.cfg, HBM_read + HBM_write + HBM_migration,
+                             ext_read_bytes, beta_ext * D_W, ext_MR, ext_MW, dequant_bytes)
+        return times + (HBM_read, HBM_write, HBM_migration, ext_read_bytes, beta_ext * D_W, ext_MR + ext_MW)
+    
+    def run_step(self, n: int, l: int, s: int):
+        """Simulate one step, returns its time (None if the layer is skipped)."""
+        step_info = self.status.get_step_info(n, l, s)
+        # If this layer is skipped in the trace, no data is processed.
+        if step_info["skip_layer"]:
+            return None
+        # Get strategies
+        alpha = self.alpha_hook(n, l, s)
+        beta = self.beta_hook(n, l, s)
+        self.status.record_access(n, l, s)
+        migration_data = self.migration_hook(n, l, s)
         
-        T_ext = ext_read + ext_write_migration
+        # Calculate step time
+        step_time = self.cost_hook(n, l, s, alpha, beta, 
+                                   migration_data[0], migration_data[1],
+                                   migration_data[2], migration_data[3])
+        self.total_time += step_time
         
-        return max(T_HBM, T_ext)
-    
+        # Record step details
+        self.step_details.append({
+            'n': n,
+            'l': l,
+            's': s,
+            'time': step_time,
+            'alpha': alpha,
+            'beta': beta
+        })
+        return step_time
+
     def simulate(self):
         """
         Run full simulation
@@ -116,46 +354,127 @@ class MemorySimulator(ABC):
         for n in range(self.cfg.N_pre, self.cfg.N_pre + self.cfg.N):
             for l in range(self.cfg.L):
                 for s in [0, 1]:  # MHA and MLP
-                    step_info = self.status.trace.get((n, l, s), {"skip_token_kv": [], "skip_layer": False})
-                    # If this layer is skipped in the trace, no data is processed.
-                    if step_info["skip_layer"]:
-                        continue
-                    # Get strategies
-                    alpha = self.plc.alpha_strategy(n, l, s)
-                    beta = self.plc.beta_strategy(n, l, s)
-                    migration_data = self.mig.migration_strategy(n, l, s)
-                    
-                    # Calculate step time
-                    step_time = self.calculate_step_time(n, l, s, alpha, beta, 
-                                                         migration_data[0], migration_data[1],
-                                                         migration_data[2], migration_data[3])
-                    self.total_time += step_time
-                    
-                    # Record step details
-                    self.step_details.append({
-                        'n': n,
-                        'l': l,
-                        's': s,
-                        'time': step_time,
-                        'alpha': alpha,
-                        'beta': beta
-                    })
+                    self.run_step(n, l, s)
+            for observer in self.observers:
+                observer.after_token(self, n)
         return self.total_time
 
+def build_config(config_params: dict) -> ModelConfig:
+    """Create a ModelConfig from an experiment parameter dict."""
+    config = ModelConfig(
+        N=config_params.get('N', 1024*10),
+        N_pre=config_params.get('N_pre', 1024*2),
+        para_num=config_params.get('para_num', 0.5),
+        C_HBM_max=config_params.get('C_HBM_max', 3)
+    )
+    config.tp = config_params.get('tp', 1)
+    config.pp = config_params.get('pp', 1)
+    config.n_sink = config_params.get('n_sink', 4)
+    config.window = config_params.get('window', 1024)
+    # Grouped-query attention and KV cache dtypes (bytes per element)
+    config.n_kv_heads = config_params.get('n_kv_heads', config.h)
+    config.kv_dtype_size = config_params.get('kv_dtype_size', config.dtype_size)
+    config.kv_dtype_size_ext = config_params.get('kv_dtype_size_ext', config.kv_dtype_size)
+    config.B_dequant = config_params.get('B_dequant', 0.0)
+    if config_params.get('tiers'):
+        # e.g. {"name": "CXL", "capacity_GB": 64, "B_read": 64, "B_write": 64}
+        config.set_tiers([MemoryTier(t['name'],
+                                     t['capacity_GB'] * BYTES_TO_GB if t.get('capacity_GB') is not None else math.inf,
+                                     t['B_read'], t['B_write'], t.get('B_internal', math.inf),
+                                     t.get('kv_dtype_size'))
+                          for t in config_params['tiers']])
+    return config
+
+def simulate_combination(initial_state: MemStatus, trace, p_cls, m_cls, best: bool = False,
+                         plc_params: dict = None, mig_params: dict = None,
+                         simulator_cls=None, **simulator_kwargs):
+    """
+    Simulate one placement + migration combination on a copy of initial_state.
+    The trace is shared with the copy instead of being deep-copied.
+    simulator_cls selects the engine (MemorySimulator by default).
+    """
+    test_initial_state = copy.deepcopy(initial_state, {id(trace): trace})
+    test_initial_state.trace = trace
+    mig_instance = m_cls(test_initial_state.cfg, test_initial_state)
+    placement_instance = p_cls(test_initial_state.cfg, test_initial_state)
+    apply_params(mig_instance, mig_params)
+    apply_params(placement_instance, plc_params)
+    
+    simulator_cls = simulator_cls or MemorySimulator
+    simulator = simulator_cls(test_initial_state.cfg, test_initial_state, 
+                              placement_instance, mig_instance, best=best, **simulator_kwargs)
+    simulator.simulate()
+    return simulator
+
+def average_alpha(step_details) -> float:
+    return sum(step['alpha'] for step in step_details) / len(step_details)
+
+def apply_params(instance, params: dict):
+    """Override strategy parameters (e.g. window_size, batch_size) on an instance."""
+    for name, value in (params or {}).items():
+        if not hasattr(instance, name):
+            raise ValueError(f"{type(instance).__name__} has no parameter '{name}'")
+        setattr(instance, name, value)
+
+def report_best(upper_bound_time: float, N: int):
+    print(f"Best Combination:")
+    print(f"Total simulation time: {upper_bound_time:.4f} ns, {upper_bound_time/1e9:.4f} seconds")
+    print(f"Average time per token: {upper_bound_time/N:.6f} ns")
+    print("-" * 50)
+
+def report_combination(name: str, total_time: float, alphas):
+    avg_alpha = sum(alphas) / len(alphas)
+    print(f"Combination: {name}")
+    print(f"Total time: {total_time:.4f} ns, {total_time/1e9:.4f} seconds")
+    print(f"Avg alpha: {avg_alpha:.6f}")
+    print(f"Alphas:")
+    for alpha in alphas:
+        print(f"{alpha:.4f}")
+    print("-" * 50)
+
+def report_profile(profile: HookProfile):
+    """Print the per-hook profile of a simulation run with profile=True."""
+    rows = profile.summary()
+    total = sum(row['time'] for row in rows)
+    print("Profile:")
+    print(f"{'hook':<10}{'class':<28}{'calls':>10}{'total s':>10}{'share':>8}{'us/call':>10}"
+          f"{'MB/call':>10}{'touched/call':>14}")
+    for row in rows:
+        calls = max(row['calls'], 1)
+        share = row['time'] / total if total > 0 else 0.0
+        print(f"{row['hook']:<10}{row['cls']:<28}{row['calls']:>10}{row['time']:>10.3f}{share*100:>7.1f}%"
+              f"{row['time']/calls*1e6:>10.2f}{row['bytes']/calls/1024**2:>10.3f}{row['touched']/calls:>14.2f}")
+    print("-" * 50)
+
+def report_attribution(attribution: BottleneckAttribution, top: int = 5):
+    """Print where the time of a run went and where it lost time against the ideal."""
+    total = attribution.total_time
+    print("Bottlenecks:")
+    for bound in attribution.BOUNDS:
+        share = attribution.bound_time[bound] / total if total > 0 else 0.0
+        print(f"{bound:<20}{attribution.bound_steps[bound]:>10} steps{attribution.bound_time[bound]/1e9:>10.4f} s"
+              f"{share*100:>7.1f}%")
+    lost = total - attribution.ideal_time
+    print(f"Lost time vs best alpha: {lost/1e9:.4f} seconds "
+          f"({lost / attribution.ideal_time * 100 if attribution.ideal_time > 0 else 0.0:.2f}% over ideal)")
+    layers = np.argsort(attribution.lost_by_layer)[::-1][:top]
+    print("Most lost layers: " + ", ".join(f"{l} ({attribution.lost_by_layer[l]/1e6:.3f} ms)" for l in layers))
+    print("Lost per token range:")
+    for start in sorted(attribution.lost_by_range):
+        print(f"{start}-{start + attribution.token_bucket - 1}: {attribution.lost_by_range[start]/1e6:.3f} ms")
+    print("-" * 50)
+
 # simulator.py (updated run_simulation function)
 def run_simulation(init_class: MemStatus, config_params: dict, 
                   mig_classes: list, plc_classes: list):
     """Run simulation with specified initialization class and config parameters"""
     fn = config_params.get('filename', "trace.txt")
     inclusive = config_params.get('inclusive', False)
+    profile = config_params.get('profile', False)
+    attribution = config_params.get('attribution', False)
     
     # Create config with custom parameters
-    config = ModelConfig(
-        N=config_params.get('N', 1024*10),
-        N_pre=config_params.get('N_pre', 1024*2),
-        para_num=config_params.get('para_num', 0.5),
-        C_HBM_max=config_params.get('C_HBM_max', 3)
-    )
+    config = build_config(config_params)
     
     # 🔥 Use passed strategy classes instead of hardcoded
     placement_classes = plc_classes
@@ -163,43 +482,30 @@ def run_simulation(init_class: MemStatus, config_params: dict,
 
     # Run simulation for this initialization class
     config_temp = copy.deepcopy(config)
-    trace = load_skip_lists(fn)
+    if config_params.get('per_layer_trace', False):
+        trace = load_skip_trace(fn)
+    else:
+        trace = load_skip_lists(fn)
     initial_state_clean = init_class(config_temp, trace, inclusive)
     
     # Rest of the original simulation logic...
-    initial_state_temp = copy.deepcopy(initial_state_clean)
-    initial_state_temp.trace = trace
-    best_mig = NoMigration(initial_state_temp.cfg, initial_state_temp)
-    best_plc = PreferHBM(initial_state_temp.cfg, initial_state_temp)
-    best_simulator = MemorySimulator(initial_state_temp.cfg, initial_state_temp, best_plc, best_mig, best=True)
-    upper_bound_time = best_simulator.simulate()
+    best_simulator = simulate_combination(initial_state_clean, trace, PreferHBM, NoMigration, best=True)
+    upper_bound_time = best_simulator.total_time
     
     print(f"Read trace file: {fn}")
-    print(f"Best Combination:")
-    print(f"Total simulation time: {upper_bound_time:.4f} ns, {upper_bound_time/1e9:.4f} seconds")
-    print(f"Average time per token: {upper_bound_time/initial_state_temp.cfg.N:.6f} ns")
-    print("-" * 50)
+    report_best(upper_bound_time, best_simulator.cfg.N)
 
     # 🔥 Use passed strategy classes in the loops
     for p_cls in placement_classes:
         for m_cls in migration_classes:
-            test_initial_state = copy.deepcopy(initial_state_clean)
-            test_initial_state.trace = trace
-            mig_instance = m_cls(test_initial_state.cfg, test_initial_state)
-            placement_instance = p_cls(test_initial_state.cfg, test_initial_state)
-            
-            simulator = MemorySimulator(test_initial_state.cfg, test_initial_state, 
-                                      placement_instance, mig_instance, best=False)
-            total_time = simulator.simulate()
-            avg_alpha = sum(step['alpha'] for step in simulator.step_details) / len(simulator.step_details)
-            
-            print(f"Combination: {p_cls.__name__} + {m_cls.__name__}")
-            print(f"Total time: {total_time:.4f} ns, {total_time/1e9:.4f} seconds")
-            print(f"Avg alpha: {avg_alpha:.6f}")
-            print(f"Alphas:")
-            for step in simulator.step_details:
-                print(f"{step['alpha']:.4f}")
-            print("-" * 50)
+            simulator = simulate_combination(initial_state_clean, trace, p_cls, m_cls,
+                                             profile=profile, attribution=attribution)
+            report_combination(f"{p_cls.__name__} + {m_cls.__name__}", simulator.total_time,
+                               [step['alpha'] for step in simulator.step_details])
+            if profile:
+                report_profile(simulator.profile)
+            if attribution:
+                report_attribution(simulator.attribution)
     
     return
 
@@ -210,27 +516,6 @@ if __name__ == "__main__":
     # Redirect output to log file
     import sys
 
-    # Mapping from string names to actual classes
-    CLASS_MAPPING = {
-        # Initialization classes
-        'HBMInit': HBMInit,
-        'TokenLevelBestRatioInit': TokenLevelBestRatioInit,
-        
-        # Migration classes
-        'NoMigration': NoMigration,
-        'AlphaMigration': AlphaMigration,
-        'LookAheadBatchMigration': LookAheadBatchMigration,
-        'LookAheadMigration': LookAheadMigration,
-        'PriorMigration': PriorMigration,
-        'PastWindowMigration': PastWindowMigration,
-        # Placement classes
-        'PreferHBM': PreferHBM,
-        'BatchRatio': BatchRatio,
-        'LookAheadBatch': LookAheadBatch,
-        'LayerImportance': LayerImportance,
-        'AlphaLayersDistribution': AlphaLayersDistribution,
-    }
-
     parser = argparse.ArgumentParser()
     parser.add_argument('--N', type=int, default=1024*10)
     parser.add_argument('--N_pre', type=int, default=1024*2)
@@ -245,6 +530,14 @@ if __name__ == "__main__":
     parser.add_argument('--plc_classes', type=str, nargs='+', required=True,
                        help='Placement class names separated by spaces')
     parser.add_argument('--log_file', type=str, default="simulation.txt")
+    parser.add_argument('--n_sink', type=int, default=4, help='Attention-sink tokens (SinkWindowInit, WindowDrainMigration)')
+    parser.add_argument('--window', type=int, default=1024, help='Recent-window tokens (SinkWindowInit, WindowDrainMigration)')
+    parser.add_argument('--per_layer_trace', action='store_true',
+                       help='Use the skip list of every layer instead of layer 0 for all layers')
+    parser.add_argument('--profile', action='store_true',
+                       help='Report wall time, calls, migrated bytes and touched entries per strategy hook')
+    parser.add_argument('--attribution', action='store_true',
+                       help='Report the bound resource of every step and the time lost against the best alpha')
     args = parser.parse_args()
 
     # Validate and convert class names to actual classes
@@ -262,7 +555,12 @@ if __name__ == "__main__":
         'para_num': args.para_num,
         'C_HBM_max': args.C_HBM_max,
         'filename': args.filename,
-        'inclusive': args.inclusive
+        'inclusive': args.inclusive,
+        'per_layer_trace': args.per_layer_trace,
+        'n_sink': args.n_sink,
+        'window': args.window,
+        'profile': args.profile,
+        'attribution': args.attribution
     }
 
     
@@ -0,0 +1,205 @@
+# skip_trace.py
+# Per-layer (and optionally per-head) skip traces with structural sharing.
+# Skip lists are stored as sorted int32 arrays. Identical lists are interned
+# and stored once, whichever step, layer or head they belong to, and a list
+# close to the one of the previous token at the same (l, s, h) is stored as
+# a delta (added, removed) against it.
+import re
+from collections import OrderedDict
+import numpy as np
+
+EMPTY_SKIP = np.zeros(0, dtype=np.int32)
+
+class SkipDelta():
+    __slots__ = ('base', 'added', 'removed', 'depth')
+
+    def __init__(self, base, added, removed, depth: int):
+        self.base = base          # interned ndarray or SkipDelta
+        self.added = added
+        self.removed = removed
+        self.depth = depth        # length of the delta chain down to a full list
+
+class SkipTrace():
+    def __init__(self, max_delta_depth: int = 32, cache_size: int = 256):
+        """
+        max_delta_depth: longest delta chain before a full list is stored again.
+        cache_size: number of materialized delta lists kept for reuse.
+        """
+        self.max_delta_depth = max_delta_depth
+        self.steps = {}          # (n, l, s) -> [entry, skip_layer, {h: entry} or None]
+        self._pool = {}          # content hash -> interned entries
+        self._last = {}          # (l, s, h) -> (n, entry, array) of the last added list
+        self._materialized = OrderedDict()
+        self._cache_size = cache_size
+        self.has_heads = False
+
+    def _intern(self, array):
+        """Return the stored entry with the content of array, if any, and its hash."""
+        key = hash((len(array), array.tobytes()))
+        for entry in self._pool.get(key, []):
+            if np.array_equal(self._resolve(entry), array):
+                return entry, key
+        return None, key
+
+    def _store(self, array, previous):
+        """Intern array, as a delta against previous = (entry, array) when that is smaller."""
+        entry, key = self._intern(array)
+        if entry is not None:
+            return entry
+        entry = array
+        if previous is not None:
+            base, base_array = previous
+            depth = base.depth + 1 if isinstance(base, SkipDelta) else 1
+            added = np.setdiff1d(array, base_array, assume_unique=True)
+            removed = np.setdiff1d(base_array, array, assume_unique=True)
+            if depth <= self.max_delta_depth and 2 * (len(added) + len(removed)) < len(array):
+                entry = SkipDelta(base, added, removed, depth)
+        self._pool.setdefault(key, []).append(entry)
+        return entry
+
+    def _resolve(self, entry):
+        """Materialize an entry as a sorted array. Repeated calls return the same object."""
+        if not isinstance(entry, SkipDelta):
+            return entry
+        cached = self._materialized.get(id(entry))
+        if cached is not None:
+            self._materialized.move_to_end(id(entry))
+            return cached
+        base = self._resolve(entry.base)
+        array = np.union1d(np.setdiff1d(base, entry.removed, assume_unique=True), entry.added)
+        array = array.astype(np.int32, copy=False)
+        self._materialized[id(entry)] = array
+        if len(self._materialized) > self._cache_size:
+            self._materialized.popitem(last=False)
+        return array
+
+    def add(self, n: int, l: int, s: int, skip_tokens, skip_layer: bool = False, head: int = None):
+        """Add the skip list of step (n, l, s), or of one head of it."""
+        array = np.unique(np.asarray(skip_tokens, dtype=np.int32))
+        last_key = (l, s, head)
+        last = self._last.get(last_key)
+        previous = (last[1], last[2]) if last is not None and last[0] == n - 1 else None
+        entry = self._store(array, previous)
+        self._last[last_key] = (n, entry, array)
+
+        step = self.steps.setdefault((n, l, s), [None, False, None])
+        step[1] = step[1] or skip_layer
+        if head is None:
+            step[0] = entry
+        else:
+            self.has_heads = True
+            if step[2] is None:
+                step[2] = {}
+            step[2][head] = entry
+            step[0] = None      # token-level list is rebuilt from the heads
+
+    def _token_entry(self, step):
+        """
+        Token-level skip list of a per-head step: a token's KV cache is only
+        skipped when every head skips it.
+        """
+        if step[0] is None and step[2]:
+            heads = [self._resolve(e) for e in step[2].values()]
+            skipped = heads[0]
+            for h in heads[1:]:
+                skipped = np.intersect1d(skipped, h, assume_unique=True)
+            step[0], _ = self._intern(skipped)
+            if step[0] is None:
+                step[0] = self._store(skipped, None)
+        return step[0]
+
+    def skip_tokens(self, n: int, l: int, s: int):
+        step = self.steps.get((n, l, s))
+        if step is None:
+            return EMPTY_SKIP
+        entry = self._token_entry(step)
+        return EMPTY_SKIP if entry is None else self._resolve(entry)
+
+    def head_skip_tokens(self, n: int, l: int, s: int, head: int):
+        step = self.steps.get((n, l, s))
+        if step is None or step[2] is None or head not in step[2]:
+            return self.skip_tokens(n, l, s)
+        return self._resolve(step[2][head])
+
+    def skip_layer(self, n: int, l: int, s: int) -> bool:
+        step = self.steps.get((n, l, s))
+        return step is not None and step[1]
+
+    def __contains__(self, key):
+        return key in self.steps
+
+    def __getitem__(self, key):
+        n, l, s = key
+        if key not in self.steps:
+            raise KeyError(key)
+        return {"skip_token_kv": self.skip_tokens(n, l, s), "skip_layer": self.skip_layer(n, l, s)}
+
+    def get(self, key, default=None):
+        if key not in self.steps:
+            return default
+        return self[key]
+
+    def __getstate__(self):
+        # Materialized lists are keyed by object id, which copying changes
+        state = self.__dict__.copy()
+        state['_materialized'] = OrderedDict()
+        return state
+
+    def stats(self) -> dict:
+        """Storage summary: steps, unique lists, deltas and stored bytes."""
+        entries = [e for bucket in self._pool.values() for e in bucket]
+        deltas = [e for e in entries if isinstance(e, SkipDelta)]
+        stored = sum(e.added.nbytes + e.removed.nbytes if isinstance(e, SkipDelta) else e.nbytes
+                     for e in entries)
+        return {'steps': len(self.steps), 'unique_lists': len(entries),
+                'deltas': len(deltas), 'stored_bytes': stored}
+
+def load_skip_trace(filename="trace.txt", max_delta_depth: int = 32) -> SkipTrace:
+    """
+    Load every step of a trace file into a SkipTrace. Lines are
+    n,l,s,[skip_token_kv],skip_layer or, per head, n,l,s,h,[skip_token_kv],skip_layer.
+    """
+    trace = SkipTrace(max_delta_depth)
+    pattern = re.compile(r"^(\d+),(\d+),(\d+),(?:(\d+),)?\[(.*?)\],(.+)$")
+    with open(filename, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            m = pattern.match(line)
+            if not m:
+                raise ValueError("Line doesn't match expected format: " + line)
+            n, l, s, h, skip_str, skip_layer_str = m.groups()
+            skips = np.fromstring(skip_str, dtype=np.int32, sep=',') if skip_str.strip() else EMPTY_SKIP
+            trace.add(int(n), int(l), int(s), skips, skip_layer_str.strip() == "True",
+                      None if h is None else int(h))
+    return trace
+
+def write_skip_trace(trace: SkipTrace, filename="trace.txt"):
+    """Write a SkipTrace in the trace file format, per head if it has heads."""
+    with open(filename, "w") as f:
+        for (n, l, s), step in sorted(trace.steps.items()):
+            skip_layer = "True" if step[1] else "False"
+            if step[2] is None:
+                skips = ",".join(map(str, trace.skip_tokens(n, l, s)))
+                f.write(f"{n},{l},{s},[{skips}],{skip_layer}\n")
+            else:
+                for h in sorted(step[2]):
+                    skips = ",".join(map(str, trace.head_skip_tokens(n, l, s, h)))
+                    f.write(f"{n},{l},{s},{h},[{skips}],{skip_layer}\n")
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--filename', type=str, default="trace.txt")
+    parser.add_argument('--max_delta_depth', type=int, default=32)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    trace = load_skip_trace(args.filename, args.max_delta_depth)
+    stats = trace.stats()
+    print(f"Loaded {args.filename} in {time.perf_counter() - start:.2f} s")
+    print(f"Steps: {stats['steps']}, unique lists: {stats['unique_lists']} "
+          f"({stats['deltas']} deltas), stored: {stats['stored_bytes'] / 1024**2:.2f} MB")
@@ -0,0 +1,186 @@
+# speculative.py
+# Speculative decoding workload. A verify step runs the k + 1 tokens
+# n..n+k (the last committed token's successor and k drafts) through the
+# model at once: every layer reads its weights and the KV caches of tokens
+# < n once for all queries (a KV cache is only skipped when every query
+# skips it) and writes k + 1 KV entries. The first a drafts are accepted,
+# the KV caches of the rejected ones are rolled back and decoding continues
+# at n + a + 1. Placements see the batch through batch_alpha_strategy and
+# batch_beta_strategy.
+import numpy as np
+from simulator import MemorySimulator
+
+class SpeculativeSimulator(MemorySimulator):
+    def __init__(self, config, status, placement, migration, best: bool = False,
+                 draft_len: int = 4, acceptance_rate: float = 0.7,
+                 acceptance_trace: list = None, seed: int = 0):
+        """
+        draft_len: draft tokens k verified per step.
+        acceptance_rate: probability that a draft is accepted given that the
+                         previous ones were, used without acceptance_trace.
+        acceptance_trace: accepted drafts of every verify step, reused
+                          cyclically.
+        """
+        super().__init__(config, status, placement, migration, best)
+        self.draft_len = draft_len
+        self.acceptance_rate = acceptance_rate
+        self.acceptance_trace = acceptance_trace
+        self.seed = seed
+        self.reset_speculation()
+
+    def reset_speculation(self):
+        self.rng = np.random.default_rng(self.seed)
+        self.verify_steps = 0
+        self.accepted = 0
+        self.committed = 0
+        self.rollback_entries = {'hbm': 0, 'external': 0}
+
+    def accepted_drafts(self) -> int:
+        if self.acceptance_trace:
+            a = self.acceptance_trace[self.verify_steps % len(self.acceptance_trace)]
+            return max(0, min(int(a), self.draft_len))
+        a = 0
+        while a < self.draft_len and self.rng.random() < self.acceptance_rate:
+            a += 1
+        return a
+
+    def batch_skips(self, n: int, l: int, s: int, tokens):
+        """KV caches of tokens < n skipped by every query of the batch."""
+        skips = self.status.get_skip_token_array(tokens[0], l, s)
+        skips = skips[skips < n]
+        for t in tokens[1:]:
+            if len(skips) == 0:
+                break
+            skips = np.intersect1d(skips, self.status.get_skip_token_array(t, l, s), assume_unique=True)
+        return skips
+
+    def batch_data_sizes(self, n: int, l: int, s: int, tokens, skips):
+        kv_size = self.status.get_single_KV_cache_size()
+        if s == 0:
+            D_R = self.status.get_layer_md_weight_size() + (n - len(skips)) * kv_size
+            return D_R, len(tokens) * kv_size
+        return 2 * self.cfg.d * self.cfg.d_ff * self.cfg.dtype_size / self.cfg.tp, 0
+
+    def run_verify_step(self, n: int, l: int, s: int, tokens):
+        """Simulate layer l, sublayer s of the verify step of tokens, returns its time."""
+        step_info = self.status.get_step_info(n, l, s)
+        if step_info["skip_layer"]:
+            return None
+        skips = self.batch_skips(n, l, s, tokens) if s == 0 else None
+        D_R, D_W = self.batch_data_sizes(n, l, s, tokens, skips)
+        if s == 0:
+            alpha = self.plc.batch_alpha_strategy(n, l, s, skips, D_R)
+        else:
+            alpha = self.plc.alpha_strategy(n, l, s)
+        beta = self.plc.batch_beta_strategy(n, l, s, tokens)
+        self.status.record_access(n, l, s)
+        migration_data = self.mig.migration_strategy(n, l, s)
+        step_time = self.step_time(n, l, s, alpha, beta, *migration_data,
+                                   sizes=(D_R, D_W))
+        self.total_time += step_time
+        self.step_details.append({
+            'n': n,
+            'l': l,
+            's': s,
+            'time': step_time,
+            'alpha': alpha,
+            'beta': beta,
+            'tokens': len(tokens)
+        })
+        return step_time
+
+    def simulate(self):
+        self.total_time = 0.0
+        self.step_details = []
+        self.reset_speculation()
+        end = self.cfg.N_pre + self.cfg.N
+        n = self.cfg.N_pre
+        while n < end:
+            tokens = list(range(n, min(n + self.draft_len + 1, end)))
+            for l in range(self.cfg.L):
+                for s in [0, 1]:  # MHA and MLP
+                    self.run_verify_step(n, l, s, tokens)
+            a = min(self.accepted_drafts(), len(tokens) - 1)
+            hbm, external = self.status.rollback_tokens(tokens[a + 1:])
+            self.rollback_entries['hbm'] += hbm
+            self.rollback_entries['external'] += external
+            self.verify_steps += 1
+            self.accepted += a
+            self.committed += a + 1
+            for observer in self.observers:
+                observer.after_token(self, n + a)
+            n += a + 1
+        return self.total_time
+
+def committed_hbm_share(status, start: int, end: int) -> float:
+    """Fraction of the decoded KV caches of tokens start..end-1 held on HBM."""
+    rows = status.locations[start:end]
+    written = np.count_nonzero((rows == 0) | (rows == 1))
+    return np.count_nonzero(rows == 0) / written if written else 0.0
+
+def report_speculation(simulator: SpeculativeSimulator, baseline_time: float):
+    cfg = simulator.cfg
+    print(f"Draft length: {simulator.draft_len}, verify steps: {simulator.verify_steps}, "
+          f"mean accepted drafts: {simulator.accepted / max(simulator.verify_steps, 1):.3f}")
+    print(f"Total time: {simulator.total_time/1e9:.4f} seconds, "
+          f"{simulator.total_time / max(simulator.committed, 1) / 1e6:.4f} ms per token "
+          f"(non-speculative {baseline_time / cfg.N / 1e6:.4f} ms)")
+    print(f"Decoded KV on HBM: {committed_hbm_share(simulator.status, cfg.N_pre, cfg.N_pre + cfg.N) * 100:.2f}%")
+    print(f"Rolled back KV entries: {simulator.rollback_entries['hbm']} HBM, "
+          f"{simulator.rollback_entries['external']} external")
+    print("-" * 50)
+
+if __name__ == "__main__":
+    import argparse
+    import copy
+    import sys
+    from simulator import CLASS_MAPPING, build_config, load_skip_lists, simulate_combination
+    from skip_trace import load_skip_trace
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--N', type=int, default=1024*10)
+    parser.add_argument('--N_pre', type=int, default=1024*2)
+    parser.add_argument('--para_num', type=float, default=0.5)
+    parser.add_argument('--C_HBM_max', type=int, default=3)
+    parser.add_argument('--inclusive', action='store_true')
+    parser.add_argument('--filename', type=str, default="trace.txt")
+    parser.add_argument('--per_layer_trace', action='store_true')
+    parser.add_argument('--draft_len', type=int, nargs='+', default=[4])
+    parser.add_argument('--acceptance_rate', type=float, default=0.7)
+    parser.add_argument('--acceptance_trace', type=str, default=None,
+                        help='File with the accepted drafts of every verify step, one per line')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--init_class', type=str, required=True)
+    parser.add_argument('--mig_classes', type=str, nargs='+', required=True)
+    parser.add_argument('--plc_classes', type=str, nargs='+', required=True)
+    args = parser.parse_args()
+
+    try:
+        init_class = CLASS_MAPPING[args.init_class]
+        mig_classes = [CLASS_MAPPING[name] for name in args.mig_classes]
+        plc_classes = [CLASS_MAPPING[name] for name in args.plc_classes]
+    except KeyError as e:
+        print(f"Error: Unknown class name {e.args[0]}")
+        sys.exit(1)
+
+    acceptance_trace = None
+    if args.acceptance_trace:
+        with open(args.acceptance_trace, "r") as f:
+            acceptance_trace = [int(line) for line in f if line.strip()]
+
+    config = build_config(vars(args))
+    trace = load_skip_trace(args.filename) if args.per_layer_trace else load_skip_lists(args.filename)
+    initial_state = init_class(copy.deepcopy(config), trace, args.inclusive)
+
+    for p_cls in plc_classes:
+        for m_cls in mig_classes:
+            baseline = simulate_combination(initial_state, trace, p_cls, m_cls)
+            print(f"Combination: {p_cls.__name__} + {m_cls.__name__}")
+            print(f"Non-speculative decoded KV on HBM: "
+                  f"{committed_hbm_share(baseline.status, config.N_pre, config.N_pre + config.N) * 100:.2f}%")
+            for k in args.draft_len:
+                simulator = simulate_combination(initial_state, trace, p_cls, m_cls,
+                                                 simulator_cls=SpeculativeSimulator, draft_len=k,
+                                                 acceptance_rate=args.acceptance_rate,
+                                                 acceptance_trace=acceptance_trace, seed=args.seed)
+                report_speculation(simulator, baseline.total_time)
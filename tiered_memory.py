@@ -0,0 +1,376 @@
+# tiered_memory.py
+# N-tier memory hierarchy: HBM plus any number of external devices (e.g. CXL
+# DRAM, host DRAM, NVMe-backed spill), each with its own capacity and
+# read/write/internal bandwidths. The step time generalizes
+# calculate_step_time to the max over tiers, and migrations promote/demote KV
+# caches between adjacent tiers. Placement is modeled as exclusive.
+import copy
+import numpy as np
+from abc import abstractmethod
+from memory_status import ModelConfig, MemoryTier, MemStatus, tier_location, location_tier, BYTES_TO_GB
+from placement import BaseStrategy
+from migration import BaseDataMigration
+from simulator import MemorySimulator, build_config, load_skip_lists, simulate_combination, average_alpha
+
+# Tracks per-tier occupancy and KV counts on top of the location matrix.
+class TieredMemStatus(MemStatus):
+    def __init__(self, config: ModelConfig, trace, is_inclusive: bool):
+        if is_inclusive:
+            raise ValueError("Tiered memory only models exclusive placement!")
+        self.tiers = config.get_tiers()
+        if len(self.tiers) < 2:
+            raise ValueError("A tiered hierarchy needs HBM and at least one external tier!")
+        # tier 0 occupancy is cfg.C_HBM
+        self.tier_used = [0.0] * len(self.tiers)
+        self.tier_token_counts = np.zeros((len(self.tiers), config.L), dtype=np.int64)
+        super().__init__(config, trace, is_inclusive)
+
+    def initialize_memory(self):
+        # Model weights that do not fit on HBM live on the first external tier.
+        self.tier_used = [0.0] * len(self.tiers)
+        self.tier_token_counts[:] = 0
+        self.tier_used[1] = self.total_model_weights * (1 - self.model_weight_ratio)
+        super().initialize_memory()
+
+    def get_tier_usage(self, tier: int) -> float:
+        return self.cfg.C_HBM if tier == 0 else self.tier_used[tier]
+
+    def get_tier_util_rate(self, tier: int) -> float:
+        return self.get_tier_usage(tier) / self.tiers[tier].capacity
+
+    def tier_kv_scale(self, tier: int) -> float:
+        """Size of a KV cache on a tier relative to HBM (per-tier KV dtype)."""
+        if tier == 0:
+            return 1.0
+        kv_dtype_size = self.tiers[tier].kv_dtype_size or self.cfg.kv_dtype_size_ext
+        return kv_dtype_size / self.cfg.kv_dtype_size
+
+    def store_in_tier(self, tier: int, data_size) -> bool:
+        """Attempt to store data in a tier, return True if successful."""
+        if tier == 0:
+            return self.store_data(data_size)
+        remaining = self.tiers[tier].capacity - self.tier_used[tier]
+        if remaining <= 0 or data_size > remaining:
+            return False
+        self.tier_used[tier] += data_size
+        return True
+
+    def release_from_tier(self, tier: int, data_size):
+        if tier == 0:
+            self.cfg.C_HBM -= data_size
+        else:
+            self.tier_used[tier] -= data_size
+
+    def update_token_layer(self, token_id, layer: int, location: int):
+        prev_tier = int(location_tier(self.get_layer_location(token_id, layer)))
+        super().update_token_layer(token_id, layer, location)
+        if prev_tier >= 0:
+            self.tier_token_counts[prev_tier, layer] -= 1
+        new_tier = int(location_tier(location))
+        if new_tier >= 0:
+            self.tier_token_counts[new_tier, layer] += 1
+
+    def move_token_layer(self, token_id, layer: int, src: int, dst: int) -> bool:
+        """Move one KV cache entry from tier src to tier dst if dst has room."""
+        size = self.get_single_KV_cache_size()
+        if not self.store_in_tier(dst, size * self.tier_kv_scale(dst)):
+            return False
+        self.release_from_tier(src, size * self.tier_kv_scale(src))
+        self.update_token_layer(token_id, layer, tier_location(dst))
+        return True
+
+    def place_initial_tiers(self, order=None):
+        """
+        Place the prefill KV cache tier by tier in `order` (flat indices into
+        the N_pre x L matrix, token-major by default): HBM until full, then the
+        next tier, and so on. One capacity computation per tier.
+        """
+        kv_cache_size = self.get_single_KV_cache_size()
+        N_pre, L = self.cfg.N_pre, self.cfg.L
+        order = np.arange(N_pre * L) if order is None else np.asarray(order, dtype=np.int64)
+        placement = np.empty(N_pre * L, dtype=np.int8)
+        start = 0
+        for t, tier in enumerate(self.tiers):
+            entry_size = kv_cache_size * self.tier_kv_scale(t)
+            remaining = tier.capacity - self.get_tier_usage(t)
+            if t == len(self.tiers) - 1:
+                count = len(order) - start     # the last tier takes the rest
+            else:
+                count = min(int(remaining // entry_size) if remaining > 0 else 0, len(order) - start)
+            placement[order[start:start + count]] = tier_location(t)
+            if t == 0:
+                self.cfg.C_HBM += count * entry_size
+            else:
+                self.tier_used[t] += count * entry_size
+            start += count
+
+        if N_pre > len(self.locations):
+            self._grow(N_pre)
+        self.locations[:N_pre] = placement.reshape(N_pre, L)
+        for n in range(N_pre):
+            self.token_layer_status[n] = self.locations[n]
+        for t in range(len(self.tiers)):
+            self.tier_token_counts[t] += np.count_nonzero(self.locations[:N_pre] == tier_location(t), axis=0)
+        self.hbm_token_counts = [int(c) for c in self.tier_token_counts[0]]
+
+    def read_bytes_per_tier(self, n: int, l: int, s: int):
+        """
+        Bytes of D_R(n, l, s) read from every tier, as (weight reads, KV reads).
+        KV reads are at HBM dtype, scale them with tier_kv_scale for stored bytes.
+        """
+        D_R, _ = self.calculate_data_sizes(n, l, s)
+        weight_reads = np.zeros(len(self.tiers))
+        kv_reads = np.zeros(len(self.tiers))
+        if D_R <= 0:
+            return weight_reads, kv_reads
+        if s == 1:
+            weight_reads[0] = self.model_weight_ratio * D_R
+            weight_reads[1] = (1 - self.model_weight_ratio) * D_R
+            return weight_reads, kv_reads
+
+        weight = self.get_layer_md_weight_size()
+        weight_reads[0] = self.model_weight_ratio * weight
+        weight_reads[1] = (1 - self.model_weight_ratio) * weight
+        skipped = location_tier(self.locations[self.get_skip_token_array(n, l, s), l])
+        skipped_counts = np.bincount(skipped[skipped >= 0], minlength=len(self.tiers))
+        kv_reads += (self.tier_token_counts[:, l] - skipped_counts) * self.get_single_KV_cache_size()
+        return weight_reads, kv_reads
+
+# Fill every tier in order with the prefill KV cache, model weights on HBM.
+class TieredFillInit(TieredMemStatus):
+    def __init__(self, config, trace, is_inclusive):
+        self.model_weight_ratio = 1.0
+        super().__init__(config, trace, is_inclusive)
+
+    def initial_tokens_placement(self):
+        print(f"Start TieredFillInit initialization")
+        self.place_initial_tiers()
+        print(f"End TieredFillInit initialization")
+
+
+class TieredStrategy(BaseStrategy):
+    @abstractmethod
+    def write_tier(self, n: int, l: int, s: int):
+        """Store the new KV cache of step (n, l, s), return its tier (None if nothing is written)."""
+        pass
+
+    def beta_strategy(self, n, l, s):
+        return 1.0 if self.write_tier(n, l, s) == 0 else 0.0
+
+# PreferHBM generalized: write to the fastest tier that has room.
+class FastestFitPlacement(TieredStrategy):
+    def write_tier(self, n, l, s):
+        if s == 1:
+            return None
+        step_info = self.status.get_step_info(n, l, s)
+        if step_info['skip_layer']:
+            self.status.update_token_layer(n, l, 2)
+            return None
+
+        _, D_W = self.status.calculate_data_sizes(n, l, s)
+        for t in range(len(self.status.tiers)):
+            if self.status.store_in_tier(t, D_W * self.status.tier_kv_scale(t)):
+                self.status.update_token_layer(n, l, tier_location(t))
+                return t
+        raise ValueError("No memory tier has room for the new KV cache!")
+
+
+class TieredMigration(BaseDataMigration):
+    @abstractmethod
+    def tier_migration_strategy(self, n: int, l: int, s: int):
+        """Return (mig_reads, mig_writes), bytes read from / written to every tier."""
+        pass
+
+    def migration_strategy(self, n: int, l: int, s: int) -> tuple[float, float, float, float]:
+        # Two-tier view [hbm_MR, hbm_MW, ext_MR, ext_MW]
+        mig_reads, mig_writes = self.tier_migration_strategy(n, l, s)
+        return [mig_reads[0], mig_writes[0], mig_reads[1], mig_writes[1]]
+
+
+class NoTierMigration(TieredMigration):
+    def tier_migration_strategy(self, n, l, s):
+        T = len(self.status.tiers)
+        return np.zeros(T), np.zeros(T)
+
+# Promote and demote the KV cache of the current layer between adjacent tiers.
+# A tier above the threshold demotes entries skipped at this step (oldest
+# first) to the next tier; a tier with room promotes entries read at this step
+# (newest first) from the tier below. Read entries are already on their way to
+# the GPU, so only the write into the faster tier is charged.
+class AdjacentTierMigration(TieredMigration):
+    def __init__(self, config, status):
+        super().__init__(config, status)
+        self.batch_size = 32        # max entries moved per tier pair and step
+        self.promote = True
+        self.promote_margin = 0.05  # promote only below threshold - margin
+
+    def tier_migration_strategy(self, n, l, s):
+        T = len(self.status.tiers)
+        mig_reads, mig_writes = np.zeros(T), np.zeros(T)
+        if s != 0:
+            return mig_reads, mig_writes
+        size = self.status.get_single_KV_cache_size()
+        scales = [self.status.tier_kv_scale(t) for t in range(T)]
+        column = self.status.locations[:n, l]
+        skipped = np.zeros(n, dtype=bool)
+        skip_tokens = self.status.get_skip_token_array(n, l, s)
+        skipped[skip_tokens[skip_tokens < n]] = True
+
+        # Demotion, fastest tier first so space cascades down
+        for t in range(T - 1):
+            if self.status.get_tier_util_rate(t) < self.status.threshold:
+                continue
+            candidates = np.flatnonzero((column == tier_location(t)) & skipped)[:self.batch_size]
+            for token in candidates:
+                if not self.status.move_token_layer(int(token), l, t, t + 1):
+                    break
+                mig_reads[t] += size * scales[t]
+                mig_writes[t + 1] += size * scales[t + 1]
+
+        if self.promote:
+            for t in range(1, T):
+                if self.status.get_tier_util_rate(t - 1) >= self.status.threshold - self.promote_margin:
+                    continue
+                candidates = np.flatnonzero((column == tier_location(t)) & ~skipped)[::-1][:self.batch_size]
+                for token in candidates:
+                    if not self.status.move_token_layer(int(token), l, t, t - 1):
+                        break
+                    mig_writes[t - 1] += size * scales[t - 1]
+        return mig_reads, mig_writes
+
+# Only demote, never promote.
+class DemotionMigration(AdjacentTierMigration):
+    def __init__(self, config, status):
+        super().__init__(config, status)
+        self.promote = False
+
+
+class TieredSimulator(MemorySimulator):
+    def calculate_tier_times(self, reads, writes, mig_reads, mig_writes, dequant=None):
+        """
+        Time every tier needs at one step. HBM serves reads, writes and
+        migrations from one bandwidth; an external tier reads through
+        min(interface, internal) and overlaps writes and migrations as in
+        calculate_step_time. All sizes are stored bytes; dequant is the
+        (de)quantization time of every tier's KV traffic.
+        """
+        if dequant is None:
+            dequant = np.zeros(len(self.status.tiers))
+        times = []
+        for t, tier in enumerate(self.status.tiers):
+            if t == 0:
+                times.append((reads[0] + writes[0] + mig_reads[0] + mig_writes[0]) / tier.B_read)
+                continue
+            ext_read = reads[t] / min(tier.B_read, tier.B_internal)
+            write_migration = (writes[t] + mig_writes[t]) / tier.B_write
+            read_migration = mig_reads[t] / tier.B_read
+            internal_migration = (writes[t] + mig_writes[t] + mig_reads[t]) / tier.B_internal
+            times.append(ext_read + max(write_migration, read_migration, internal_migration) + dequant[t])
+        return times
+
+    def simulate(self):
+        self.total_time = 0.0
+        self.step_details = []
+        T = len(self.status.tiers)
+        scales = np.array([self.status.tier_kv_scale(t) for t in range(T)])
+
+        for n in range(self.cfg.N_pre, self.cfg.N_pre + self.cfg.N):
+            for l in range(self.cfg.L):
+                for s in [0, 1]:  # MHA and MLP
+                    step_info = self.status.get_step_info(n, l, s)
+                    if step_info["skip_layer"]:
+                        continue
+                    D_R, D_W = self.status.calculate_data_sizes(n, l, s)
+                    weight_reads, kv_reads = self.status.read_bytes_per_tier(n, l, s)
+                    reads = weight_reads + kv_reads * scales
+                    alpha = reads[0] / D_R if D_R > 0 else 0.0
+                    tier = self.plc.write_tier(n, l, s)
+                    writes = np.zeros(T)
+                    dequant_bytes = kv_reads * (scales != 1.0)
+                    if tier is not None:
+                        writes[tier] = D_W * scales[tier]
+                        if scales[tier] != 1.0:
+                            dequant_bytes[tier] += D_W
+                    self.status.record_access(n, l, s)
+                    mig_reads, mig_writes = self.mig.tier_migration_strategy(n, l, s)
+                    dequant = dequant_bytes / self.cfg.B_dequant if self.cfg.B_dequant > 0 else None
+
+                    times = self.calculate_tier_times(reads, writes, mig_reads, mig_writes, dequant)
+                    step_time = max(times)
+                    self.total_time += step_time
+                    self.step_details.append({
+                        'n': n,
+                        'l': l,
+                        's': s,
+                        'time': step_time,
+                        'alpha': alpha,
+                        'beta': 1.0 if tier == 0 else 0.0,
+                        'bottleneck': times.index(step_time)
+                    })
+        return self.total_time
+
+# Example hierarchy for capacity planning: HBM, CXL DRAM, host DRAM, NVMe spill
+def capacity_planning_tiers(C_HBM_max=4):
+    return [MemoryTier('HBM', C_HBM_max * BYTES_TO_GB, 4915, 4915, 4915),
+            MemoryTier('CXL DRAM', 64 * BYTES_TO_GB, 64, 64, 128),
+            MemoryTier('Host DRAM', 256 * BYTES_TO_GB, 55, 55, 200),
+            MemoryTier('NVMe', float('inf'), 14, 12, 28)]
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import sys
+
+    CLASS_MAPPING = {
+        'TieredFillInit': TieredFillInit,
+        'FastestFitPlacement': FastestFitPlacement,
+        'NoTierMigration': NoTierMigration,
+        'AdjacentTierMigration': AdjacentTierMigration,
+        'DemotionMigration': DemotionMigration,
+    }
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--N', type=int, default=1024*10)
+    parser.add_argument('--N_pre', type=int, default=1024*2)
+    parser.add_argument('--para_num', type=float, default=0.5)
+    parser.add_argument('--C_HBM_max', type=int, default=3)
+    parser.add_argument('--filename', type=str, default="trace.txt")
+    parser.add_argument('--tiers', type=str, default=None,
+                        help='JSON file with a tier list, the capacity planning example if omitted')
+    parser.add_argument('--init_class', type=str, default='TieredFillInit')
+    parser.add_argument('--mig_classes', type=str, nargs='+', default=['NoTierMigration', 'AdjacentTierMigration'])
+    parser.add_argument('--plc_classes', type=str, nargs='+', default=['FastestFitPlacement'])
+    args = parser.parse_args()
+
+    try:
+        init_class = CLASS_MAPPING[args.init_class]
+        mig_classes = [CLASS_MAPPING[name] for name in args.mig_classes]
+        plc_classes = [CLASS_MAPPING[name] for name in args.plc_classes]
+    except KeyError as e:
+        print(f"Error: Unknown class name {e.args[0]}")
+        sys.exit(1)
+
+    params = vars(args).copy()
+    if args.tiers:
+        with open(args.tiers, "r") as f:
+            params['tiers'] = json.load(f)
+    else:
+        params['tiers'] = None
+    config = build_config(params)
+    if config.tiers is None:
+        config.set_tiers(capacity_planning_tiers(args.C_HBM_max))
+
+    trace = load_skip_lists(args.filename)
+    initial_state = init_class(copy.deepcopy(config), trace, False)
+    print("Tiers: " + ", ".join(f"{t.name} {initial_state.get_tier_util_rate(t_i) * 100:.1f}%"
+                                for t_i, t in enumerate(initial_state.tiers)))
+    for p_cls in plc_classes:
+        for m_cls in mig_classes:
+            simulator = simulate_combination(initial_state, trace, p_cls, m_cls, simulator_cls=TieredSimulator)
+            bottlenecks = np.bincount([step['bottleneck'] for step in simulator.step_details],
+                                      minlength=len(config.tiers))
+            print(f"Combination: {p_cls.__name__} + {m_cls.__name__}")
+            print(f"Total time: {simulator.total_time:.4f} ns, {simulator.total_time/1e9:.4f} seconds")
+            print(f"Avg alpha: {average_alpha(simulator.step_details):.6f}")
+            print("Bottleneck steps: " + ", ".join(f"{t.name} {c}" for t, c in zip(config.tiers, bottlenecks)))
+            print("-" * 50)
@@ -0,0 +1,180 @@
+# timeline.py
+# Export a simulation as a Chrome trace / Perfetto timeline (JSON array of
+# trace events, open in chrome://tracing or ui.perfetto.dev). Every slice
+# covers a bucket of consecutive steps: the step track shows whether the
+# bucket was bound by HBM or the external memory, the HBM and external
+# tracks their busy time, migrations get their own track, and counters
+# carry bytes and the HBM utilization. Events are written while the
+# simulation runs and buckets grow with the run length, so long runs stay
+# small enough to open.
+import json
+import math
+from simulator import MemorySimulator, simulate_combination
+
+PID = 1
+TRACKS = {'step': 0, 'HBM': 1, 'external': 2, 'migration': 3}
+COMPONENTS = ['T_HBM', 'T_ext', 'T_ext_read', 'T_ext_write_migration', 'T_dequant',
+              'hbm_read', 'hbm_write', 'hbm_migration', 'ext_read', 'ext_write', 'ext_migration']
+
+class ChromeTraceWriter():
+    def __init__(self, filename: str, steps_per_event: int = 1):
+        """steps_per_event: consecutive steps merged into one slice and counter sample."""
+        self.filename = filename
+        self.steps_per_event = max(1, steps_per_event)
+        self.f = open(filename, "w")
+        self.f.write("[\n")
+        self.first = True
+        self.events = 0
+        self._reset()
+        for name, tid in TRACKS.items():
+            self.emit({'name': 'thread_name', 'ph': 'M', 'pid': PID, 'tid': tid, 'args': {'name': name}})
+
+    def _reset(self):
+        self.bucket = {key: 0.0 for key in COMPONENTS}
+        self.bucket.update(steps=0, start=None, time=0.0, hbm_bound=0, alpha=0.0, first=None, last=None)
+
+    def emit(self, event: dict):
+        self.f.write(("" if self.first else ",\n") + json.dumps(event))
+        self.first = False
+        self.events += 1
+
+    def add_step(self, n: int, l: int, s: int, start: float, alpha: float, breakdown: dict, hbm_util: float):
+        """Add one step starting at start (ns); flushes a slice every steps_per_event steps."""
+        b = self.bucket
+        if b['start'] is None:
+            b['start'] = start
+            b['first'] = (n, l, s)
+        b['last'] = (n, l, s)
+        # Strategies may return numpy scalars, json only takes Python numbers
+        for key in COMPONENTS:
+            b[key] += float(breakdown[key])
+        b['time'] += float(breakdown['time'])
+        b['hbm_bound'] += int(breakdown['T_HBM'] >= breakdown['T_ext'])
+        b['alpha'] += float(alpha)
+        b['steps'] += 1
+        b['hbm_util'] = float(hbm_util)
+        if b['steps'] >= self.steps_per_event:
+            self.flush()
+
+    def flush(self):
+        b = self.bucket
+        if not b['steps']:
+            return
+        ts = float(b['start']) / 1000      # trace events are in us
+        steps = b['steps']
+        hbm_share = b['hbm_bound'] / steps
+        bound = 'HBM-bound' if hbm_share == 1 else 'ext-bound' if hbm_share == 0 else 'mixed'
+        args = {'first': str(b['first']), 'last': str(b['last']), 'steps': steps,
+                'hbm_bound_steps': b['hbm_bound'], 'avg_alpha': b['alpha'] / steps}
+        args.update({key: b[key] for key in COMPONENTS})
+        self.emit({'name': bound, 'ph': 'X', 'pid': PID, 'tid': TRACKS['step'],
+                   'ts': ts, 'dur': b['time'] / 1000, 'args': args})
+        self.emit({'name': 'HBM busy', 'ph': 'X', 'pid': PID, 'tid': TRACKS['HBM'],
+                   'ts': ts, 'dur': b['T_HBM'] / 1000})
+        self.emit({'name': 'external busy', 'ph': 'X', 'pid': PID, 'tid': TRACKS['external'],
+                   'ts': ts, 'dur': b['T_ext'] / 1000,
+                   'args': {'read': b['T_ext_read'], 'write_migration': b['T_ext_write_migration'],
+                            'dequant': b['T_dequant']}})
+        if b['hbm_migration'] > 0 or b['ext_migration'] > 0:
+            self.emit({'name': 'migration', 'ph': 'X', 'pid': PID, 'tid': TRACKS['migration'],
+                       'ts': ts, 'dur': b['time'] / 1000,
+                       'args': {'hbm_bytes': b['hbm_migration'], 'ext_bytes': b['ext_migration']}})
+        self.emit({'name': 'HBM utilization', 'ph': 'C', 'pid': PID, 'ts': ts,
+                   'args': {'util': b['hbm_util']}})
+        self.emit({'name': 'alpha', 'ph': 'C', 'pid': PID, 'ts': ts,
+                   'args': {'alpha': b['alpha'] / steps}})
+        self.emit({'name': 'HBM MB', 'ph': 'C', 'pid': PID, 'ts': ts,
+                   'args': {key: b['hbm_' + key] / 1024**2 for key in ['read', 'write', 'migration']}})
+        self.emit({'name': 'external MB', 'ph': 'C', 'pid': PID, 'ts': ts,
+                   'args': {key: b['ext_' + key] / 1024**2 for key in ['read', 'write', 'migration']}})
+        self._reset()
+
+    def close(self):
+        self.flush()
+        self.f.write("\n]\n")
+        self.f.close()
+
+def steps_per_event_for(config, max_slices: int = 20000) -> int:
+    """
+    Steps per slice keeping a run under max_slices slices. Buckets of more
+    than one token are rounded to whole tokens so they start at layer 0.
+    """
+    steps_per_token = 2 * config.L
+    steps = math.ceil(config.N * steps_per_token / max(max_slices, 1))
+    if steps > steps_per_token:
+        steps = math.ceil(steps / steps_per_token) * steps_per_token
+    return max(steps, 1)
+
+# MemorySimulator that streams the breakdown of every step to a writer
+class TimelineSimulator(MemorySimulator):
+    def __init__(self, config, status, placement, migration, best: bool = False,
+                 profile: bool = False, writer: ChromeTraceWriter = None):
+        super().__init__(config, status, placement, migration, best, profile)
+        self.writer = writer
+
+    def calculate_step_time(self, n, l, s, alpha, beta, hbm_MR, hbm_MW, ext_MR, ext_MW, sizes=None):
+        breakdown = self.step_time_breakdown(n, l, s, alpha, beta, hbm_MR, hbm_MW, ext_MR, ext_MW, sizes)
+        if self.writer is not None:
+            self.writer.add_step(n, l, s, self.total_time, alpha, breakdown,
+                                 self.status.get_HBM_util_rate())
+        return breakdown['time']
+
+    def simulate(self):
+        total_time = super().simulate()
+        if self.writer is not None:
+            self.writer.flush()
+        return total_time
+
+def export_timeline(initial_state, trace, p_cls, m_cls, filename: str,
+                    steps_per_event: int = None, max_slices: int = 20000) -> TimelineSimulator:
+    """Simulate one combination and write its timeline to filename."""
+    if steps_per_event is None:
+        steps_per_event = steps_per_event_for(initial_state.cfg, max_slices)
+    writer = ChromeTraceWriter(filename, steps_per_event)
+    try:
+        simulator = simulate_combination(initial_state, trace, p_cls, m_cls,
+                                         simulator_cls=TimelineSimulator, writer=writer)
+    finally:
+        writer.close()
+    return simulator
+
+if __name__ == "__main__":
+    import argparse
+    import copy
+    import sys
+    from simulator import CLASS_MAPPING, build_config, load_skip_lists
+    from skip_trace import load_skip_trace
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--N', type=int, default=1024*10)
+    parser.add_argument('--N_pre', type=int, default=1024*2)
+    parser.add_argument('--para_num', type=float, default=0.5)
+    parser.add_argument('--C_HBM_max', type=int, default=3)
+    parser.add_argument('--inclusive', action='store_true')
+    parser.add_argument('--filename', type=str, default="trace.txt")
+    parser.add_argument('--per_layer_trace', action='store_true')
+    parser.add_argument('--init_class', type=str, required=True)
+    parser.add_argument('--mig_class', type=str, required=True)
+    parser.add_argument('--plc_class', type=str, required=True)
+    parser.add_argument('--output', type=str, default="timeline.json")
+    parser.add_argument('--steps_per_event', type=int, default=None,
+                        help='Steps merged into one slice (chosen from --max_slices by default)')
+    parser.add_argument('--max_slices', type=int, default=20000)
+    args = parser.parse_args()
+
+    try:
+        init_class = CLASS_MAPPING[args.init_class]
+        m_cls = CLASS_MAPPING[args.mig_class]
+        p_cls = CLASS_MAPPING[args.plc_class]
+    except KeyError as e:
+        print(f"Error: Unknown class name {e.args[0]}")
+        sys.exit(1)
+
+    config = build_config(vars(args))
+    trace = load_skip_trace(args.filename) if args.per_layer_trace else load_skip_lists(args.filename)
+    initial_state = init_class(copy.deepcopy(config), trace, args.inclusive)
+    simulator = export_timeline(initial_state, trace, p_cls, m_cls, args.output,
+                                args.steps_per_event, args.max_slices)
+    print(f"Combination: {p_cls.__name__} + {m_cls.__name__}")
+    print(f"Total time: {simulator.total_time:.4f} ns, {simulator.total_time/1e9:.4f} seconds")
+    print(f"Wrote {simulator.writer.events} events to {args.output}")
@@ -0,0 +1,217 @@
+# verify.py
+# Golden-result checks for simulator engines. A fast engine replays a trace
+# and strategy combination next to the reference MemorySimulator and must
+# reproduce its total time and per-step alpha within tolerance; the first
+# divergent step (n, l, s) is reported. Recorded simulator.py logs
+# ({N_pre}_{N}_{para}B_{C}GB_{init}_{timestamp}.txt) can be checked the
+# same way against the current reference.
+import copy
+import os
+import re
+from simulator import (CLASS_MAPPING, build_config, load_skip_lists,
+                       simulate_combination, PreferHBM, NoMigration)
+from sharded_simulator import ShardedSimulator
+from shared_prefix import SharedPrefixSimulator
+
+LOG_NAME = re.compile(r"^(\d+)_(\d+)_([\d.]+)B_([\d.]+)GB_([A-Za-z]+)_")
+SEPARATOR = "-" * 50
+
+def run_reference(config, trace, init_class, inclusive, p_cls, m_cls):
+    initial_state = init_class(copy.deepcopy(config), trace, inclusive)
+    return simulate_combination(initial_state, trace, p_cls, m_cls)
+
+def run_profiled(config, trace, init_class, inclusive, p_cls, m_cls):
+    initial_state = init_class(copy.deepcopy(config), trace, inclusive)
+    return simulate_combination(initial_state, trace, p_cls, m_cls, profile=True)
+
+def run_sharded(config, trace, init_class, inclusive, p_cls, m_cls):
+    # A single device (tp = pp = 1) is the reference
+    simulator = ShardedSimulator(copy.deepcopy(config), trace, init_class, p_cls, m_cls, inclusive)
+    simulator.simulate()
+    return simulator
+
+def run_shared_prefix(config, trace, init_class, inclusive, p_cls, m_cls):
+    # One sequence without a shared prefix is the reference
+    simulator = SharedPrefixSimulator(copy.deepcopy(config), [trace], init_class, p_cls, m_cls,
+                                      0, inclusive)
+    simulator.simulate()
+    return simulator
+
+# Engines that must reproduce the reference, new fast paths register here
+ENGINES = {
+    'profiled': run_profiled,
+    'sharded': run_sharded,
+    'shared_prefix': run_shared_prefix,
+}
+
+def first_divergence(ref_steps, steps, rtol: float, atol: float):
+    """First step where the two runs differ, as a dict, or None."""
+    for i, (ref, step) in enumerate(zip(ref_steps, steps)):
+        ref_key = (ref['n'], ref['l'], ref['s'])
+        key = (step['n'], step['l'], step['s'])
+        if key != ref_key:
+            return {'index': i, 'step': ref_key, 'field': 'step', 'expected': ref_key, 'actual': key}
+        if abs(step['alpha'] - ref['alpha']) > atol:
+            return {'index': i, 'step': key, 'field': 'alpha', 'expected': ref['alpha'], 'actual': step['alpha']}
+        if 'time' in ref and abs(step['time'] - ref['time']) > rtol * abs(ref['time']):
+            return {'index': i, 'step': key, 'field': 'time', 'expected': ref['time'], 'actual': step['time']}
+    if len(ref_steps) != len(steps):
+        return {'index': min(len(ref_steps), len(steps)), 'step': None, 'field': 'steps',
+                'expected': len(ref_steps), 'actual': len(steps)}
+    return None
+
+def compare_totals(expected: float, actual: float, rtol: float) -> bool:
+    return abs(actual - expected) <= rtol * abs(expected)
+
+def verify_engine(engine: str, config, trace, init_class, p_cls, m_cls, inclusive: bool = False,
+                  rtol: float = 1e-9, atol: float = 1e-9) -> dict:
+    """Run one combination through the reference and an engine and compare them."""
+    ref = run_reference(config, trace, init_class, inclusive, p_cls, m_cls)
+    fast = ENGINES[engine](config, trace, init_class, inclusive, p_cls, m_cls)
+    return {
+        'engine': engine,
+        'combination': f"{p_cls.__name__} + {m_cls.__name__}",
+        'expected': ref.total_time,
+        'actual': fast.total_time,
+        'total_ok': compare_totals(ref.total_time, fast.total_time, rtol),
+        'divergence': first_divergence(ref.step_details, fast.step_details, rtol, atol),
+    }
+
+def parse_log(log_file: str) -> dict:
+    """Best total, trace file and {combination: (total time, alphas)} of a simulator.py log."""
+    result = {'best': None, 'trace': None, 'combinations': {}}
+    name = None
+    in_alphas = False
+    with open(log_file, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("Read trace file:"):
+                result['trace'] = line.split(":", 1)[1].strip()
+            elif line.startswith("Total simulation time:"):
+                result['best'] = float(line.split(":", 1)[1].split("ns")[0])
+            elif line.startswith("Combination:"):
+                name = line.split(":", 1)[1].strip()
+                result['combinations'][name] = [None, []]
+                in_alphas = False
+            elif name and line.startswith("Total time:"):
+                result['combinations'][name][0] = float(line.split(":", 1)[1].split("ns")[0])
+            elif name and line == "Alphas:":
+                in_alphas = True
+            elif line == SEPARATOR:
+                in_alphas = False
+            elif in_alphas:
+                result['combinations'][name][1].append(float(line))
+    return result
+
+def log_config(log_file: str) -> dict:
+    """Experiment parameters encoded in a log file name."""
+    m = LOG_NAME.match(os.path.basename(log_file))
+    if not m:
+        raise ValueError(f"Log name doesn't match the experiment pattern: {log_file}")
+    N_pre, N, para_num, C_HBM_max, init = m.groups()
+    return {'N_pre': int(N_pre), 'N': int(N), 'para_num': float(para_num),
+            'C_HBM_max': float(C_HBM_max), 'init_class': init}
+
+def verify_log(log_file: str, filename: str = None, combinations: list = None,
+               inclusive: bool = False, rtol: float = 1e-6, atol: float = 1e-4) -> list:
+    """
+    Re-simulate the combinations recorded in a log and compare them with it.
+    Logged alphas are rounded to 4 decimals, hence the looser default atol.
+    """
+    params = log_config(log_file)
+    log = parse_log(log_file)
+    filename = filename or log['trace']
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"Trace file of {log_file} not found: {filename}")
+    config = build_config(params)
+    trace = load_skip_lists(filename)
+    init_class = CLASS_MAPPING[params['init_class']]
+    initial_state = init_class(copy.deepcopy(config), trace, inclusive)
+
+    results = []
+    if log['best'] is not None:
+        best = simulate_combination(initial_state, trace, PreferHBM, NoMigration, best=True)
+        results.append({'combination': 'Best', 'expected': log['best'], 'actual': best.total_time,
+                        'total_ok': compare_totals(log['best'], best.total_time, rtol), 'divergence': None})
+    for name, (total, alphas) in log['combinations'].items():
+        if combinations and name not in combinations:
+            continue
+        p_name, m_name = [part.strip() for part in name.split("+")]
+        simulator = simulate_combination(initial_state, trace, CLASS_MAPPING[p_name], CLASS_MAPPING[m_name])
+        logged_steps = [dict(step, alpha=alpha) for step, alpha in zip(simulator.step_details, alphas)]
+        for step in logged_steps:
+            del step['time']
+        divergence = first_divergence(logged_steps, simulator.step_details, rtol, atol)
+        if divergence is None and len(alphas) != len(simulator.step_details):
+            divergence = {'index': min(len(alphas), len(simulator.step_details)), 'step': None,
+                          'field': 'steps', 'expected': len(alphas), 'actual': len(simulator.step_details)}
+        results.append({'combination': name, 'expected': total, 'actual': simulator.total_time,
+                        'total_ok': compare_totals(total, simulator.total_time, rtol),
+                        'divergence': divergence})
+    return results
+
+def report(result: dict) -> bool:
+    ok = result['total_ok'] and result['divergence'] is None
+    title = result['combination'] + (f" [{result['engine']}]" if 'engine' in result else "")
+    print(f"{'PASS' if ok else 'FAIL'}: {title}")
+    print(f"Total time: expected {result['expected']:.4f} ns, got {result['actual']:.4f} ns")
+    d = result['divergence']
+    if d is not None:
+        print(f"First divergence at step {d['index']} {d['step']}: {d['field']} "
+              f"expected {d['expected']}, got {d['actual']}")
+    print(SEPARATOR)
+    return ok
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--N', type=int, default=1024*10)
+    parser.add_argument('--N_pre', type=int, default=1024*2)
+    parser.add_argument('--para_num', type=float, default=0.5)
+    parser.add_argument('--C_HBM_max', type=int, default=3)
+    parser.add_argument('--inclusive', action='store_true')
+    parser.add_argument('--filename', type=str, default=None,
+                        help='Trace file (for --logs, overrides the one recorded in the log)')
+    parser.add_argument('--init_class', type=str, default='TokenLevelBestRatioInit')
+    parser.add_argument('--mig_classes', type=str, nargs='+', default=['NoMigration'])
+    parser.add_argument('--plc_classes', type=str, nargs='+', default=['PreferHBM'])
+    parser.add_argument('--engines', type=str, nargs='+', choices=list(ENGINES), default=list(ENGINES))
+    parser.add_argument('--logs', type=str, nargs='+', default=None,
+                        help='Check recorded logs instead of engines')
+    parser.add_argument('--combinations', type=str, nargs='+', default=None,
+                        help='With --logs, only these combinations (e.g. "PreferHBM + NoMigration")')
+    parser.add_argument('--rtol', type=float, default=None, help='Relative tolerance of times')
+    parser.add_argument('--atol', type=float, default=None, help='Absolute tolerance of alphas')
+    args = parser.parse_args()
+
+    tolerances = {k: v for k, v in [('rtol', args.rtol), ('atol', args.atol)] if v is not None}
+    results = []
+    if args.logs:
+        for log_file in args.logs:
+            print(f"Log: {log_file}")
+            try:
+                results += verify_log(log_file, args.filename, args.combinations, args.inclusive, **tolerances)
+            except FileNotFoundError as e:
+                print(f"Error: {e}")
+                sys.exit(1)
+    else:
+        try:
+            init_class = CLASS_MAPPING[args.init_class]
+            mig_classes = [CLASS_MAPPING[name] for name in args.mig_classes]
+            plc_classes = [CLASS_MAPPING[name] for name in args.plc_classes]
+        except KeyError as e:
+            print(f"Error: Unknown class name {e.args[0]}")
+            sys.exit(1)
+        config = build_config(vars(args))
+        trace = load_skip_lists(args.filename or "trace.txt")
+        for engine in args.engines:
+            for p_cls in plc_classes:
+                for m_cls in mig_classes:
+                    results.append(verify_engine(engine, config, trace, init_class, p_cls, m_cls,
+                                                 args.inclusive, **tolerances))
+
+    failures = sum(not report(result) for result in results)
+    print(f"{len(results) - failures}/{len(results)} passed")
+    sys.exit(1 if failures else 0)